@@ -27,9 +27,12 @@
 import os
 import sys
 import copy
+import time
 import requests
 import importlib
 import bpy.utils.previews
+from bpy.app.handlers import persistent
+from collections import OrderedDict
 
 file_dir = os.path.dirname(__file__)
 if file_dir not in sys.path:
@@ -42,52 +45,52 @@ if file_dir not in sys.path:
 #     print("mmd_tools deleted!")
 #     import mmd_tools_local
 
+# Time it takes to import each module in ms, including its not yet imported dependencies
+import_times = OrderedDict()
+
+
+def import_module(name, package=None):
+    start = time.time()
+    module = importlib.import_module(name, package)
+    import_times[name.lstrip('.')] = (time.time() - start) * 1000
+    return module
+
+
+tool_modules = [
+    'tools.armature',
+    'tools.armature_bones',
+    'tools.armature_manual',
+    'tools.armature_custom',
+    'tools.atlas',
+    'tools.bonemerge',
+    'tools.common',
+    'tools.copy_protection',
+    'tools.credits',
+    'tools.decimation',
+    'tools.eyetracking',
+    'tools.importer',
+    'tools.material',
+    'tools.rootbone',
+    'tools.settings',
+    'tools.shapekey',
+    'tools.supporter',
+    'tools.translate',
+    'tools.viseme',
+]
+
 if "tools" not in locals():
     print('STARTUP!!')
-    from . import addon_updater_ops
-    import mmd_tools_local
-    import tools.armature
-    import tools.armature_bones
-    import tools.armature_manual
-    import tools.armature_custom
-    import tools.atlas
-    import tools.bonemerge
-    import tools.common
-    import tools.copy_protection
-    import tools.credits
-    import tools.decimation
-    import tools.eyetracking
-    import tools.importer
-    import tools.material
-    import tools.rootbone
-    import tools.settings
-    import tools.shapekey
-    import tools.supporter
-    import tools.translate
-    import tools.viseme
+    addon_updater_ops = import_module('.addon_updater_ops', __package__)
+    mmd_tools_local = import_module('mmd_tools_local')
+    for module_name in tool_modules:
+        import_module(module_name)
+    import tools
 else:
     print('RELOAD!!')
     importlib.reload(mmd_tools_local)
     importlib.reload(addon_updater_ops)
-    importlib.reload(tools.armature)
-    importlib.reload(tools.armature_bones)
-    importlib.reload(tools.armature_manual)
-    importlib.reload(tools.armature_custom)
-    importlib.reload(tools.atlas)
-    importlib.reload(tools.bonemerge)
-    importlib.reload(tools.common)
-    importlib.reload(tools.copy_protection)
-    importlib.reload(tools.credits)
-    importlib.reload(tools.decimation)
-    importlib.reload(tools.eyetracking)
-    importlib.reload(tools.importer)
-    importlib.reload(tools.material)
-    importlib.reload(tools.rootbone)
-    importlib.reload(tools.settings)
-    importlib.reload(tools.shapekey)
-    importlib.reload(tools.supporter)
-    importlib.reload(tools.translate)
-    importlib.reload(tools.viseme)
+    for module_name in tool_modules:
+        importlib.reload(sys.modules[module_name])
 
 
 # How to update mmd_tools:
@@ -215,7 +218,10 @@ supporters = [
 
 current_supporters = None
 
-dict_found = False
+# Subsystems which are not needed to register the plugin are loaded after the UI is ready
+deferred_loaded = False
+updater_registered = False
+deferred_times = OrderedDict()
 
 
 class ToolPanel:
@@ -399,6 +405,14 @@ class ToolPanel:
                     "LittleFinger(1-3)_(L/R)"
     )
 
+    bpy.types.Scene.decimate_shape_keys = bpy.props.BoolProperty(
+        name="Decimate Shape Keys",
+        description="Check this to also decimate the meshes which keep their shape keys.\n"
+                    "Their shape keys will be preserved, but the decimation is slower\n"
+                    "and keeps UV seams, material borders and open edges untouched.",
+        default=False
+    )
+
     bpy.types.Scene.decimate_hands = bpy.props.BoolProperty(
         name="Save Hands",
         description="Check this if you don't want to decimate your full hands!\n"
@@ -758,7 +772,8 @@ class ArmaturePanel(ToolPanel, bpy.types.Panel):
     bl_label = 'Model'
 
     def draw(self, context):
-        addon_updater_ops.check_for_update_background()
+        if updater_registered:
+            addon_updater_ops.check_for_update_background()
 
         layout = self.layout
         box = layout.box()
@@ -801,7 +816,7 @@ class ArmaturePanel(ToolPanel, bpy.types.Panel):
             col.separator()
             col.separator()
 
-        if not dict_found:
+        if (deferred_loaded or tools.translate.dictionary is not None) and not tools.translate.dict_found:
             col.separator()
             row = col.row(align=True)
             row.scale_y = 0.75
@@ -828,10 +843,7 @@ class ArmaturePanel(ToolPanel, bpy.types.Panel):
                     row = col.row(align=True)
                     row.scale_y = 0.75
                     if custom_icon:
-                        try:
-                            row.label(info, icon_value=tools.supporter.preview_collections["supporter_icons"][custom_icon].icon_id)
-                        except KeyError:
-                            row.label(info)
+                        row.label(info, icon_value=tools.supporter.get_supporter_icon(custom_icon))
                     elif icon:
                         try:
                             row.label(info, icon=icon)
@@ -1236,6 +1248,9 @@ class DecimationPanel(ToolPanel, bpy.types.Panel):
         col.separator()
         row = col.row(align=True)
         row.prop(context.scene, 'decimate_fingers')
+        if context.scene.decimation_mode != 'FULL':
+            row = col.row(align=True)
+            row.prop(context.scene, 'decimate_shape_keys')
         row = col.row(align=True)
         row.prop(context.scene, 'max_tris')
         col.separator()
@@ -1659,6 +1674,9 @@ class UpdaterPanel(ToolPanel, bpy.types.Panel):
 
         # Updater
         # addon_updater_ops.check_for_update_background()
+        if not updater_registered:
+            self.layout.label('Loading updater...', icon='INFO')
+            return
         addon_updater_ops.update_settings_ui(self, context)
 
 
@@ -1710,7 +1728,6 @@ class SupporterPanel(ToolPanel, bpy.types.Panel):
 
     def draw_supporter_list(self, col, show_tier=0):
         supporter_data = tools.supporter.supporter_data.get('supporters')
-        preview_collections = tools.supporter.preview_collections.get("supporter_icons")
 
         i = 0
         j = 0
@@ -1741,7 +1758,7 @@ class SupporterPanel(ToolPanel, bpy.types.Panel):
                 if tier == show_tier:
                     row.operator(idname,
                                  emboss=website,
-                                 icon_value=preview_collections[name].icon_id)
+                                 icon_value=tools.supporter.get_supporter_icon(name, supporter.get('iconname')))
                     i += 1
                 j += 1
             except IndexError:
@@ -1832,6 +1849,9 @@ class UpdaterPreferences(bpy.types.AddonPreferences):
     )
 
     def draw(self, context):
+        if not updater_registered:
+            self.layout.label('Loading updater...', icon='INFO')
+            return
         addon_updater_ops.update_settings_ui(self, context)
 
 
@@ -1950,12 +1970,55 @@ classesToRegister = [
 ]
 
 
+def load_deferred():
+    # Loads the supporters and the updater. Translations and settings are loaded by their modules on first use,
+    # only the dictionary file gets checked here for the warning in the panel
+    global deferred_loaded, updater_registered
+    if deferred_loaded:
+        return
+    deferred_loaded = True
+
+    start = time.time()
+    try:
+        addon_updater_ops.register(bl_info)
+        updater_registered = True
+    except ValueError:
+        print('Error while registering updater.')
+        pass
+    deferred_times['updater'] = (time.time() - start) * 1000
+
+    start = time.time()
+    tools.supporter.load_supporters()
+    tools.supporter.register_dynamic_buttons()
+    deferred_times['tools.supporter'] = (time.time() - start) * 1000
+
+    start = time.time()
+    tools.translate.check_dictionary_file()
+    deferred_times['tools.translate'] = (time.time() - start) * 1000
+
+    print_startup_report()
+
+
+@persistent
+def load_deferred_handler(scene):
+    bpy.app.handlers.scene_update_post.remove(load_deferred_handler)
+    load_deferred()
+
+
+def print_startup_report():
+    print('### CATS import times:')
+    for name, ms in sorted(import_times.items(), key=lambda x: x[1], reverse=True):
+        print('    ' + name.ljust(24) + str(round(ms, 1)).rjust(8) + ' ms')
+
+    if deferred_times:
+        print('### CATS deferred loading times:')
+        for name, ms in deferred_times.items():
+            print('    ' + name.ljust(24) + str(round(ms, 1)).rjust(8) + ' ms')
+
+
 def register():
     print("\n### Loading CATS...")
-    global dict_found
-
-    # Load settings
-    tools.settings.load_settings()
+    global deferred_loaded
 
     # if not tools.settings.use_custom_mmd_tools():
     #     bpy.utils.unregister_module("mmd_tools")
@@ -1964,12 +2027,6 @@ def register():
     except AttributeError:
         pass
 
-    try:
-        addon_updater_ops.register(bl_info)
-    except ValueError:
-        print('Error while registering updater.')
-        pass
-
     for value in classesToRegister:
         bpy.utils.register_class(value)
 
@@ -1980,10 +2037,12 @@ def register():
         version[2] += 1
 
     tools.supporter.load_other_icons()
-    tools.supporter.load_supporters()
-    tools.supporter.register_dynamic_buttons()
 
-    dict_found = tools.translate.load_translations()
+    # The supporters and the updater are only needed by the UI, so they are loaded after it is ready.
+    # In background mode (e.g. on render nodes) they never get loaded
+    deferred_loaded = False
+    if not bpy.app.background and load_deferred_handler not in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.append(load_deferred_handler)
 
     bpy.context.user_preferences.system.use_international_fonts = True
     bpy.context.user_preferences.filepaths.use_file_compression = True
@@ -1995,20 +2054,32 @@ def register():
 
     # tools.settings.start_apply_settings_timer()
 
+    if bpy.app.background:
+        print_startup_report()
+
     print("### Loaded CATS successfully!")
 
 
 def unregister():
     print("### Unloading CATS...")
+    global updater_registered
     try:
         mmd_tools_local.unregister()
     except AttributeError:
         pass
 
+    if load_deferred_handler in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.remove(load_deferred_handler)
+    if tools.supporter.process_main_thread_queue in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.remove(tools.supporter.process_main_thread_queue)
+    tools.common.remove_enum_handlers()
+
     for value in reversed(classesToRegister):
         bpy.utils.unregister_class(value)
     tools.supporter.unregister_dynamic_buttons()
-    addon_updater_ops.unregister()
+    if updater_registered:
+        addon_updater_ops.unregister()
+        updater_registered = False
 
     tools.supporter.unload_icons()
 
@@ -27,6 +27,7 @@
 # for bone root parenting
 root_bones = {}
 root_bones_choices = {}
+root_bones_signature = None
 
 # Keeps track of operations done for unit testing
 testing = []
@@ -93,6 +93,8 @@ def register():
     bpy.app.handlers.load_post.append(load_handler)
 
 def unregister():
+    from mmd_tools_local.core.material import remove_texture_registry_handlers
+    remove_texture_registry_handlers()
     bpy.app.handlers.load_post.remove(load_handler)
     properties.unregister()
     bpy.types.INFO_MT_file_import.remove(menu_func_import)
@@ -2,6 +2,57 @@
 
 import bpy
 import math
+import numpy as np
+
+from mathutils import Matrix
+
+_SENSOR_FITS = ('AUTO', 'HORIZONTAL', 'VERTICAL')
+
+def _animation_sources(*objs):
+    """ Returns the animated ID blocks which can move or change the given objects,
+    or None if their motion can't be told without evaluating the scene.
+    """
+    sources = []
+    for obj in objs:
+        ids = [obj.data] if obj.type == 'CAMERA' else []
+        while obj:
+            if obj.constraints or (obj.pose and any(b.constraints for b in obj.pose.bones)):
+                return None
+            ids.append(obj)
+            obj = obj.parent
+        for id_data in ids:
+            anim = getattr(id_data, 'animation_data', None)
+            if anim is None:
+                continue
+            if anim.drivers or anim.nla_tracks:
+                return None
+            if anim.action and anim.action not in sources:
+                sources.append(anim.action)
+    return sources
+
+def _changing_frames(actions, frames):
+    """ Returns a mask of the frames which need to be keyed, a frame can be skipped
+    if the source values are the same as on both neighboring frames.
+    """
+    keep = np.ones(len(frames), dtype=bool)
+    if actions is None or len(frames) < 3:
+        return keep
+    fcurves = [c for a in actions for c in a.fcurves]
+    values = np.array([[c.evaluate(f) for c in fcurves] for f in frames.tolist()]).reshape(len(frames), -1)
+    same = np.all(values[1:] == values[:-1], axis=1)
+    keep[1:-1] = ~(same[:-1] & same[1:])
+    return keep
+
+def _set_keyframes(fcurve, frames, values, interpolation):
+    kps = fcurve.keyframe_points
+    kps.add(len(frames))
+    co = np.empty((len(frames), 2), dtype=np.float32)
+    co[:, 0], co[:, 1] = frames, values
+    kps.foreach_set('co', co.ravel())
+    for kp in kps:
+        kp.interpolation = interpolation
+    fcurve.update()
+
 
 class MMDCamera:
     def __init__(self, obj):
@@ -105,71 +156,73 @@ class MMDCamera:
         if cameraTarget is None:
             _target_override_func = lambda camObj: camObj.data.dof_object or camObj
 
+        if cameraObj is None and not any(m.camera for m in scene.timeline_markers):
+            # without camera markers the scene camera doesn't switch during playback
+            cameraObj, _camera_override_func = scene.camera, None
+        if cameraTarget is None and _camera_override_func is None:
+            cameraTarget, _target_override_func = _target_override_func(cameraObj), None
+
         action_name = mmd_cam_root.name
         parent_action = bpy.data.actions.new(name=action_name)
         distance_action = bpy.data.actions.new(name=action_name+'_dis')
         MMDCamera.removeDrivers(mmd_cam)
 
-        from math import atan
-        from mathutils import Matrix, Vector
-
         render = scene.render
         factor = (render.resolution_y*render.pixel_aspect_y)/(render.resolution_x*render.pixel_aspect_x)
+        rotation_mode = mmd_cam_root.rotation_mode
         matrix_rotation = Matrix(([1,0,0,0], [0,0,1,0], [0,-1,0,0], [0,0,0,1]))
-        neg_z_vector = Vector((0,0,-1))
         frame_start, frame_end, frame_current = scene.frame_start, scene.frame_end+1, scene.frame_current
-        frame_count = frame_end - frame_start
-        frames = range(frame_start, frame_end)
+        frames = np.arange(frame_start, frame_end)
 
-        fcurves = []
-        for i in range(3):
-            fcurves.append(parent_action.fcurves.new(data_path='location', index=i)) # x, y, z
-        for i in range(3):
-            fcurves.append(parent_action.fcurves.new(data_path='rotation_euler', index=i)) # rx, ry, rz
-        fcurves.append(parent_action.fcurves.new(data_path='mmd_camera.angle')) # fov
-        fcurves.append(parent_action.fcurves.new(data_path='mmd_camera.is_perspective')) # persp
-        fcurves.append(distance_action.fcurves.new(data_path='location', index=1)) # dis
-        for c in fcurves:
-            c.keyframe_points.add(frame_count)
-
-        for f, x, y, z, rx, ry, rz, fov, persp, dis in zip(frames, *(c.keyframe_points for c in fcurves)):
+        # only evaluate the scene on frames where the source camera actually changes
+        if _camera_override_func is None:
+            frames = frames[_changing_frames(_animation_sources(cameraObj, cameraTarget), frames)]
+
+        matrices, target_locs, rotations, cam_data = [], [], [], []
+        for f in frames.tolist():
             scene.frame_set(f)
             if _camera_override_func:
                 cameraObj = _camera_override_func()
             if _target_override_func:
                 cameraTarget = _target_override_func(cameraObj)
             cam_matrix_world = cameraObj.matrix_world
-            cam_target_loc = cameraTarget.matrix_world.translation
-            cam_rotation = (cam_matrix_world * matrix_rotation).to_euler(mmd_cam_root.rotation_mode)
-            cam_vec = cam_matrix_world.to_3x3() * neg_z_vector
-            if cameraObj.data.type == 'ORTHO':
-                cam_dis = -(9/5) * cameraObj.data.ortho_scale
-                if cameraObj.data.sensor_fit != 'VERTICAL':
-                    if cameraObj.data.sensor_fit == 'HORIZONTAL':
-                        cam_dis *= factor
-                    else:
-                        cam_dis *= min(1, factor)
-            else:
-                target_vec = cam_target_loc - cam_matrix_world.translation
-                cam_dis = -max(target_vec.length * cam_vec.dot(target_vec.normalized()), min_distance)
-            cam_target_loc = cam_matrix_world.translation - cam_vec*cam_dis
-
-            tan_val = cameraObj.data.sensor_height/cameraObj.data.lens/2
-            if cameraObj.data.sensor_fit != 'VERTICAL':
-                ratio = cameraObj.data.sensor_width/cameraObj.data.sensor_height
-                if cameraObj.data.sensor_fit == 'HORIZONTAL':
-                    tan_val *= factor*ratio
-                else: # cameraObj.data.sensor_fit == 'AUTO'
-                    tan_val *= min(ratio, factor*ratio)
-
-            x.co, y.co, z.co = ((f, i) for i in cam_target_loc)
-            rx.co, ry.co, rz.co = ((f, i) for i in cam_rotation)
-            dis.co = (f, cam_dis)
-            fov.co = (f, 2*atan(tan_val))
-            persp.co = (f, cameraObj.data.type != 'ORTHO')
-            persp.interpolation = 'CONSTANT'
-            for kp in (x, y, z, rx, ry, rz, fov, dis):
-                kp.interpolation = 'LINEAR'
+            matrices.append(cam_matrix_world.to_3x4())
+            target_locs.append(cameraTarget.matrix_world.translation.copy())
+            rotations.append((cam_matrix_world * matrix_rotation).to_euler(rotation_mode))
+            data = cameraObj.data
+            cam_data.append((data.type == 'ORTHO', data.ortho_scale, _SENSOR_FITS.index(data.sensor_fit),
+                             data.sensor_width, data.sensor_height, data.lens))
+
+        matrices = np.array(matrices, dtype=float).reshape(-1, 3, 4)
+        target_locs = np.array(target_locs, dtype=float).reshape(-1, 3)
+        is_ortho, ortho_scale, sensor_fit, sensor_width, sensor_height, lens = np.array(cam_data, dtype=float).reshape(-1, 6).T
+        is_ortho, sensor_fit = is_ortho.astype(bool), sensor_fit.astype(int)
+
+        cam_locs = matrices[:, :, 3]
+        cam_vecs = -matrices[:, :, 2] # to_3x3() * Vector((0,0,-1))
+        ortho_dis = -(9/5) * ortho_scale * np.choose(sensor_fit, (min(1, factor), factor, 1))
+        persp_dis = -np.maximum(np.einsum('ij,ij->i', cam_vecs, target_locs - cam_locs), min_distance)
+        cam_dis = np.where(is_ortho, ortho_dis, persp_dis)
+        cam_target_locs = cam_locs - cam_vecs*cam_dis[:, None]
+
+        ratio = sensor_width/sensor_height
+        tan_val = sensor_height/lens/2 * np.choose(sensor_fit, (np.minimum(ratio, factor*ratio), factor*ratio, 1))
+        fov = 2*np.arctan(tan_val)
+
+        keys = [
+            (parent_action, 'location', 0, cam_target_locs[:, 0]), # x
+            (parent_action, 'location', 1, cam_target_locs[:, 1]), # y
+            (parent_action, 'location', 2, cam_target_locs[:, 2]), # z
+            ]
+        rotations = np.array(rotations, dtype=float).reshape(-1, 3)
+        for i in range(3):
+            keys.append((parent_action, 'rotation_euler', i, rotations[:, i])) # rx, ry, rz
+        keys.append((parent_action, 'mmd_camera.angle', 0, fov)) # fov
+        keys.append((distance_action, 'location', 1, cam_dis)) # dis
+        for action, data_path, index, values in keys:
+            _set_keyframes(action.fcurves.new(data_path=data_path, index=index), frames, values, 'LINEAR')
+        persp = parent_action.fcurves.new(data_path='mmd_camera.is_perspective')
+        _set_keyframes(persp, frames, ~is_ortho, 'CONSTANT')
 
         MMDCamera.addDrivers(mmd_cam)
         mmd_cam_root.animation_data_create().action = parent_action
@@ -4,6 +4,7 @@ import logging
 import os
 
 import bpy
+from bpy.app.handlers import persistent
 from mmd_tools_local.bpyutils import addon_preferences, select_object
 from mmd_tools_local.core.exceptions import MaterialNotFoundError
 
@@ -12,6 +13,102 @@ SPHERE_MODE_MULT   = 1
 SPHERE_MODE_ADD    = 2
 SPHERE_MODE_SUBTEX = 3
 
+
+class TextureRegistry(object):
+    """ Session-scoped index of the image and texture datablocks by their files.
+
+    Files are identified by their device and inode, which are looked up once per
+    unique normalized path. Only the names of the datablocks are kept, they are
+    looked up again and checked on every use. The index is rebuilt when a file is
+    not found in it and cleared after loading a file, undo and redo.
+    """
+    def __init__(self):
+        self.__file_keys = {}
+        self.__index = {}
+
+    def clear(self):
+        self.__file_keys = {}
+        self.__index = {}
+
+    def fileKey(self, filepath):
+        """ Returns the identity of the file, or its normalized path if it can't be accessed. """
+        path = os.path.normcase(os.path.normpath(os.path.abspath(filepath)))
+        key = self.__file_keys.get(path)
+        if key is None:
+            key = path
+            try:
+                stat = os.stat(path)
+                if stat.st_ino:
+                    key = (stat.st_dev, stat.st_ino)
+            except OSError:
+                pass
+            self.__file_keys[path] = key
+        return key
+
+    def __datablockKey(self, datablock):
+        if isinstance(datablock, bpy.types.Texture):
+            if datablock.type != 'IMAGE' or not datablock.use_alpha:
+                return None
+            datablock = datablock.image
+        if datablock and datablock.source == 'FILE' and datablock.use_alpha:
+            return self.fileKey(bpy.path.abspath(datablock.filepath))
+        return None
+
+    def __add(self, datablock):
+        key = self.__datablockKey(datablock)
+        if key is not None:
+            self.__index.setdefault((isinstance(datablock, bpy.types.Texture), key), datablock.name)
+
+    def __rebuild(self):
+        self.__index = {}
+        for image in bpy.data.images:
+            self.__add(image)
+        for texture in bpy.data.textures:
+            self.__add(texture)
+
+        if reset_texture_registry not in bpy.app.handlers.load_post:
+            bpy.app.handlers.load_post.append(reset_texture_registry)
+            bpy.app.handlers.undo_post.append(reset_texture_registry)
+            bpy.app.handlers.redo_post.append(reset_texture_registry)
+
+    def __find(self, is_texture, filepath):
+        key = self.fileKey(filepath)
+        datablocks = bpy.data.textures if is_texture else bpy.data.images
+        for rebuild in (False, True):
+            if rebuild:
+                self.__rebuild()
+            name = self.__index.get((is_texture, key))
+            datablock = datablocks.get(name) if name is not None else None
+            if datablock is not None and self.__datablockKey(datablock) == key:
+                return datablock
+        return None
+
+    def findImage(self, filepath):
+        return self.__find(False, filepath)
+
+    def findTexture(self, filepath):
+        return self.__find(True, filepath)
+
+    def register(self, datablock):
+        """ Adds a newly created image or texture without rebuilding the index. """
+        self.__add(datablock)
+
+
+texture_registry = TextureRegistry()
+
+
+@persistent
+def reset_texture_registry(scene):
+    texture_registry.clear()
+
+
+def remove_texture_registry_handlers():
+    for handlers in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if reset_texture_registry in handlers:
+            handlers.remove(reset_texture_registry)
+    texture_registry.clear()
+
+
 class FnMaterial(object):
     __BASE_TEX_SLOT = 0
     __TOON_TEX_SLOT = 1
@@ -88,38 +185,29 @@ class FnMaterial(object):
         return self.__material
 
 
-    def __same_image_file(self, image, filepath):
-        if image and image.source == 'FILE' and image.use_alpha:
-            img_filepath = bpy.path.abspath(image.filepath) # image.filepath_from_user()
-            if img_filepath == filepath:
-                return True
-            try:
-                return os.path.samefile(img_filepath, filepath)
-            except:
-                pass
-        return False
-
     def __load_image(self, filepath):
-        for i in bpy.data.images:
-            if self.__same_image_file(i, filepath):
-                return i
+        img = texture_registry.findImage(filepath)
+        if img:
+            return img
 
         try:
-            return bpy.data.images.load(filepath)
+            img = bpy.data.images.load(filepath)
         except:
             logging.warning('Cannot create a texture for %s. No such file.', filepath)
-
-        img = bpy.data.images.new(os.path.basename(filepath), 1, 1)
-        img.source = 'FILE'
-        img.filepath = filepath
+            img = bpy.data.images.new(os.path.basename(filepath), 1, 1)
+            img.source = 'FILE'
+            img.filepath = filepath
+        texture_registry.register(img)
         return img
 
     def __load_texture(self, filepath):
-        for t in bpy.data.textures:
-            if t.type == 'IMAGE' and self.__same_image_file(t.image, filepath) and t.use_alpha:
-                return t
+        tex = texture_registry.findTexture(filepath)
+        if tex:
+            return tex
+        img = self.__load_image(filepath)
         tex = bpy.data.textures.new(name=bpy.path.display_name_from_filepath(filepath), type='IMAGE')
-        tex.image = self.__load_image(filepath)
+        tex.image = img
+        texture_registry.register(tex)
         return tex
 
     def __has_alpha_channel(self, texture):
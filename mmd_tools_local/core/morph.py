@@ -2,6 +2,7 @@
 import re
 
 import bpy
+import numpy as np
 from mmd_tools_local import bpyutils
 from mmd_tools_local.bpyutils import ObjectOp
 from mmd_tools_local.bpyutils import TransformConstraintOp
@@ -127,15 +128,25 @@ class FnMorph(object):
             bpy.ops.object.vertex_group_copy(override)
             obj.vertex_groups.active.name = vg_name.replace(src_name, dest_name)
 
+    @staticmethod
+    def get_uv_morph_vertex_weights(obj, group_indices):
+        # read the positive weights of the given vertex groups into flat arrays at once
+        # return (vertex_indices, group_indices, weights)
+        group_indices = set(group_indices)
+        if not group_indices:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+        entries = [(i, x.group, x.weight) for i, v in enumerate(obj.data.vertices) for x in v.groups
+                   if x.group in group_indices and x.weight > 0]
+        entries = np.array(entries, dtype=float).reshape(-1, 3)
+        return entries[:, 0].astype(int), entries[:, 1].astype(int), entries[:, 2]
+
     @staticmethod
     def clean_uv_morph_vertex_groups(obj):
         # remove empty vertex groups of uv morphs
         vg_indices = {g.index for g, n, x in FnMorph.get_uv_morph_vertex_groups(obj)}
+        vertex_indices, group_indices, weights = FnMorph.get_uv_morph_vertex_weights(obj, vg_indices)
+        vg_indices.difference_update(np.unique(group_indices).tolist())
         vertex_groups = obj.vertex_groups
-        for v in obj.data.vertices:
-            for x in v.groups:
-                if x.group in vg_indices and x.weight > 0:
-                    vg_indices.remove(x.group)
         for i in sorted(vg_indices, reverse=True):
             vg = vertex_groups[i]
             m = obj.modifiers.get('mmd_bind%s'%hash(vg.name), None)
@@ -144,52 +155,81 @@ class FnMorph(object):
             vertex_groups.remove(vg)
 
     @staticmethod
-    def get_uv_morph_offset_map(obj, morph):
-        offset_map = {} # offset_map[vertex_index] = offset_xyzw
+    def get_uv_morph_offsets(obj, morph):
+        # return (offsets, used), offsets[vertex_index] = offset_xyzw,
+        # used[vertex_index] is True for the vertices which are part of the morph
+        vertex_count = len(obj.data.vertices)
+        offsets = np.zeros((vertex_count, 4))
+        used = np.zeros(vertex_count, dtype=bool)
         if morph.data_type == 'VERTEX_GROUP':
-            scale = morph.vertex_group_scale
             axis_map = {g.index:x for g, n, x in FnMorph.get_uv_morph_vertex_groups(obj, morph.name)}
-            for v in obj.data.vertices:
-                i = v.index
-                for x in v.groups:
-                    if x.group in axis_map and x.weight > 0:
-                        axis, weight = axis_map[x.group], x.weight
-                        d = offset_map.setdefault(i, [0, 0, 0, 0])
-                        d['XYZW'.index(axis[1])] += -weight*scale if axis[0] == '-' else weight*scale
-        else:
-            for val in morph.data:
-                i = val.index
-                if i in offset_map:
-                    offset_map[i] = [a+b for a, b in zip(offset_map[i], val.offset)]
-                else:
-                    offset_map[i] = val.offset
-        return offset_map
+            vertex_indices, group_indices, weights = FnMorph.get_uv_morph_vertex_weights(obj, axis_map.keys())
+            if len(weights) > 0:
+                group_count = max(axis_map.keys()) + 1
+                axis_lut = np.zeros(group_count, dtype=int)
+                sign_lut = np.zeros(group_count)
+                for i, axis in axis_map.items():
+                    axis_lut[i] = 'XYZW'.index(axis[1])
+                    sign_lut[i] = -1 if axis[0] == '-' else 1
+                np.add.at(offsets, (vertex_indices, axis_lut[group_indices]), sign_lut[group_indices]*weights*morph.vertex_group_scale)
+                used[vertex_indices] = True
+        elif len(morph.data) > 0:
+            vertex_indices = np.empty(len(morph.data), dtype=int)
+            data_offsets = np.empty(len(morph.data)*4)
+            morph.data.foreach_get('index', vertex_indices)
+            morph.data.foreach_get('offset', data_offsets)
+            np.add.at(offsets, vertex_indices, data_offsets.reshape(-1, 4))
+            used[vertex_indices] = True
+        return offsets, used
+
+    @staticmethod
+    def get_uv_morph_offset_map(obj, morph):
+        offsets, used = FnMorph.get_uv_morph_offsets(obj, morph)
+        indices = np.flatnonzero(used)
+        return dict(zip(indices.tolist(), offsets[indices].tolist())) # offset_map[vertex_index] = offset_xyzw
 
     @staticmethod
     def store_uv_morph_data(obj, morph, offsets=None, offset_axes='XYZW'):
+        offsets = tuple(offsets or ())
+        indices = np.array([data.index for data in offsets], dtype=int)
+        offsets = np.array([data.offset for data in offsets], dtype=float).reshape(-1, 4)
+        FnMorph.store_uv_morph_offsets(obj, morph, indices, offsets, offset_axes)
+
+    @staticmethod
+    def store_uv_morph_offsets(obj, morph, indices, offsets, offset_axes='XYZW'):
         vertex_groups = obj.vertex_groups
         morph_name = getattr(morph, 'name', None)
         if offset_axes:
             for vg, n, x in FnMorph.get_uv_morph_vertex_groups(obj, morph_name, offset_axes):
                 vertex_groups.remove(vg)
-        if not morph_name or not offsets:
+        if not morph_name or len(indices) < 1:
             return
 
         axis_indices = tuple('XYZW'.index(x) for x in offset_axes) or tuple(range(4))
-        offset_map = FnMorph.get_uv_morph_offset_map(obj, morph) if offset_axes else {}
-        for data in offsets:
-            idx, offset = data.index, data.offset
-            for i in axis_indices:
-                offset_map.setdefault(idx, [0, 0, 0, 0])[i] += round(offset[i], 5)
+        if offset_axes:
+            offset_table = FnMorph.get_uv_morph_offsets(obj, morph)[0]
+        else:
+            offset_table = np.zeros((len(obj.data.vertices), 4))
+        for i in axis_indices:
+            np.add.at(offset_table[:, i], indices, np.round(offsets[:, i], 5))
 
-        max_value = max(max(abs(x) for x in v) for v in offset_map.values() or ([0],))
+        max_value = float(np.abs(offset_table).max()) if len(offset_table) > 0 else 0
         scale = morph.vertex_group_scale = max(abs(morph.vertex_group_scale), max_value)
-        for idx, offset in offset_map.items():
-            for val, axis in zip(offset, 'XYZW'):
-                if abs(val) > 1e-4:
-                    vg_name = 'UV_{0}{1}{2}'.format(morph_name, '-' if val < 0 else '+', axis)
-                    vg = vertex_groups.get(vg_name, None) or vertex_groups.new(name=vg_name)
-                    vg.add(index=[idx], weight=abs(val)/scale, type='REPLACE')
+        for i, axis in enumerate('XYZW'):
+            values = offset_table[:, i]
+            for sign, selected in (('-', values < -1e-4), ('+', values > 1e-4)):
+                vertex_indices = np.flatnonzero(selected)
+                if len(vertex_indices) < 1:
+                    continue
+                vg_name = 'UV_{0}{1}{2}'.format(morph_name, sign, axis)
+                vg = vertex_groups.get(vg_name, None) or vertex_groups.new(name=vg_name)
+                # add the vertices with the same weight at once
+                weights = np.abs(values[vertex_indices])/scale
+                order = np.argsort(weights, kind='mergesort')
+                weights, vertex_indices = weights[order], vertex_indices[order]
+                unique_weights, starts = np.unique(weights, return_index=True)
+                for weight, idx in zip(unique_weights.tolist(), np.split(vertex_indices, starts[1:])):
+                    vg.add(index=idx.tolist(), weight=weight, type='REPLACE')
 
     def update_mat_related_mesh(self, new_mesh=None):
         for offset in self.__morph.data:
@@ -5,6 +5,8 @@ import re
 import logging
 import collections
 
+import numpy as np
+
 class InvalidFileError(Exception):
     pass
 class UnsupportedVersionError(Exception):
@@ -90,6 +92,14 @@ class  FileReadStream(FileStream):
         v, = struct.unpack('<b', self.__fin.read(1))
         return v
 
+    def readArray(self, dtype, count):
+        dtype = np.dtype(dtype)
+        size = dtype.itemsize * count
+        buf = self.__fin.read(size)
+        if len(buf) != size:
+            raise struct.error('unpack requires a buffer of %d bytes'%size)
+        return np.frombuffer(buf, dtype=dtype)
+
 
 class Header:
     PMD_SIGN = b'Pmd'
@@ -112,23 +122,15 @@ class Header:
         self.model_name = fs.readStr(20)
         self.comment = fs.readStr(256)
 
-class Vertex:
-    def __init__(self):
-        self.position = [0.0, 0.0, 0.0]
-        self.normal = [1.0, 0.0, 0.0]
-        self.uv = [0.0, 0.0]
-        self.bones = [-1, -1]
-        self.weight = 0 # min:0, max:100
-        self.enable_edge = 0 # 0: on, 1: off
-
-    def load(self, fs):
-        self.position = fs.readVector(3)
-        self.normal = fs.readVector(3)
-        self.uv = fs.readVector(2)
-        self.bones[0] = fs.readUnsignedShort()
-        self.bones[1] = fs.readUnsignedShort()
-        self.weight = fs.readByte()
-        self.enable_edge = fs.readByte()
+# the vertex table is read at once as an array of these records
+VERTEX_DTYPE = np.dtype([
+    ('position', '<f4', (3,)),
+    ('normal', '<f4', (3,)),
+    ('uv', '<f4', (2,)),
+    ('bones', '<u2', (2,)),
+    ('weight', 'u1'), # min:0, max:100
+    ('enable_edge', 'u1'), # 0: on, 1: off
+    ])
 
 class Material:
     def __init__(self):
@@ -214,30 +216,23 @@ class IK:
         for i in range(self.ik_chain):
             self.ik_child_bones.append(fs.readUnsignedShort())
 
-class MorphData:
-    def __init__(self):
-        self.index = 0
-        self.offset = []
-
-    def load(self, fs):
-        self.index = fs.readUnsignedInt()
-        self.offset = fs.readVector(3)
+MORPH_DATA_DTYPE = np.dtype([
+    ('index', '<u4'),
+    ('offset', '<f4', (3,)),
+    ])
 
 class VertexMorph:
     def __init__(self):
         self.name = ''
         self.name_e = ''
         self.type = 0
-        self.data = []
+        self.data = np.zeros(0, dtype=MORPH_DATA_DTYPE)
 
     def load(self, fs):
         self.name = fs.readStr(20)
         data_size = fs.readUnsignedInt()
         self.type = fs.readByte()
-        for i in range(data_size):
-            t = MorphData()
-            t.load(fs)
-            self.data.append(t)
+        self.data = fs.readArray(MORPH_DATA_DTYPE, data_size)
 
 class RigidBody:
     def __init__(self):
@@ -344,12 +339,8 @@ class Model:
         logging.info('------------------------------')
         logging.info('Load Vertices')
         logging.info('------------------------------')
-        self.vertices = []
         vert_count = fs.readUnsignedInt()
-        for i in range(vert_count):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
+        self.vertices = fs.readArray(VERTEX_DTYPE, vert_count)
         logging.info('the number of vetices: %d', len(self.vertices))
         logging.info('finished importing vertices.')
 
@@ -357,13 +348,9 @@ class Model:
         logging.info('------------------------------')
         logging.info(' Load Faces')
         logging.info('------------------------------')
-        self.faces = []
         face_vert_count = fs.readUnsignedInt()
-        for i in range(int(face_vert_count/3)):
-            f1 = fs.readUnsignedShort()
-            f2 = fs.readUnsignedShort()
-            f3 = fs.readUnsignedShort()
-            self.faces.append((f3, f2, f1))
+        face_count = int(face_vert_count/3)
+        self.faces = fs.readArray('<u2', face_count*3).reshape(face_count, 3)[:, ::-1]
         logging.info('the number of faces: %d', len(self.faces))
         logging.info('finished importing faces.')
 
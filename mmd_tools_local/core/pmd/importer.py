@@ -11,6 +11,7 @@ import mathutils
 import mmd_tools_local.core.pmx.importer as import_pmx
 import mmd_tools_local.core.pmd as pmd
 import mmd_tools_local.core.pmx as pmx
+from mmd_tools_local.core.material import texture_registry
 
 from math import radians
 
@@ -50,23 +51,33 @@ def import_pmd_to_pmx(filepath):
     logging.info('------------------------------')
     logging.info(' Convert Vertices')
     logging.info('------------------------------')
-    for v in pmd_model.vertices:
+    vertices = pmd_model.vertices
+    vertex_bones = vertices['bones']
+    is_bdef2 = vertex_bones[:, 0] != vertex_bones[:, 1]
+    vertex_weights = vertices['weight'] / 100.0
+    edge_scales = (vertices['enable_edge'] == 0).astype(int)
+    for co, normal, uv, bones, w, edge_scale, bdef2 in zip(vertices['position'].tolist(),
+                                                           vertices['normal'].tolist(),
+                                                           vertices['uv'].tolist(),
+                                                           vertex_bones.tolist(),
+                                                           vertex_weights.tolist(),
+                                                           edge_scales.tolist(),
+                                                           is_bdef2.tolist()):
         pmx_v = pmx.Vertex()
-        pmx_v.co = v.position
-        pmx_v.normal = v.normal
-        pmx_v.uv = v.uv
+        pmx_v.co = co
+        pmx_v.normal = normal
+        pmx_v.uv = uv
         pmx_v.additional_uvs= []
-        pmx_v.edge_scale = 1 if v.enable_edge == 0 else 0
+        pmx_v.edge_scale = edge_scale
 
         weight = pmx.BoneWeight()
-        if v.bones[0] != v.bones[1]:
+        if bdef2:
             weight.type = pmx.BoneWeight.BDEF2
-            weight.bones = v.bones
-            weight.weights = [float(v.weight)/100.0]
+            weight.bones = bones
         else:
             weight.type = pmx.BoneWeight.BDEF1
-            weight.bones = [v.bones[0]]
-            weight.weights = [float(v.weight)/100.0]
+            weight.bones = bones[:1]
+        weight.weights = [w]
 
         pmx_v.weight = weight
 
@@ -77,8 +88,7 @@ def import_pmd_to_pmx(filepath):
     logging.info('------------------------------')
     logging.info(' Convert Faces')
     logging.info('------------------------------')
-    for f in pmd_model.faces:
-        pmx_model.faces.append(f)
+    pmx_model.faces.extend(map(tuple, pmd_model.faces.tolist()))
     logging.info('----- Converted %d faces', len(pmx_model.faces))
 
     knee_bones = []
@@ -180,8 +190,11 @@ def import_pmd_to_pmx(filepath):
         applied_ik_bones.append(ik.bone)
     logging.info('----- Converted %d bones', len(pmd_model.iks))
 
+    # Textures are shared by their files, so differently written paths to the same file create one texture
     texture_map = {}
     toon_texture_map = {}
+    def texture_key(tex_path):
+        return texture_registry.fileKey(os.path.join(os.path.dirname(target_path), tex_path))
     logging.info('')
     logging.info('------------------------------')
     logging.info(' Convert Materials')
@@ -202,22 +215,24 @@ def import_pmd_to_pmx(filepath):
         pmx_mat.vertex_count = mat.vertex_count
         if len(mat.texture_path) > 0:
             tex_path = mat.texture_path
-            if tex_path not in texture_map:
+            tex_key = texture_key(tex_path)
+            if tex_key not in texture_map:
                 logging.info('  Create pmx.Texture -------- %s', tex_path)
                 tex = pmx.Texture()
                 tex.path = os.path.normpath(os.path.join(os.path.dirname(target_path), tex_path))
                 pmx_model.textures.append(tex)
-                texture_map[tex_path] = len(pmx_model.textures) - 1
-            pmx_mat.texture = texture_map[tex_path]
+                texture_map[tex_key] = len(pmx_model.textures) - 1
+            pmx_mat.texture = texture_map[tex_key]
         if len(mat.sphere_path) > 0:
             tex_path = mat.sphere_path
-            if tex_path not in texture_map:
+            tex_key = texture_key(tex_path)
+            if tex_key not in texture_map:
                 logging.info('  Create pmx.Texture -Sphere- %s', tex_path)
                 tex = pmx.Texture()
                 tex.path = os.path.normpath(os.path.join(os.path.dirname(target_path), tex_path))
                 pmx_model.textures.append(tex)
-                texture_map[tex_path] = len(pmx_model.textures) - 1
-            pmx_mat.sphere_texture = texture_map[tex_path]
+                texture_map[tex_key] = len(pmx_model.textures) - 1
+            pmx_mat.sphere_texture = texture_map[tex_key]
             pmx_mat.sphere_texture_mode = mat.sphere_mode
         pmx_mat.is_shared_toon_texture = False
         pmx_mat.toon_texture = -1
@@ -225,15 +240,16 @@ def import_pmd_to_pmx(filepath):
             tex_path = pmd_model.toon_textures[mat.toon_index]
             if tex_path not in toon_texture_map:
                 logging.info('  Create pmx.Texture --Toon-- %s', tex_path)
+                tex_key = texture_key(tex_path)
                 if re.match(r'toon(0[1-9]|10)\.bmp$', tex_path):
                     toon_texture_map[tex_path] = (True, int(tex_path[-6:-4])-1)
-                elif tex_path in texture_map:
-                    toon_texture_map[tex_path] = (False, texture_map[tex_path])
+                elif tex_key in texture_map:
+                    toon_texture_map[tex_path] = (False, texture_map[tex_key])
                 else:
                     tex = pmx.Texture()
                     tex.path = os.path.normpath(os.path.join(os.path.dirname(target_path), tex_path))
                     pmx_model.textures.append(tex)
-                    texture_map[tex_path] = len(pmx_model.textures) - 1
+                    texture_map[tex_key] = len(pmx_model.textures) - 1
                     toon_texture_map[tex_path] = (False, len(pmx_model.textures)-1)
             pmx_mat.is_shared_toon_texture, pmx_mat.toon_texture = toon_texture_map[tex_path]
         pmx_model.materials.append(pmx_mat)
@@ -251,9 +267,7 @@ def import_pmd_to_pmx(filepath):
     else:
         if len(t) > 1:
             logging.warning('Found two or more base morphs.')
-        vertex_map = []
-        for i in t[0].data:
-            vertex_map.append(i.index)
+        vertex_map = t[0].data['index']
 
         for morph in pmd_model.morphs:
             logging.debug('Vertex Morph: %s', morph.name)
@@ -261,10 +275,11 @@ def import_pmd_to_pmx(filepath):
                 morph_index_map.append(-1)
                 continue
             pmx_morph = pmx.VertexMorph(morph.name, morph.name_e, morph.type)
-            for i in morph.data:
+            indices = vertex_map[morph.data['index']]
+            for index, offset in zip(indices.tolist(), morph.data['offset'].tolist()):
                 mo = pmx.VertexMorphOffset()
-                mo.index = vertex_map[i.index]
-                mo.offset = i.offset
+                mo.index = index
+                mo.offset = offset
                 pmx_morph.offsets.append(mo)
             morph_index_map.append(len(pmx_model.morphs))
             pmx_model.morphs.append(pmx_morph)
@@ -6,6 +6,7 @@ import time
 
 import bpy
 import mathutils
+import numpy as np
 
 import mmd_tools_local.core.model as mmd_model
 from mmd_tools_local import utils
@@ -700,8 +701,6 @@ class PMXImporter:
     def __importUVMorphs(self):
         mmd_root = self.__root.mmd_root
         categories = self.CATEGORIES
-        __OffsetData = collections.namedtuple('OffsetData', 'index, offset')
-        __convert_offset = lambda x: (x[0], -x[1], x[2], -x[3])
         for morph in [x for x in self.__model.morphs if isinstance(x, pmx.UVMorph)]:
             uv_morph = mmd_root.uv_morphs.add()
             uv_morph.name = morph.name
@@ -709,8 +708,9 @@ class PMXImporter:
             uv_morph.category = categories.get(morph.category, 'OTHER')
             uv_morph.uv_index = morph.uv_index
 
-            offsets = (__OffsetData(d.index, __convert_offset(d.offset)) for d in morph.offsets)
-            FnMorph.store_uv_morph_data(self.__meshObj, uv_morph, offsets, '')
+            indices = np.array([d.index for d in morph.offsets], dtype=int)
+            offsets = np.array([d.offset for d in morph.offsets], dtype=float).reshape(-1, 4) * (1, -1, 1, -1)
+            FnMorph.store_uv_morph_offsets(self.__meshObj, uv_morph, indices, offsets, '')
             uv_morph.data_type = 'VERTEX_GROUP'
 
     def __importGroupMorphs(self):
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import bpy
+import numpy as np
 from bpy.types import Operator
 from mathutils import Vector, Quaternion
 
@@ -533,15 +534,20 @@ class ViewUVMorph(Operator):
                 self.report({ 'ERROR' }, "Failed to create a temporary uv layer")
                 return { 'CANCELLED' }
 
-            offsets = FnMorph.get_uv_morph_offset_map(meshObj, morph).items()
-            offsets = {k:getattr(Vector(v), 'zw' if uv_layer_name.startswith('_') else 'xy') for k, v in offsets}
-            if len(offsets) > 0:
-                base_uv_data = mesh.uv_layers.active.data
+            offsets, used = FnMorph.get_uv_morph_offsets(meshObj, morph)
+            offsets = offsets[:, 2:4] if uv_layer_name.startswith('_') else offsets[:, 0:2]
+            if used.any():
+                loop_count = len(mesh.loops)
+                loop_vertices = np.empty(loop_count, dtype=int)
+                mesh.loops.foreach_get('vertex_index', loop_vertices)
+                uv = np.empty(loop_count*2, dtype=np.float32)
+                mesh.uv_layers.active.data.foreach_get('uv', uv)
+
+                select = used[loop_vertices]
+                uv = uv.reshape(-1, 2) + offsets[loop_vertices]*select[:, None]
                 temp_uv_data = mesh.uv_layers[uv_tex.name].data
-                for i, l in enumerate(mesh.loops):
-                    select = temp_uv_data[i].select = (l.vertex_index in offsets)
-                    if select:
-                        temp_uv_data[i].uv = base_uv_data[i].uv + offsets[l.vertex_index]
+                temp_uv_data.foreach_set('uv', uv.astype(np.float32).ravel())
+                temp_uv_data.foreach_set('select', select)
 
             uv_textures.active = uv_tex
             uv_tex.active_render = True
@@ -614,10 +620,14 @@ class EditUVMorph(Operator):
             bpy.ops.mesh.select_all(action='DESELECT')
             bpy.ops.object.mode_set(mode='OBJECT')
 
-            vertices = meshObj.data.vertices
-            for l, d in zip(meshObj.data.loops, meshObj.data.uv_layers.active.data):
-                if d.select:
-                    vertices[l.vertex_index].select = True
+            mesh = meshObj.data
+            loop_vertices = np.empty(len(mesh.loops), dtype=int)
+            mesh.loops.foreach_get('vertex_index', loop_vertices)
+            uv_select = np.empty(len(mesh.loops), dtype=bool)
+            mesh.uv_layers.active.data.foreach_get('select', uv_select)
+            vertex_select = np.zeros(len(mesh.vertices), dtype=bool)
+            vertex_select[loop_vertices[uv_select]] = True
+            mesh.vertices.foreach_set('select', vertex_select)
 
             bpy.ops.object.mode_set(mode='EDIT')
         meshObj.select = selected
@@ -654,21 +664,25 @@ class ApplyUVMorph(Operator):
                 self.report({'ERROR'}, ' * UV map "%s" not found'%base_uv_name)
                 return {'CANCELLED'}
 
-            base_uv_data = mesh.uv_layers[base_uv_name].data
-            temp_uv_data = mesh.uv_layers.active.data
             axis_type = 'ZW' if base_uv_name.startswith('_') else 'XY'
 
-            from collections import namedtuple
-            __OffsetData = namedtuple('OffsetData', 'index, offset')
-            offsets = {}
-            vertices = mesh.vertices
-            for l, i0, i1 in zip(mesh.loops, base_uv_data, temp_uv_data):
-                if vertices[l.vertex_index].select and l.vertex_index not in offsets:
-                    dx, dy = i1.uv - i0.uv
-                    if abs(dx) > 0.0001 or abs(dy) > 0.0001:
-                        offsets[l.vertex_index] = __OffsetData(l.vertex_index, (dx, dy, dx, dy))
-
-            FnMorph.store_uv_morph_data(meshObj, morph, offsets.values(), axis_type)
+            loop_count = len(mesh.loops)
+            loop_vertices = np.empty(loop_count, dtype=int)
+            mesh.loops.foreach_get('vertex_index', loop_vertices)
+            base_uv = np.empty(loop_count*2, dtype=np.float32)
+            mesh.uv_layers[base_uv_name].data.foreach_get('uv', base_uv)
+            temp_uv = np.empty(loop_count*2, dtype=np.float32)
+            mesh.uv_layers.active.data.foreach_get('uv', temp_uv)
+            vertex_select = np.empty(len(mesh.vertices), dtype=bool)
+            mesh.vertices.foreach_get('select', vertex_select)
+
+            # use the first changed loop of every selected vertex
+            delta = (temp_uv - base_uv).reshape(-1, 2)
+            changed = vertex_select[loop_vertices] & np.any(np.abs(delta) > 0.0001, axis=1)
+            indices, first_loops = np.unique(loop_vertices[changed], return_index=True)
+            delta = delta[changed][first_loops].astype(float)
+
+            FnMorph.store_uv_morph_offsets(meshObj, morph, indices, np.hstack((delta, delta)), axis_type)
             morph.data_type = 'VERTEX_GROUP'
 
         meshObj.select = selected
@@ -27,6 +27,7 @@
 import unittest
 import sys
 import bpy
+import tools.common
 
 
 class TestAddon(unittest.TestCase):
@@ -40,6 +41,130 @@ class TestAddon(unittest.TestCase):
         result = bpy.ops.armature.fix()
         self.assertTrue(result == {'FINISHED'})
 
+    def test_enum_cache(self):
+        armature = tools.common.get_armature()
+        bones = tools.common.get_bones()
+        self.assertIs(bones, tools.common.get_bones())
+
+        # Renames are only noticed after invalidating the cache
+        bone = armature.data.bones[0]
+        old_name = bone.name
+        bone.name = old_name + '_renamed'
+        tools.common.invalidate_enums()
+        self.assertIn(bone.name, [choice[0] for choice in tools.common.get_bones()])
+
+        bone.name = old_name
+        tools.common.invalidate_enums()
+        self.assertIn(old_name, [choice[0] for choice in tools.common.get_bones()])
+
+    def test_vertex_weights(self):
+        for mesh in tools.common.get_meshes_objects(mode=2):
+            weights = tools.common.get_vertex_weights(mesh)
+            self.assertIs(weights, tools.common.get_vertex_weights(mesh))
+
+            used = set()
+            for vert in mesh.data.vertices:
+                for group in vert.groups:
+                    if group.weight > 0:
+                        used.add(group.group)
+
+            for vertex_group in mesh.vertex_groups:
+                self.assertEqual(bool(weights.used_groups()[vertex_group.index]), vertex_group.index in used)
+
+    def test_merge_weights(self):
+        for mesh in tools.common.get_meshes_objects(mode=2):
+            if len(mesh.vertex_groups) < 3:
+                continue
+
+            # Merge a chain A -> B -> C and compare it with the weights summed up by hand
+            names = [vg.name for vg in mesh.vertex_groups[:3]]
+            expected = {}
+            for vert in mesh.data.vertices:
+                weights = {mesh.vertex_groups[group.group].name: group.weight for group in vert.groups}
+                if names[0] in weights or names[1] in weights:
+                    expected[vert.index] = min(sum(weights.get(name, 0) for name in names), 1)
+
+            tools.common.merge_weights(mesh, {names[0]: names[1], names[1]: names[2]})
+            self.assertIsNone(mesh.vertex_groups.get(names[0]))
+            self.assertIsNone(mesh.vertex_groups.get(names[1]))
+
+            target = mesh.vertex_groups.get(names[2])
+            for index, weight in expected.items():
+                self.assertAlmostEqual(target.weight(index), weight, places=5)
+
+    def test_merge_empty_weights(self):
+        for mesh in tools.common.get_meshes_objects(mode=2):
+            if len(mesh.vertex_groups) < 1:
+                continue
+
+            # Merging a group without weights only removes it
+            target = mesh.vertex_groups[0]
+            expected = {vert.index: target.weight(vert.index) for vert in mesh.data.vertices
+                        if target.index in [group.group for group in vert.groups]}
+            mesh.vertex_groups.new('Empty Source')
+
+            tools.common.merge_weights(mesh, {'Empty Source': target.name})
+            self.assertIsNone(mesh.vertex_groups.get('Empty Source'))
+
+            target = mesh.vertex_groups.get(target.name)
+            for index, weight in expected.items():
+                self.assertAlmostEqual(target.weight(index), weight, places=5)
+
+    def test_join_meshes(self):
+        meshes = tools.common.get_meshes_objects()
+        vertex_count = sum(len(mesh.data.vertices) for mesh in meshes)
+        polygon_count = sum(len(mesh.data.polygons) for mesh in meshes)
+        group_names = {vg.name for mesh in meshes for vg in mesh.vertex_groups}
+        key_names = {shapekey.name for mesh in meshes if tools.common.has_shapekeys(mesh)
+                     for shapekey in mesh.data.shape_keys.key_blocks[1:]}
+
+        mesh = tools.common.join_meshes()
+        self.assertEqual(mesh.name, 'Body')
+        self.assertEqual(len(tools.common.get_meshes_objects()), 1)
+        self.assertEqual(len(mesh.data.vertices), vertex_count)
+        self.assertEqual(len(mesh.data.polygons), polygon_count)
+        self.assertEqual({vg.name for vg in mesh.vertex_groups}, group_names)
+        if key_names:
+            self.assertEqual({shapekey.name for shapekey in mesh.data.shape_keys.key_blocks[1:]}, key_names)
+
+    def test_join_meshes_keeps_target_data(self):
+        meshes = tools.common.get_meshes_objects()
+        if not meshes:
+            self.skipTest('The model has no meshes')
+        if len(meshes) < 2:
+            # Join a copy of the mesh, so the mesh data actually gets joined
+            copy = meshes[0].copy()
+            copy.data = meshes[0].data.copy()
+            bpy.context.scene.objects.link(copy)
+            meshes = tools.common.get_meshes_objects()
+            self.assertEqual(len(meshes), 2)
+
+        # The meshes get joined into the last one, which keeps its settings and custom properties
+        target = meshes[-1].data
+        target.use_auto_smooth = True
+        target.auto_smooth_angle = 0.5
+        target['cats_test'] = 42
+        target.vertices[0].bevel_weight = 0.25
+
+        mesh = tools.common.join_meshes()
+        self.assertTrue(mesh.data.use_auto_smooth)
+        self.assertAlmostEqual(mesh.data.auto_smooth_angle, 0.5, places=5)
+        self.assertEqual(mesh.data.get('cats_test'), 42)
+        self.assertAlmostEqual(mesh.data.vertices[0].bevel_weight, 0.25, places=2)
+
+    def test_separate_by_loose_parts(self):
+        mesh = tools.common.join_meshes()
+        polygon_count = len(mesh.data.polygons)
+        material_names = {material.name for material in mesh.data.materials}
+
+        tools.common.separate_by_loose_parts(bpy.context, mesh)
+        meshes = tools.common.get_meshes_objects()
+        self.assertEqual(sum(len(mesh.data.polygons) for mesh in meshes), polygon_count)
+        for mesh in meshes:
+            self.assertLessEqual(len(mesh.data.materials), 1)
+            if mesh.data.materials:
+                self.assertIn(mesh.data.materials[0].name, material_names)
+
 
 suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
 runner = unittest.TextTestRunner()
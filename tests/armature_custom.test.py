@@ -0,0 +1,128 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Code author: GiveMeAllYourCats
+# Repo: https://github.com/michaeldegroot/cats-blender-plugin
+# Edits by: GiveMeAllYourCats
+
+import unittest
+import sys
+import bpy
+import tools.common
+import tools.armature_bones as Bones
+
+
+class TestAddon(unittest.TestCase):
+    def setUp(self):
+        # Merge a copy of the fixed model into the model itself
+        bpy.ops.armature.fix()
+        self.base = tools.common.get_armature()
+        tools.common.join_meshes(armature_name=self.base.name)
+        mesh = tools.common.get_meshes_objects(armature_name=self.base.name)[0]
+
+        self.parents = {bone.name: bone.parent.name if bone.parent else None for bone in self.base.data.bones}
+        self.group_sizes = get_group_sizes(mesh)
+
+        merge = self.base.copy()
+        merge.data = self.base.data.copy()
+        bpy.context.scene.objects.link(merge)
+        for child in self.base.children:
+            child_copy = child.copy()
+            child_copy.data = child.data.copy()
+            bpy.context.scene.objects.link(child_copy)
+            child_copy.parent = merge
+            for mod in child_copy.modifiers:
+                if mod.type == 'ARMATURE' and mod.object == self.base:
+                    mod.object = merge
+
+        tools.common.invalidate_enums()
+        bpy.context.scene.merge_armature_into = self.base.name
+        bpy.context.scene.merge_armature = merge.name
+
+    def merge(self, merge_same_bones):
+        bpy.context.scene.merge_same_bones = merge_same_bones
+        result = bpy.ops.armature_custom.merge_armatures()
+        self.assertTrue(result == {'FINISHED'})
+        self.assertEqual(len(tools.common.get_armature_objects()), 1)
+
+        armature = tools.common.get_armature_objects()[0]
+        meshes = tools.common.get_meshes_objects(armature_name=armature.name)
+        self.assertEqual(len(meshes), 1)
+        return armature, get_group_sizes(meshes[0])
+
+    def assert_parents(self, armature, new_name):
+        # Every bone is parented to the new bone of its closest original parent that is still there,
+        # bones without weights get removed after merging
+        bones = armature.data.bones
+        for name, parent in self.parents.items():
+            bone = bones.get(new_name(name))
+            if not bone:
+                continue
+            while parent and not bones.get(new_name(parent)):
+                parent = self.parents[parent]
+            self.assertEqual(bone.parent.name if bone.parent else None, new_name(parent) if parent else None, bone.name)
+
+    def test_merge_armatures_auto(self):
+        if not any(name in self.parents and 'Eye' not in name for name in Bones.dont_delete_these_main_bones):
+            self.skipTest('The model has no main bones')
+
+        # Main bones get merged into the base bones, all other bones get added as new bones
+        main_bones = set(Bones.dont_delete_these_main_bones)
+        armature, group_sizes = self.merge(False)
+
+        def new_name(name):
+            return name if name in main_bones else name + '.merge'
+
+        self.assert_parents(armature, new_name)
+        self.assert_parents(armature, lambda name: name)
+        for name, size in self.group_sizes.items():
+            if not size:
+                continue
+            if name in self.parents and name not in main_bones:
+                # The vertex group of an added bone got renamed, the base vertex group is unchanged
+                self.assertEqual(group_sizes.get(name + '.merge'), size, name)
+                self.assertEqual(group_sizes.get(name), size, name)
+            else:
+                # Merged bones and groups without a bone are combined by their name
+                self.assertEqual(group_sizes.get(name), 2 * size, name)
+
+    def test_merge_armatures_same_bones(self):
+        # Every bone exists in both armatures, so all of them get merged and no bones are added
+        armature, group_sizes = self.merge(True)
+        self.assertFalse({bone.name for bone in armature.data.bones} - set(self.parents))
+
+        self.assert_parents(armature, lambda name: name)
+        for name, size in self.group_sizes.items():
+            if size:
+                self.assertEqual(group_sizes.get(name), 2 * size, name)
+
+
+def get_group_sizes(mesh):
+    # Number of vertices with a weight per vertex group
+    weights = tools.common.get_vertex_weights(mesh)
+    return {vg.name: int(weights.used_counts[vg.index]) for vg in mesh.vertex_groups}
+
+
+suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
+runner = unittest.TextTestRunner()
+ret = not runner.run(suite).wasSuccessful()
+sys.exit(ret)
@@ -27,6 +27,9 @@
 import unittest
 import sys
 import bpy
+import globs
+import tools.common
+import tools.bonemerge
 
 
 class TestAddon(unittest.TestCase):
@@ -35,6 +38,18 @@ class TestAddon(unittest.TestCase):
         bpy.ops.refresh.root()
         bpy.ops.bone.merge()
 
+    def test_plan_bone_merges(self):
+        bpy.ops.armature.fix()
+        bpy.ops.refresh.root()
+        armature = tools.common.get_armature()
+
+        for parent_bones in globs.root_bones.values():
+            bone_merges = tools.bonemerge.plan_bone_merges(armature, parent_bones, 50)
+            for bone_name, target_name in bone_merges.items():
+                # Weights never go into a bone that gets removed as well
+                self.assertNotIn(target_name, bone_merges)
+                self.assertNotIn(bone_name, parent_bones)
+
 
 suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
 runner = unittest.TextTestRunner()
@@ -27,6 +27,9 @@
 import unittest
 import sys
 import bpy
+import globs
+import tools.common
+import tools.rootbone
 
 
 class TestAddon(unittest.TestCase):
@@ -35,6 +38,20 @@ class TestAddon(unittest.TestCase):
         bpy.ops.refresh.root()
         bpy.ops.root.function()
 
+    def test_root_bone_groups(self):
+        bpy.ops.armature.fix()
+        bpy.ops.refresh.root()
+        choices = tools.rootbone.get_parent_root_bones(None, bpy.context)
+        self.assertIs(choices, tools.rootbone.get_parent_root_bones(None, bpy.context))
+
+        # All bones of a group have to be siblings
+        armature = tools.common.get_armature()
+        for rootbone, bone_names in globs.root_bones.items():
+            self.assertGreaterEqual(len(bone_names), 2)
+            parent = armature.data.bones[rootbone].parent
+            for bone_name in bone_names:
+                self.assertEqual(armature.data.bones[bone_name].parent, parent)
+
 
 suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
 runner = unittest.TextTestRunner()
@@ -27,6 +27,8 @@
 import unittest
 import sys
 import bpy
+import tools.common
+import tools.copy_protection
 
 
 class TestAddon(unittest.TestCase):
@@ -35,6 +37,23 @@ class TestAddon(unittest.TestCase):
         bpy.ops.copyprotection.enable()
         bpy.ops.copyprotection.disable()
 
+    def test_scramble_vertices_seed(self):
+        mesh = tools.common.get_meshes_objects(mode=2)[0]
+        original = [tuple(vert.co) for vert in mesh.data.vertices]
+
+        tools.copy_protection.scramble_vertices(mesh, False, seed=1)
+        first = [tuple(vert.co) for vert in mesh.data.vertices]
+
+        # The height of the box comes from the mesh, so start from the same positions again
+        for vert, co in zip(mesh.data.vertices, original):
+            vert.co = co
+        tools.copy_protection.scramble_vertices(mesh, False, seed=1)
+        second = [tuple(vert.co) for vert in mesh.data.vertices]
+        self.assertEqual(first, second)
+
+        for co in first:
+            self.assertGreaterEqual(co[2], 0)
+
 
 suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
 runner = unittest.TextTestRunner()
@@ -0,0 +1,121 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Code author: GiveMeAllYourCats
+# Repo: https://github.com/michaeldegroot/cats-blender-plugin
+# Edits by: GiveMeAllYourCats
+
+import unittest
+import sys
+import time
+import bpy
+import numpy as np
+import tools.common
+import tools.decimation
+
+
+class TestAddon(unittest.TestCase):
+    def test_decimation(self):
+        bpy.ops.armature.fix()
+        bpy.context.scene.decimation_mode = 'FULL'
+        bpy.context.scene.max_tris = 5000
+        result = bpy.ops.auto.decimate()
+        self.assertTrue(result == {'FINISHED'})
+
+        tris_count = 0
+        for mesh in tools.common.get_meshes_objects():
+            tris_count += len(mesh.data.polygons)
+        self.assertLessEqual(tris_count, 5000 * 1.05)
+
+    def test_decimation_with_shape_keys_benchmark(self):
+        bpy.ops.armature.fix()
+        for mesh in tools.common.get_meshes_objects():
+            if not tools.common.has_shapekeys(mesh):
+                continue
+
+            tools.decimation.triangulate(mesh, 0.00001)
+            tris = len(mesh.data.polygons)
+            shape_keys = [key_block.name for key_block in mesh.data.shape_keys.key_blocks]
+
+            start_time = time.time()
+            tris_after = tools.decimation.decimate_with_shape_keys(mesh, 0.5)
+            print('Decimated', mesh.name, 'with', len(shape_keys), 'shape keys from', tris, 'to', tris_after, 'tris in', round(time.time() - start_time, 2), 's')
+
+            self.assertLessEqual(tris_after, tris)
+            self.assertEqual(shape_keys, [key_block.name for key_block in mesh.data.shape_keys.key_blocks])
+            for key_block in mesh.data.shape_keys.key_blocks:
+                self.assertEqual(len(key_block.data), len(mesh.data.vertices))
+
+    def test_decimation_with_shape_keys_70k_benchmark(self):
+        # A sphere with 70144 tris, about the size of a model that gets decimated to the 70k tris limit
+        bpy.ops.mesh.primitive_uv_sphere_add(segments=256, ring_count=138)
+        mesh = bpy.context.scene.objects.active
+        tools.decimation.triangulate(mesh)
+        tris = len(mesh.data.polygons)
+
+        mesh.shape_key_add(name='Basis', from_mix=False)
+        coords = np.empty(len(mesh.data.vertices) * 3, dtype=np.float32)
+        mesh.data.vertices.foreach_get('co', coords)
+        for index in range(3):
+            shapekey = mesh.shape_key_add(name='Key ' + str(index), from_mix=False)
+            moved = coords.reshape(-1, 3).copy()
+            moved[moved[:, 2] > index * 0.3 - 0.3] *= 1.1
+            shapekey.data.foreach_set('co', moved.ravel())
+
+        start_time = time.time()
+        tris_after = tools.decimation.decimate_with_shape_keys(mesh, 0.5)
+        print('Decimated a sphere with 3 shape keys from', tris, 'to', tris_after, 'tris in', round(time.time() - start_time, 2), 's')
+
+        self.assertLess(tris_after, tris)
+        for key_block in mesh.data.shape_keys.key_blocks:
+            self.assertEqual(len(key_block.data), len(mesh.data.vertices))
+
+    def test_plan_decimation(self):
+        meshes = [(mesh, len(mesh.data.polygons)) for mesh in tools.common.get_meshes_objects(mode=2)]
+        tris_count = sum(tris for mesh, tris in meshes)
+        if tris_count == 0:
+            return
+
+        planned = tools.decimation.plan_decimation(meshes, 0, tris_count // 2)
+        planned_tris_count = sum(tris_planned for ratio, tris_planned in planned.values())
+        self.assertAlmostEqual(planned_tris_count, tris_count // 2, delta=len(meshes))
+
+    def test_plan_decimation_min_tris(self):
+        meshes = [(mesh, len(mesh.data.polygons)) for mesh in tools.common.get_meshes_objects(mode=2)]
+        meshes = [(mesh, tris) for mesh, tris in meshes if tris > 0]
+        if len(meshes) < 2:
+            return
+
+        # A mesh that can't be decimated keeps its tris and the other meshes share the rest
+        tris_count = sum(tris for mesh, tris in meshes)
+        kept, kept_tris = meshes[0]
+        planned = tools.decimation.plan_decimation(meshes, 0, tris_count // 2 + kept_tris // 2, {kept.name: kept_tris})
+        self.assertEqual(planned[kept.name], (1, kept_tris))
+
+        planned_tris_count = sum(tris_planned for ratio, tris_planned in planned.values())
+        self.assertAlmostEqual(planned_tris_count, tris_count // 2 + kept_tris // 2, delta=len(meshes))
+
+
+suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
+runner = unittest.TextTestRunner()
+ret = not runner.run(suite).wasSuccessful()
+sys.exit(ret)
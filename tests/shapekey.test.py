@@ -0,0 +1,112 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Code author: GiveMeAllYourCats
+# Repo: https://github.com/michaeldegroot/cats-blender-plugin
+import sys
+import time
+import random
+import unittest
+import bpy
+import tools.common
+
+
+class TestAddon(unittest.TestCase):
+    def test_sort_shape_keys_benchmark(self):
+        bpy.ops.mesh.primitive_cube_add()
+        mesh = bpy.context.scene.objects.active
+        mesh.shape_key_add(name='Basis', from_mix=False)
+
+        names = ['Key ' + str(i) for i in range(500)]
+        shuffled = list(names)
+        random.seed(0)
+        random.shuffle(shuffled)
+        for name in shuffled:
+            mesh.shape_key_add(name=name, from_mix=False)
+
+        start = time.time()
+        tools.common.sort_shape_keys(mesh.name, names)
+        print('Sorted 500 shape keys in ' + str(round(time.time() - start, 2)) + 's')
+
+        self.assertEqual([shapekey.name for shapekey in mesh.data.shape_keys.key_blocks], ['Basis'] + names)
+
+    def test_apply_shapekey_to_basis(self):
+        bpy.ops.mesh.primitive_cube_add()
+        mesh = bpy.context.scene.objects.active
+        mesh.shape_key_add(name='Basis', from_mix=False)
+
+        random.seed(0)
+        for name in ['Key A', 'Key B', 'Key C']:
+            shapekey = mesh.shape_key_add(name=name, from_mix=False)
+            for point in shapekey.data:
+                point.co.x += random.uniform(-1, 1)
+                point.co.z += random.uniform(-1, 1)
+
+        key_blocks = mesh.data.shape_keys.key_blocks
+        old_coords = {shapekey.name: [point.co.copy() for point in shapekey.data] for shapekey in key_blocks}
+
+        mesh.active_shape_key_index = 1
+        result = bpy.ops.object.shape_key_to_basis()
+        self.assertTrue(result == {'FINISHED'})
+
+        # No shape keys got added or removed, the old basis is now the reverted key
+        self.assertEqual([shapekey.name for shapekey in key_blocks], ['Basis', 'Key A - Reverted', 'Key B', 'Key C'])
+        self.assertEqual(key_blocks['Key B'].relative_key.name, 'Basis')
+
+        for index, vertex in enumerate(mesh.data.vertices):
+            offset = old_coords['Key A'][index] - old_coords['Basis'][index]
+            self.assertTrue((vertex.co - old_coords['Key A'][index]).length < 0.0001)
+            self.assertTrue((key_blocks['Key A - Reverted'].data[index].co - old_coords['Basis'][index]).length < 0.0001)
+            for name in ['Key B', 'Key C']:
+                self.assertTrue((key_blocks[name].data[index].co - old_coords[name][index] - offset).length < 0.0001)
+
+    def test_apply_shapekey_to_basis_relative_key(self):
+        bpy.ops.mesh.primitive_cube_add()
+        mesh = bpy.context.scene.objects.active
+        mesh.shape_key_add(name='Basis', from_mix=False)
+
+        random.seed(1)
+        for name in ['Key A', 'Key B']:
+            shapekey = mesh.shape_key_add(name=name, from_mix=False)
+            for point in shapekey.data:
+                point.co.x += random.uniform(-1, 1)
+                point.co.z += random.uniform(-1, 1)
+
+        # Key B is relative to the key that gets applied, so its shape must not change
+        key_blocks = mesh.data.shape_keys.key_blocks
+        key_blocks['Key B'].relative_key = key_blocks['Key A']
+        old_coords = {shapekey.name: [point.co.copy() for point in shapekey.data] for shapekey in key_blocks}
+
+        mesh.active_shape_key_index = 1
+        result = bpy.ops.object.shape_key_to_basis()
+        self.assertTrue(result == {'FINISHED'})
+        self.assertEqual(key_blocks['Key B'].relative_key.name, 'Basis')
+
+        for index in range(len(mesh.data.vertices)):
+            self.assertTrue((key_blocks['Key B'].data[index].co - old_coords['Key B'][index]).length < 0.0001)
+            self.assertTrue((key_blocks['Basis'].data[index].co - old_coords['Key A'][index]).length < 0.0001)
+
+
+suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
+runner = unittest.TextTestRunner()
+ret = not runner.run(suite).wasSuccessful()
+sys.exit(ret)
@@ -0,0 +1,103 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Code author: GiveMeAllYourCats
+# Repo: https://github.com/michaeldegroot/cats-blender-plugin
+# Edits by: GiveMeAllYourCats
+
+import os
+import io
+import sys
+import json
+import zipfile
+import tempfile
+import unittest
+import threading
+import http.server
+import tools.settings
+import tools.supporter
+
+
+# Serves the supporter zip with an ETag and answers matching requests with 304
+class SupporterListHandler(http.server.BaseHTTPRequestHandler):
+    downloads = 0
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as zip_file:
+            zip_file.writestr('cats_supporter_list-master/supporters.json', json.dumps({'supporters': [{'displayname': 'Cat'}], 'news': []}))
+            zip_file.writestr('cats_supporter_list-master/supporters/Cat.png', b'')
+
+        SupporterListHandler.downloads += 1
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(data.getvalue())))
+        self.end_headers()
+        self.wfile.write(data.getvalue())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAddon(unittest.TestCase):
+    def test_download_supporters(self):
+        server = http.server.HTTPServer(('127.0.0.1', 0), SupporterListHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        resources_dir = tools.supporter.resources_dir
+        supporter_zip_url = tools.supporter.supporter_zip_url
+        settings_file = tools.settings.settings_file
+        settings_data = tools.settings.settings_data
+
+        temp_dir = tempfile.mkdtemp()
+        tools.supporter.resources_dir = temp_dir
+        tools.supporter.supporter_zip_url = 'http://127.0.0.1:' + str(server.server_port) + '/master.zip'
+        tools.settings.settings_file = os.path.join(temp_dir, 'settings.json')
+        tools.settings.settings_data = None
+        try:
+            tools.supporter.download_file()
+            self.assertTrue(os.path.isfile(os.path.join(temp_dir, 'supporters.json')))
+            self.assertTrue(os.path.isfile(os.path.join(temp_dir, 'icons', 'supporters', 'Cat.png')))
+            self.assertEqual(tools.supporter.main_thread_queue.get_nowait(), tools.supporter.reload_supporters)
+
+            # The second download is skipped because the list didn't change
+            tools.supporter.download_file()
+            self.assertEqual(SupporterListHandler.downloads, 1)
+        finally:
+            server.shutdown()
+            tools.supporter.resources_dir = resources_dir
+            tools.supporter.supporter_zip_url = supporter_zip_url
+            tools.settings.settings_file = settings_file
+            tools.settings.settings_data = settings_data
+            while not tools.supporter.main_thread_queue.empty():
+                tools.supporter.main_thread_queue.get_nowait()
+
+
+suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
+runner = unittest.TextTestRunner()
+ret = not runner.run(suite).wasSuccessful()
+sys.exit(ret)
@@ -39,6 +39,11 @@ class TestAddon(unittest.TestCase):
         import cats
         self.assertIsNotNone(cats.bl_info)
 
+    def test_import_times(self):
+        import cats
+        for module_name in cats.tool_modules:
+            self.assertIn(module_name, cats.import_times)
+
 
 suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
 runner = unittest.TextTestRunner()
@@ -24,9 +24,12 @@
 # Repo: https://github.com/michaeldegroot/cats-blender-plugin
 # Edits by: GiveMeAllYourCats
 
-import unittest
+import os
 import sys
 import bpy
+import tempfile
+import unittest
+import tools.translate
 
 
 class TestAddon(unittest.TestCase):
@@ -34,6 +37,28 @@ class TestAddon(unittest.TestCase):
         result = bpy.ops.translate.shapekeys()
         self.assertTrue(result == {'FINISHED'})
 
+    def test_google_dict_log(self):
+        # The legacy dictionary gets converted and removed while loading, so both files are redirected
+        google_file = tools.translate.dictionary_google_file
+        google_file_legacy = tools.translate.dictionary_google_file_legacy
+        temp_dir = tempfile.mkdtemp()
+        tools.translate.dictionary_google_file = os.path.join(temp_dir, 'dictionary_google.log')
+        tools.translate.dictionary_google_file_legacy = os.path.join(temp_dir, 'dictionary_google.json')
+        try:
+            tools.translate.reset_google_dict()
+            tools.translate.save_google_dict([('translations', '髪', 'Hair'), ('translations_full', '目', 'Eye')])
+            tools.translate.save_google_dict([('translations', '髪', 'Hair 2')])
+            tools.translate.save_google_dict([('translations', '腕', 'Arm')], created=0)
+
+            tools.translate.load_google_dict()
+            self.assertEqual(tools.translate.dictionary_google['translations'].get('髪'), 'Hair 2')
+            self.assertEqual(tools.translate.dictionary_google['translations_full'].get('目'), 'Eye')
+            self.assertIsNone(tools.translate.dictionary_google['translations'].get('腕'))  # Expired
+        finally:
+            tools.translate.dictionary_google_file = google_file
+            tools.translate.dictionary_google_file_legacy = google_file_legacy
+            tools.translate.load_google_dict()
+
 
 suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
 runner = unittest.TextTestRunner()
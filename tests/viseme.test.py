@@ -40,6 +40,22 @@ class TestAddon(unittest.TestCase):
         result = bpy.ops.auto.viseme()
         self.assertTrue(result == {'FINISHED'})
 
+        # A viseme has to match the shape key Blender creates from the same mix
+        mesh = bpy.data.objects[bpy.context.scene.mesh_name_viseme]
+        key_blocks = mesh.data.shape_keys.key_blocks
+        for shapekey in key_blocks:
+            shapekey.value = 0
+        key_blocks[bpy.context.scene.mouth_a].slider_max = 10
+        key_blocks[bpy.context.scene.mouth_a].value = 0.2 * bpy.context.scene.shape_intensity
+        key_blocks[bpy.context.scene.mouth_o].slider_max = 10
+        key_blocks[bpy.context.scene.mouth_o].value = 0.8 * bpy.context.scene.shape_intensity
+        mixed = mesh.shape_key_add(name='Viseme Test', from_mix=True)
+
+        for vert_mixed, vert_viseme in zip(mixed.data, key_blocks['vrc.v_oh'].data):
+            for axis in range(3):
+                self.assertAlmostEqual(vert_mixed.co[axis], vert_viseme.co[axis], places=4)
+        mesh.shape_key_remove(mixed)
+
 
 suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
 runner = unittest.TextTestRunner()
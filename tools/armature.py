@@ -36,9 +36,89 @@ import mmd_tools_local.operators.morph
 
 import math
 from mathutils import Matrix
+from collections import OrderedDict
 
 mmd_tools_installed = True
 
+# The bone tables with expanded left/right names, see compile_bone_rules()
+rename_rules = []
+reweight_rules = []
+reweight_to_parent_names = []
+conflicting_name_rules = []
+
+
+def compile_bone_rules():
+    # Merges the rename and reweight tables and expands the \Left and \L templates once on load
+    global rename_rules, reweight_rules, reweight_to_parent_names, conflicting_name_rules
+
+    temp_rename_bones = copy.deepcopy(Bones.bone_rename)
+    temp_reweight_bones = copy.deepcopy(Bones.bone_reweight)
+
+    for key, value in Bones.bone_rename_fingers.items():
+        temp_rename_bones[key] = value
+
+    for key, value in temp_rename_bones.items():
+        if key == 'Spine':
+            continue
+        list = temp_reweight_bones.get(key)
+        if not list:
+            temp_reweight_bones[key] = value
+        else:
+            for name in value:
+                if name not in list:
+                    temp_reweight_bones.get(key).append(name)
+
+    # Get Double Entries
+    print('DOUBLE ENTRIES:')
+    for title, bone_dict in [('RENAME:', temp_rename_bones), ('REWEIGHT:', temp_reweight_bones)]:
+        print(title)
+        names = set()
+        for key, value in bone_dict.items():
+            for name in value:
+                if name.lower() in names:
+                    print(key + " | " + name)
+                names.add(name.lower())
+    print('DOUBLES END')
+
+    # Rules: (name template, new name, old name), (new name, old name) and (required names, old name, new name)
+    rename_rules = []
+    for bone_new, bones_old in temp_rename_bones.items():
+        for bone_old in bones_old:
+            if Bones.has_side(bone_new):
+                for new_name, old_name in zip(Bones.side_names(bone_new), Bones.side_names(bone_old)):
+                    rename_rules.append((bone_new, new_name, old_name))
+            else:
+                rename_rules.append((bone_new, bone_new, bone_old))
+
+    reweight_rules = []
+    for bone_new, bones_old in temp_reweight_bones.items():
+        for bone_old in bones_old:
+            if Bones.has_side(bone_new):
+                reweight_rules.extend(zip(Bones.side_names(bone_new), Bones.side_names(bone_old)))
+            else:
+                reweight_rules.append((bone_new, bone_old))
+
+    reweight_to_parent_names = []
+    for name in Bones.bone_reweigth_to_parent:
+        if Bones.has_side(name):
+            reweight_to_parent_names.extend(Bones.side_names(name))
+        else:
+            reweight_to_parent_names.append(name)
+
+    conflicting_name_rules = []
+    for names in Bones.bone_list_conflicting_names:
+        if not Bones.has_side(names[1]):
+            conflicting_name_rules.append(names)
+            continue
+
+        for side in range(2):
+            conflicting_name_rules.append(([Bones.side_names(name)[side] for name in names[0]],
+                                           Bones.side_names(names[1])[side],
+                                           Bones.side_names(names[2])[side]))
+
+
+compile_bone_rules()
+
 
 class FixArmature(bpy.types.Operator):
     bl_idname = 'armature.fix'
@@ -78,60 +158,13 @@ class FixArmature(bpy.types.Operator):
         # Check if bone matrix == world matrix, important for xps models
         x_cord, y_cord, z_cord, fbx = tools.common.get_bone_orientations()
 
-        # Add rename bones to reweight bones
-        temp_rename_bones = copy.deepcopy(Bones.bone_rename)
-        temp_reweight_bones = copy.deepcopy(Bones.bone_reweight)
         temp_list_reweight_bones = copy.deepcopy(Bones.bone_list_weight)
         temp_list_reparent_bones = copy.deepcopy(Bones.bone_list_parenting)
 
-        for key, value in Bones.bone_rename_fingers.items():
-            temp_rename_bones[key] = value
-
-        for key, value in temp_rename_bones.items():
-            if key == 'Spine':
-                continue
-            list = temp_reweight_bones.get(key)
-            if not list:
-                temp_reweight_bones[key] = value
-            else:
-                for name in value:
-                    if name not in list:
-                        temp_reweight_bones.get(key).append(name)
-
         # Count objects for loading bar
-        steps = 0
-        for key, value in temp_rename_bones.items():
-            if '\Left' in key or '\L' in key:
-                steps += 2 * len(value)
-            else:
-                steps += len(value)
-        for key, value in temp_reweight_bones.items():
-            if '\Left' in key or '\L' in key:
-                steps += 2 * len(value)
-            else:
-                steps += len(value)
+        steps = len(rename_rules) + len(reweight_rules)
         steps += len(temp_list_reweight_bones)  # + len(Bones.bone_list_parenting)
 
-        # Get Double Entries
-        print('DOUBLE ENTRIES:')
-        print('RENAME:')
-        list = []
-        for key, value in temp_rename_bones.items():
-            for name in value:
-                if name.lower() not in list:
-                    list.append(name.lower())
-                else:
-                    print(key + " | " + name)
-        print('REWEIGHT:')
-        list = []
-        for key, value in temp_reweight_bones.items():
-            for name in value:
-                if name.lower() not in list:
-                    list.append(name.lower())
-                else:
-                    print(key + " | " + name)
-        print('DOUBLES END')
-
         # Check if model is mmd model
         mmd_root = None
         try:
@@ -427,128 +460,62 @@ class FixArmature(bpy.types.Operator):
 
             bone.name = name
 
-        # Add conflicting bone names to new list
-        conflicting_bones = []
-        for names in Bones.bone_list_conflicting_names:
-            if '\Left' not in names[1] and '\L' not in names[1]:
-                conflicting_bones.append(names)
-                continue
-
-            names0 = []
-            name1 = ''
-            name2 = ''
-            for name0 in names[0]:
-                names0.append(name0.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l'))
-            if '\Left' in names[1] or '\L' in names[1]:
-                name1 = names[1].replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l')
-            if '\Left' in names[2] or '\L' in names[2]:
-                name2 = names[2].replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l')
-            conflicting_bones.append((names0, name1, name2))
-
-            for name0 in names[0]:
-                names0.append(name0.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r'))
-            if '\Left' in names[1] or '\L' in names[1]:
-                name1 = names[1].replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')
-            if '\Left' in names[2] or '\L' in names[2]:
-                name2 = names[2].replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')
-            conflicting_bones.append((names0, name1, name2))
+        # Case insensitive bone lookup, updated on every rename below
+        bone_index = tools.common.NameIndex(armature.data.edit_bones)
 
         # Resolve conflicting bone names
-        for names in conflicting_bones:
+        for names in conflicting_name_rules:
 
             # Search for bone in armature
-            bone = None
-            for bone_tmp in armature.data.edit_bones:
-                if bone_tmp.name.lower() == names[1].lower():
-                    bone = bone_tmp
-                    break
+            bone = bone_index.get(names[1])
 
             # Cancel if bone was not found
             if not bone:
                 continue
 
-            # Search for all the required bones
-            found_all = True
-            for name in names[0]:
-                found = False
-                for bone_tmp in armature.data.edit_bones:
-                    if bone_tmp.name.lower() == name.lower():
-                        found = True
-                        break
-                if not found:
-                    found_all = False
-                    break
-
             # Rename only if all required bones are found
-            if found_all:
-                bone.name = names[2]
+            if all(bone_index.get(name) for name in names[0]):
+                bone_index.rename(bone, names[2])
 
         # Standardize bone names again (new duplicate bones have ".001" in it)
         for bone in armature.data.edit_bones:
-            bone.name = bone.name.replace('.', '_')
+            if '.' in bone.name:
+                bone_index.rename(bone, bone.name.replace('.', '_'))
 
         # Rename all the bones
         spines = []
         spine_parts = []
-        for bone_new, bones_old in temp_rename_bones.items():
-            if '\Left' in bone_new or '\L' in bone_new:
-                bones = [[bone_new.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l'), ''],
-                         [bone_new.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r'), '']]
-            else:
-                bones = [[bone_new, '']]
-            for bone_old in bones_old:
-                if '\Left' in bone_new or '\L' in bone_new:
-                    bones[0][1] = bone_old.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l')
-                    bones[1][1] = bone_old.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')
-                else:
-                    bones[0][1] = bone_old
-
-                for bone in bones:  # bone[0] = new name, bone[1] = old name
-                    current_step += 1
-                    wm.progress_update(current_step)
+        for bone_new, new_name, old_name in rename_rules:
+            current_step += 1
+            wm.progress_update(current_step)
 
-                    # Seach for bone in armature
-                    bone_final = None
-                    for bone_tmp in armature.data.edit_bones:
-                        if bone_tmp.name.lower() == bone[1].lower():
-                            bone_final = bone_tmp
-                            break
+            # Seach for bone in armature
+            bone_final = bone_index.get(old_name)
 
-                    # Cancel if bone was not found
-                    if not bone_final:
-                        continue
+            # Cancel if bone was not found
+            if not bone_final:
+                continue
 
-                    # If spine bone, then don't rename for now, and ignore spines with no children
-                    if bone_new == 'Spine':
-                        if len(bone_final.children) > 0:
-                            spines.append(bone_final.name)
-                        else:
-                            spine_parts.append(bone_final.name)
-                        continue
+            # If spine bone, then don't rename for now, and ignore spines with no children
+            if bone_new == 'Spine':
+                if len(bone_final.children) > 0:
+                    spines.append(bone_final.name)
+                else:
+                    spine_parts.append(bone_final.name)
+                continue
 
-                    # Rename the bone
-                    if bone[0] not in armature.data.edit_bones:
-                        bone_final.name = bone[0]
+            # Rename the bone
+            if new_name not in armature.data.edit_bones:
+                bone_index.rename(bone_final, new_name)
 
         # Add bones to parent reweight list
-        for name in Bones.bone_reweigth_to_parent:
-            if '\Left' in name or '\L' in name:
-                bones = [name.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l'),
-                         name.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')]
-            else:
-                bones = [name]
-
-            for bone_name in bones:
-                # Search for bone in armature
-                bone = None
-                for bone_tmp in armature.data.edit_bones:
-                    if bone_tmp.name.lower() == bone_name.lower():
-                        bone = bone_tmp
-                        break
+        for bone_name in reweight_to_parent_names:
+            # Search for bone in armature
+            bone = bone_index.get(bone_name)
 
-                # Add bone to reweight list
-                if bone and bone.parent:
-                    temp_list_reweight_bones[bone.name] = bone.parent.name
+            # Add bone to reweight list
+            if bone and bone.parent:
+                temp_list_reweight_bones[bone.name] = bone.parent.name
 
         # Check if it is a mixamo model
         mixamo = False
@@ -887,58 +854,53 @@ class FixArmature(bpy.types.Operator):
         #         print(bone_name)
         #         bone.hide = False
 
-        for bone_new, bones_old in temp_reweight_bones.items():
-            if '\Left' in bone_new or '\L' in bone_new:
-                bones = [[bone_new.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l'), ''],
-                         [bone_new.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r'), '']]
-            else:
-                bones = [[bone_new, '']]
-            for bone_old in bones_old:
-                if '\Left' in bone_new or '\L' in bone_new:
-                    bones[0][1] = bone_old.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l')
-                    bones[1][1] = bone_old.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')
-                else:
-                    bones[0][1] = bone_old
+        # Case insensitive vertex group lookup, updated whenever groups are added or removed below
+        vg_index = tools.common.NameIndex(mesh.vertex_groups)
 
-                for bone in bones:  # bone[0] = new name, bone[1] = old name
-                    current_step += 1
-                    wm.progress_update(current_step)
+        # All weight merges are collected and applied at once. The source groups stay on the mesh until then
+        weight_merges = OrderedDict()
 
-                    # Seach for vertex group
-                    vg = None
-                    for vg_tmp in mesh.vertex_groups:
-                        if vg_tmp.name.lower() == bone[1].lower():
-                            vg = vg_tmp
-                            break
+        for new_name, old_name in reweight_rules:
+            current_step += 1
+            wm.progress_update(current_step)
 
-                    # Cancel if vertex group was not found
-                    if not vg:
-                        continue
+            # Seach for vertex group
+            vg = vg_index.get(old_name)
 
-                    if bone[0] == vg.name:
-                        print('BUG: ' + bone[0] + ' tried to mix weights with itself!')
-                        continue
+            # Cancel if vertex group was not found
+            if not vg:
+                continue
 
-                    # print(bone[1] + " to1 " + bone[0])
+            if new_name == vg.name:
+                print('BUG: ' + new_name + ' tried to mix weights with itself!')
+                continue
 
-                    # If important vertex group is not there create it
-                    if mesh.vertex_groups.get(bone[0]) is None:
-                        if bone[0] in Bones.dont_delete_these_bones and bone[0] in armature.data.bones:
-                            bpy.ops.object.vertex_group_add()
-                            mesh.vertex_groups.active.name = bone[0]
-                            if mesh.vertex_groups.get(bone[0]) is None:
-                                continue
-                        else:
-                            continue
+            # print(old_name + " to1 " + new_name)
+
+            # If important vertex group is not there create it
+            if mesh.vertex_groups.get(new_name) is None or new_name in weight_merges:
+                if new_name in Bones.dont_delete_these_bones and new_name in armature.data.bones:
+                    # The old group has to be merged away first to free up the name
+                    if new_name in weight_merges:
+                        tools.common.merge_weights(mesh, weight_merges)
+                        weight_merges.clear()
+                    bpy.ops.object.vertex_group_add()
+                    mesh.vertex_groups.active.name = new_name
+                    vg_index.add(mesh.vertex_groups.active.name)
+                    if mesh.vertex_groups.get(new_name) is None:
+                        continue
+                else:
+                    continue
 
-                    bone_tmp = armature.data.bones.get(vg.name)
-                    if bone_tmp:
-                        for child in bone_tmp.children:
-                            if not temp_list_reparent_bones.get(child.name):
-                                temp_list_reparent_bones[child.name] = bone[0]
+            bone_tmp = armature.data.bones.get(vg.name)
+            if bone_tmp:
+                for child in bone_tmp.children:
+                    if not temp_list_reparent_bones.get(child.name):
+                        temp_list_reparent_bones[child.name] = new_name
 
-                    # print(bone[1] + " to " + bone[0])
-                    tools.common.mix_weights(mesh, vg.name, bone[0])
+            # print(old_name + " to " + new_name)
+            vg_index.remove(vg.name)
+            weight_merges[vg.name] = new_name
 
         # Old mixing weights. Still important
         for key, value in temp_list_reweight_bones.items():
@@ -946,17 +908,8 @@ class FixArmature(bpy.types.Operator):
             wm.progress_update(current_step)
 
             # Search for vertex groups
-            vg_from = None
-            vg_to = None
-            for vg_tmp in mesh.vertex_groups:
-                if vg_tmp.name.lower() == key.lower():
-                    vg_from = vg_tmp
-                    if vg_to:
-                        break
-                elif vg_tmp.name.lower() == value.lower():
-                    vg_to = vg_tmp
-                    if vg_from:
-                        break
+            vg_from = vg_index.get(key)
+            vg_to = vg_index.get(value)
 
             # Cancel if vertex groups was not found
             if not vg_from or not vg_to:
@@ -974,7 +927,10 @@ class FixArmature(bpy.types.Operator):
 
             # Mix the weights
             # print(vg_from.name, 'into', vg_to.name)
-            tools.common.mix_weights(mesh, vg_from.name, vg_to.name)
+            vg_index.remove(vg_from.name)
+            weight_merges[vg_from.name] = vg_to.name
+
+        tools.common.merge_weights(mesh, weight_merges)
 
         tools.common.unselect_all()
         tools.common.select(armature)
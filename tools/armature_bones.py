@@ -27,6 +27,17 @@
 
 from collections import OrderedDict
 
+
+def has_side(name):
+    return '\Left' in name or '\L' in name
+
+
+def side_names(name):
+    # Returns the left and the right version of a name containing \Left or \L
+    return (name.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l'),
+            name.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r'))
+
+
 bone_list = ['ControlNode', 'ParentNode', 'Center', 'CenterTip', 'Groove', 'Waist', 'EyesTip',
              'LowerBodyTip', 'UpperBody2Tip', 'GrooveTip', 'NeckTip']
 bone_list_with = ['_Shadow_', '_Dummy_', 'Dummy_', 'WaistCancel', 'LegIKParent', 'LegIK',
@@ -23,11 +23,11 @@
 # Code author: Hotox
 # Repo: https://github.com/michaeldegroot/cats-blender-plugin
 
-import copy
 import bpy
 import webbrowser
 import tools.common
 import tools.armature_bones as Bones
+from collections import OrderedDict
 
 
 class MergeArmature(bpy.types.Operator):
@@ -292,61 +292,55 @@ def merge_armatures(base_armature_name, merge_armature_name, mesh_only, mesh_nam
     tools.common.select(mesh_merge)
     bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
 
-    # Go into edit mode
-    tools.common.unselect_all()
-    tools.common.select(merge_armature)
-    tools.common.switch('EDIT')
-
-    # Create new bone
-    bones_to_merge = copy.deepcopy(Bones.dont_delete_these_main_bones)
+    # Find out how the bones should be merged
     found = False
     root_name = ''
-    for bone in bones_to_merge:
-        if bone in merge_armature.data.edit_bones and 'Eye' not in bone:
-            found = True
-            print('AUTO MERGE!')
-            break
-
-    if not found and not merge_same_bones:
-        print('CUSTOM MERGE!')
-        root_name = bpy.context.scene.attach_to_bone
-        root = merge_armature.data.edit_bones.get(root_name)
-        if root:
-            root.name += '_Old'
-        root = merge_armature.data.edit_bones.new(root_name)
-        root.tail[2] += 0.1
-
-        # Make new root top parent and reparent other top bones to root
-        root.parent = None
-        for bone2 in merge_armature.data.edit_bones:
-            if not bone2.parent:
-                bone2.parent = root
-        bones_to_merge.append(root.name)
-
-    # Rename all the bones of the merge armature
-    mesh_only_bone_name = ''
-    for bone in merge_armature.data.edit_bones:
-        bone.name = bone.name + '.merge'
-        if mesh_only:
-            mesh_only_bone_name = bone.name
-
-    # Go back into object mode
-    tools.common.set_default_stage()
+    if not mesh_only and not merge_same_bones:
+        for bone in Bones.dont_delete_these_main_bones:
+            if bone in merge_armature.data.bones and 'Eye' not in bone:
+                found = True
+                print('AUTO MERGE!')
+                break
+
+        # Without main bones every top bone of the merge armature gets attached to a new or existing root
+        if not found:
+            print('CUSTOM MERGE!')
+            root_name = bpy.context.scene.attach_to_bone
+    elif merge_same_bones:
+        print('MERGE SAME BONES!')
+
+    plan = BoneMergePlan(base_armature, merge_armature, mesh_base, mesh_merge, merge_same_bones=merge_same_bones,
+                         mesh_only=mesh_only, root_name=root_name, mesh_name=mesh_name)
+
+    # Add the new bones to the base armature
     tools.common.unselect_all()
-
-    # Select armature in correct way
     tools.common.select(base_armature)
-    merge_armature.select = True
-
-    # Join the armatures
-    if bpy.ops.object.join.poll():
-        bpy.ops.object.join()
+    tools.common.switch('EDIT')
+    bone_names = plan.apply(base_armature, merge_armature)
+    tools.common.switch('OBJECT')
+
+    # Move everything from the merge armature over to the base armature, the vertex groups are renamed only once
+    for child in merge_armature.children:
+        child.parent = base_armature
+        if child.parent_type == 'BONE' and child.parent_bone in bone_names:
+            child.parent_bone = bone_names[child.parent_bone]
+        for mod in child.modifiers:
+            if mod.type == 'ARMATURE' and mod.object == merge_armature:
+                mod.object = base_armature
+        if child.type == 'MESH':
+            rename_vertex_groups(child, bone_names)
+
+    merge_armature_data = merge_armature.data
+    bpy.data.objects.remove(merge_armature, do_unlink=True)
+    if merge_armature_data.users == 0:
+        bpy.data.armatures.remove(merge_armature_data)
 
     # Set new armature
+    tools.common.invalidate_enums()
     bpy.context.scene.armature = base_armature_name
     armature = tools.common.get_armature(armature_name=base_armature_name)
 
-    # Join the meshes
+    # Join the meshes, the weights of merged bones get combined by their vertex group names
     mesh_merge = tools.common.join_meshes(armature_name=base_armature_name, apply_transformations=False)
 
     # Clean up shape keys
@@ -357,121 +351,131 @@ def merge_armatures(base_armature_name, merge_armature_name, mesh_only, mesh_nam
     tools.common.select(armature)
     tools.common.switch('EDIT')
 
-    # Reparent all bones
-    if merge_same_bones:
-        for bone in armature.data.edit_bones:
-            if bone.name.endswith('.merge'):
-                new_bone = armature.data.edit_bones.get(bone.name.replace('.merge', ''))
-                if new_bone:
-                    bone.parent = new_bone
-    else:
-        for bone_name in bones_to_merge:
-            old = bone_name + '.merge'
-            new = bone_name
-            if old in armature.data.edit_bones and new in armature.data.edit_bones:
-                armature.data.edit_bones.get(old).parent = armature.data.edit_bones.get(new)
-
-    # Remove all unused bones, constraints and vertex groups
-    tools.common.set_default_stage()
-    tools.common.delete_bone_constraints(armature_name=base_armature_name)
-    tools.common.remove_unused_vertex_groups(ignore_main_bones=True)
-    tools.common.delete_zero_weight(armature_name=base_armature_name, ignore=root_name)
-    tools.common.set_default_stage()
-
-    # Merge bones into existing bones
-    tools.common.select(mesh_merge)
-    replace_bones = []
-    if not mesh_only:
-        if merge_same_bones:
-            print('MERGE SAME BONES!')
-            to_delete = []
-            for bone in armature.pose.bones:
-                if not bone.name.endswith('.merge'):
-                    continue
-
-                bone_base = armature.pose.bones.get(bone.name.replace('.merge', ''))
-                bone_merge = armature.pose.bones.get(bone.name)
-
-                if not bone_base or not bone_merge:
-                    continue
-
-                print(bone_base.name, bone_merge.name)
-
-                vg_base = mesh_merge.vertex_groups.get(bone_base.name)
-                vg_merge = mesh_merge.vertex_groups.get(bone_merge.name)
-
-                if vg_base and vg_merge:
-                    tools.common.mix_weights(mesh_merge, vg_merge.name, vg_base.name)
-
-                to_delete.append(bone_merge.name)
-
-            tools.common.select(armature)
-            tools.common.switch('EDIT')
-
-            for bone_name in to_delete:
-                bone = armature.data.edit_bones.get(bone_name)
-                if bone:
-                    armature.data.edit_bones.remove(bone)
-
-            tools.common.switch('OBJECT')
-
-        else:
-            for bone_name in bones_to_merge:
-                bone_base = bone_name
-                bone_merge = bone_name + '.merge'
-
-                vg_base = mesh_merge.vertex_groups.get(bone_base)
-                vg2 = mesh_merge.vertex_groups.get(bone_merge)
-
-                if not vg_base:
-                    if vg2:
-                        # vg2.name = bone_base
-                        replace_bones.append(bone_base)
-                        continue
-                if not vg2:
-                    continue
-
-                tools.common.mix_weights(mesh_merge, bone_merge, bone_base)
-
-        # Remove ".merge" from all non duplicate bones
-        for bone in armature.pose.bones:
-            new_name = bone.name.replace('.merge', '')
-            if new_name not in armature.pose.bones:
-                bone.name = new_name
-
-    # If mesh_only then rename the only bone to mesh name
-    elif mesh_name:
-        bone = armature.pose.bones.get(mesh_only_bone_name)
-        if not bone:
-            tools.common.show_error(5.8, ['Something went wrong! Please undo, check your selections and try again.'])
-            return
-        armature.pose.bones.get(mesh_only_bone_name).name = mesh_name
-
-    # Go into edit mode
-    tools.common.unselect_all()
-    tools.common.select(armature)
-    tools.common.switch('EDIT')
-
-    # Set new bone positions
-    for bone_name in replace_bones:
-        if bone_name in armature.data.edit_bones and bone_name + '.merge' in armature.data.edit_bones:
-            bone = armature.data.edit_bones.get(bone_name)
-            bone_merged = armature.data.edit_bones.get(bone_name + '.merge')
-
-            bone.name = bone.name + '_Old'
-            bone_merged.name = bone_merged.name.replace('.merge', '')
-
-            bone_merged.parent = bone.parent
-            bone.parent = bone_merged
-
     # Fix bone connections (just for design)
     tools.common.correct_bone_positions(armature_name=base_armature_name)
 
     # Remove all unused bones, constraints and vertex groups
     tools.common.set_default_stage()
+    tools.common.delete_bone_constraints(armature_name=base_armature_name)
     tools.common.remove_unused_vertex_groups()
     tools.common.delete_zero_weight(armature_name=base_armature_name, ignore=root_name)
     tools.common.set_default_stage()
 
     # Fix armature name
     tools.common.fix_armature_names(armature_name=base_armature_name)
+
+
+class BoneMergePlan:
+    # Compares the bones of both armatures and decides which merge bones get merged into existing bones
+    # and which ones get added to the base armature, without touching either armature
+    bone_settings = ['use_deform', 'use_inherit_rotation', 'use_inherit_scale', 'use_local_location', 'use_relative_parent',
+                     'envelope_distance', 'envelope_weight', 'head_radius', 'tail_radius', 'bbone_segments', 'layers', 'hide']
+
+    def __init__(self, base_armature, merge_armature, mesh_base, mesh_merge, merge_same_bones=False, mesh_only=False, root_name='', mesh_name=None):
+        base_bones = base_armature.data.bones
+        merge_bones = merge_armature.data.bones
+        bones_to_merge = set(Bones.dont_delete_these_main_bones)
+
+        # A custom root takes the name of the merge bone with the same name
+        names = OrderedDict((bone.name, bone.name) for bone in merge_bones)
+        if root_name:
+            if root_name in names:
+                names[root_name] = root_name + '_Old'
+            bones_to_merge.add(root_name)
+        if mesh_only and mesh_name and names:
+            names[next(reversed(names))] = mesh_name
+
+        # Merge bones which are merged into a base bone: {merge bone: base bone}
+        self.merged = OrderedDict()
+        # Base bones which are replaced by the merge bone with the same name, if only the merge mesh uses them
+        self.replaced = []
+        # Merge bones which are added to the base armature: {merge bone: new name}
+        self.added = OrderedDict()
+        # New parents of the added bones: {merge bone: (merge parent, base parent)}
+        self.parents = {}
+
+        self.new_root = root_name if root_name and root_name not in base_bones else ''
+        root_parent = root_name if root_name and not self.new_root else None
+
+        for bone in merge_bones:
+            name = names[bone.name]
+            if not mesh_only and name in base_bones and (merge_same_bones or name in bones_to_merge):
+                if not merge_same_bones and mesh_merge.vertex_groups.get(bone.name) and not mesh_base.vertex_groups.get(name):
+                    self.replaced.append(name)
+                else:
+                    self.merged[bone.name] = name
+                    continue
+
+            if name in base_bones and name not in self.replaced:
+                name += '.merge'
+            self.added[bone.name] = name
+
+        for bone in merge_bones:
+            if bone.name not in self.added:
+                continue
+            parent = bone.parent
+            if mesh_only and not parent:
+                self.parents[bone.name] = (None, bone.name if bone.name in base_bones else None)
+            elif not parent:
+                self.parents[bone.name] = (None, root_parent)
+            elif parent.name in self.merged:
+                self.parents[bone.name] = (None, self.merged[parent.name])
+            else:
+                self.parents[bone.name] = (parent.name, None)
+
+    def apply(self, base_armature, merge_armature):
+        # Creates the new bones in the base armature, which has to be in edit mode.
+        # Returns {merge bone: bone name in the base armature}
+        edit_bones = base_armature.data.edit_bones
+        merge_bones = merge_armature.data.bones
+
+        # Replaced bones make room for the merge bone and get parented to it
+        replaced = {}
+        for name in self.replaced:
+            bone = edit_bones.get(name)
+            bone.name = name + '_Old'
+            replaced[name] = bone
+
+        root = None
+        if self.new_root:
+            root = edit_bones.new(self.new_root)
+            root.tail[2] += 0.1
+
+        created = OrderedDict()
+        for merge_name, name in self.added.items():
+            merge_bone = merge_bones[merge_name]
+            bone = edit_bones.new(name)
+            bone.head = merge_bone.head_local
+            bone.tail = merge_bone.tail_local
+            bone.align_roll(merge_bone.matrix_local.to_3x3().col[2])
+            for setting in self.bone_settings:
+                setattr(bone, setting, getattr(merge_bone, setting))
+            created[merge_name] = bone
+
+        for merge_name, bone in created.items():
+            merge_parent, base_parent = self.parents[merge_name]
+            if merge_parent:
+                bone.parent = created[merge_parent]
+                bone.use_connect = merge_bones[merge_name].use_connect
+            elif base_parent:
+                bone.parent = edit_bones.get(base_parent)
+            elif root:
+                bone.parent = root
+
+            old_bone = replaced.get(self.added[merge_name])
+            if old_bone:
+                bone.parent = old_bone.parent
+                old_bone.parent = bone
+
+        bone_names = OrderedDict((merge_name, bone.name) for merge_name, bone in created.items())
+        bone_names.update(self.merged)
+        return bone_names
+
+
+def rename_vertex_groups(mesh, names):
+    # Renames the vertex groups in two steps, so swapped names don't get a number added
+    groups = [(vg, names[vg.name]) for vg in mesh.vertex_groups if vg.name in names and names[vg.name] != vg.name]
+    for index, (vg, _) in enumerate(groups):
+        vg.name = '_rename_' + str(index)
+    for vg, name in groups:
+        vg.name = name
@@ -25,8 +25,10 @@
 # Edits by: GiveMeAllYourCats
 
 import bpy
+import numpy as np
 import tools.common
 import tools.eyetracking
+from collections import OrderedDict
 
 mmd_tools_installed = False
 try:
@@ -163,6 +165,78 @@ def pose_to_shapekey(name):
     return armature
 
 
+def get_scaled_shapekeys(mesh, scales):
+    # Returns {shape key name: highest scale} of all shape keys which move a vertex fully weighted to a scaled bone
+    key_blocks = mesh.data.shape_keys.key_blocks
+    vertex_count = len(mesh.data.vertices)
+    vertex_weights = tools.common.get_vertex_weights(mesh)
+
+    bone_masks = []
+    for bone_name, scale in scales.items():
+        vg = mesh.vertex_groups.get(bone_name)
+        if not vg:
+            continue
+        mask = np.zeros(vertex_count, dtype=bool)
+        mask[vertex_weights.vertex_indices[(vertex_weights.group_indices == vg.index) & (vertex_weights.weights == 1)]] = True
+        if mask.any():
+            bone_masks.append((mask, scale))
+
+    shapekey_scales = {}
+    if not bone_masks:
+        return shapekey_scales
+
+    basis = np.empty(vertex_count * 3, dtype=np.float32)
+    coords = np.empty(vertex_count * 3, dtype=np.float32)
+    key_blocks[0].data.foreach_get('co', basis)
+    for shapekey in key_blocks[1:]:
+        shapekey.data.foreach_get('co', coords)
+        moved = np.any((coords != basis).reshape(-1, 3), axis=1)
+        key_scales = [scale for mask, scale in bone_masks if np.any(moved & mask)]
+        if key_scales:
+            shapekey_scales[shapekey.name] = max(key_scales)
+    return shapekey_scales
+
+
+def scale_shapekeys(mesh, shapekey_scales):
+    # Scales the offset of every shape key to its relative key in place.
+    # Shape keys relative to a scaled shape key are moved along with it, so their own offset stays the same
+    key_blocks = mesh.data.shape_keys.key_blocks
+    vertex_count = len(mesh.data.vertices)
+
+    def relative_chain(shapekey):
+        chain = [shapekey]
+        while chain[-1].relative_key != chain[-1] and chain[-1].relative_key not in chain:
+            chain.append(chain[-1].relative_key)
+        return chain
+
+    changed_keys = []
+    for shapekey in key_blocks[1:]:
+        chain = relative_chain(shapekey)
+        if any(key.name in shapekey_scales for key in chain[:-1]):
+            changed_keys.append((len(chain), shapekey))
+    changed_keys.sort(key=lambda item: item[0])
+
+    # Read all involved shape keys before writing, so every offset is taken from the old data
+    original = {}
+    for _, shapekey in changed_keys:
+        for key in (shapekey, shapekey.relative_key):
+            if key.name not in original:
+                original[key.name] = np.empty(vertex_count * 3, dtype=np.float32)
+                key.data.foreach_get('co', original[key.name])
+
+    new = {}
+    for _, shapekey in changed_keys:
+        relative_name = shapekey.relative_key.name
+        offset = original[shapekey.name] - original[relative_name]
+        offset *= min(shapekey_scales.get(shapekey.name, 1), 10)
+        new[shapekey.name] = new.get(relative_name, original[relative_name]) + offset
+
+    for name, coords in new.items():
+        key_blocks[name].data.foreach_set('co', coords)
+        if name in shapekey_scales:
+            print('Fixed shapekey', name)
+
+
 class PoseToRest(bpy.types.Operator):
     bl_idname = 'armature_manual.pose_to_rest'
     bl_label = 'Apply as Rest Pose'
@@ -216,61 +290,17 @@ class PoseToRest(bpy.types.Operator):
             bpy.ops.object.shape_key_to_basis()
 
             # Remove old basis shape key from shape_key_to_basis operation
-            for index in range(len(mesh.data.shape_keys.key_blocks) - 1, 0, -1):
-                mesh.active_shape_key_index = index
-                if 'PoseToRest - Reverted' in mesh.active_shape_key.name:
-                    bpy.ops.object.shape_key_remove(all=False)
+            for shapekey in reversed(mesh.data.shape_keys.key_blocks[1:]):
+                if 'PoseToRest - Reverted' in shapekey.name:
+                    mesh.shape_key_remove(shapekey)
 
             mesh.active_shape_key_index = 0
 
-            # Find out which bones scale which shapekeys and set it to the highest scale
+            # Find out which bones scale which shapekeys and scale them by the highest scale
             print('\nSCALED BONES:')
-            shapekey_scales = {}
             for bone_name, scale in scales.items():
                 print(bone_name, scale)
-                vg = mesh.vertex_groups.get(bone_name)
-                if not vg:
-                    continue
-
-                for vertex in mesh.data.vertices:
-                    for g in vertex.groups:
-                        if g.group == vg.index and g.weight == 1:
-                            for i, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-                                if i == 0:
-                                    continue
-
-                                if shapekey.data[vertex.index].co != mesh.data.shape_keys.key_blocks[0].data[vertex.index].co:
-                                    if shapekey.name in shapekey_scales:
-                                        shapekey_scales[shapekey.name] = max(shapekey_scales[shapekey.name], scale)
-                                    else:
-                                        shapekey_scales[shapekey.name] = scale
-                            break
-
-            # Mix every shape keys with itself with the slider set to the new scale
-            for index in range(0, len(mesh.data.shape_keys.key_blocks)):
-                mesh.active_shape_key_index = index
-                shapekey = mesh.active_shape_key
-                if shapekey.name in shapekey_scales:
-                    print('Fixed shapekey', shapekey.name)
-                    shapekey.slider_max = min(shapekey_scales[shapekey.name], 10)
-                    shapekey.value = shapekey.slider_max
-                    mesh.shape_key_add(name=shapekey.name + '-New', from_mix=True)
-                    shapekey.value = 0
-
-            # Remove all the old shapekeys
-            for index in reversed(range(0, len(mesh.data.shape_keys.key_blocks))):
-                mesh.active_shape_key_index = index
-                shapekey = mesh.active_shape_key
-                if shapekey.name in shapekey_scales:
-                    bpy.ops.object.shape_key_remove(all=False)
-
-            # Fix the names of the new shapekeys
-            for index, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-                if shapekey and shapekey.name.endswith('-New'):
-                    shapekey.name = shapekey.name[:-4]
-
-            # Repair important shape key order
-            tools.common.repair_shapekey_order(mesh.name)
+            scale_shapekeys(mesh, get_scaled_shapekeys(mesh, scales))
 
         # Stop pose mode after operation
         bpy.ops.armature_manual.stop_pose_mode()
@@ -382,6 +412,13 @@ class SeparateByLooseParts(bpy.types.Operator):
                      'This acts like separating by materials but creates more meshes for more precision'
     bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
 
+    min_vertices = bpy.props.IntProperty(
+        name='Minimum Vertices',
+        description='Loose parts with less vertices are merged into one mesh per material',
+        default=4,
+        min=0
+    )
+
     @classmethod
     def poll(cls, context):
         obj = context.active_object
@@ -407,7 +444,7 @@ class SeparateByLooseParts(bpy.types.Operator):
                 return {'FINISHED'}
             obj = meshes[0]
 
-        tools.common.separate_by_loose_parts(context, obj)
+        tools.common.separate_by_loose_parts(context, obj, min_vertices=self.min_vertices)
 
         self.report({'INFO'}, 'Successfully separated by loose parts.')
         return {'FINISHED'}
@@ -459,32 +496,17 @@ class MergeWeights(bpy.types.Operator):
         for edit_bone in self._armature.data.edit_bones:
             bone_name_to_edit_bone[edit_bone.name] = edit_bone
 
+        # Parent of every removed bone. Weights of chains of removed bones end up in the first remaining parent
+        weight_merges = OrderedDict()
         for bone_name_to_remove in self._bone_names_to_work_on:
             if bone_name_to_edit_bone[bone_name_to_remove].parent is None:
                 continue
-            bone_name_to_add_weights_to = bone_name_to_edit_bone[bone_name_to_remove].parent.name
+            weight_merges[bone_name_to_remove] = bone_name_to_edit_bone[bone_name_to_remove].parent.name
             self._armature.data.edit_bones.remove(bone_name_to_edit_bone[bone_name_to_remove])  # delete bone
 
-            for object in self._objects_to_work_on:
-
-                vertex_group_to_remove = object.vertex_groups.get(bone_name_to_remove)
-                vertex_group_to_add_weights_to = object.vertex_groups.get(bone_name_to_add_weights_to)
-
-                if vertex_group_to_remove is not None:
-
-                    if vertex_group_to_add_weights_to is None:
-                        vertex_group_to_add_weights_to = object.vertex_groups.new(bone_name_to_add_weights_to)
-
-                    for vertex in object.data.vertices:  # transfer weight for each vertex
-                        weight_to_transfer = 0
-                        for group in vertex.groups:
-                            if group.group == vertex_group_to_remove.index:
-                                weight_to_transfer = group.weight
-                                break
-                        if weight_to_transfer > 0:
-                            vertex_group_to_add_weights_to.add([vertex.index], weight_to_transfer, 'ADD')
-
-                    object.vertex_groups.remove(vertex_group_to_remove)  # delete vertex group
+        for object in self._objects_to_work_on:
+            if object.type == 'MESH':
+                tools.common.merge_weights(object, weight_merges, create_targets=True)
 
         armature_edit_mode.restore()
 
@@ -27,6 +27,7 @@
 import bpy
 import globs
 import tools.common
+from collections import OrderedDict
 
 # wm = bpy.context.window_manager
 # wm.progress_begin(0, len(bone_merge))
@@ -55,90 +56,70 @@ class BoneMergeButton(bpy.types.Operator):
         ratio = context.scene.merge_ratio
         print(ratio)
 
-        did = 0
-        todo = 0
-        for bone_name in parent_bones:
-            bone = armature.data.bones.get(bone_name)
-            if bone is None:
-                continue
-
-            for child in bone.children:
-                todo += 1
+        # Find out which bones get merged before changing anything
+        bone_merges = plan_bone_merges(armature, parent_bones, ratio)
 
         wm = bpy.context.window_manager
-        wm.progress_begin(did, todo)
-
-        # Start the bone check for every parent
-        for bone_name in parent_bones:
-            print('')
-            print('PARENT: ' + bone_name)
-            bone = armature.data.bones.get(bone_name)
-            if bone is None:
-                continue
-
-            children = []
-            for child in bone.children:
-                children.append(child.name)
-
-            for child_name in children:
-                child = armature.data.bones.get(child_name)
-                print('CHILD: ' + child.name)
-                self.check_bone(mesh, child, ratio, ratio)
-                did += 1
-                wm.progress_update(did)
+        wm.progress_begin(0, 2)
 
-        wm.progress_end()
-        self.report({'INFO'}, 'Merged bones.')
-        return {'FINISHED'}
+        # Mix the weights of all merged bones at once
+        weight_merges = OrderedDict()
+        for bone_name, target_name in bone_merges.items():
+            if mesh.vertex_groups.get(bone_name) is not None and mesh.vertex_groups.get(target_name) is not None:
+                weight_merges[bone_name] = target_name
 
-    # Go through this until the last child is reached
-    def check_bone(self, mesh, bone, ratio, i):
-        if bone is None:
-            print('END FOUND')
-            return
+        tools.common.select(mesh)
+        tools.common.merge_weights(mesh, weight_merges)
+        wm.progress_update(1)
 
-        # Increase number by the ratio
-        i += ratio
-        bone_name = bone.name
+        # We are done, remove all merged bones
+        armature = tools.common.set_default_stage()
+        tools.common.switch('EDIT')
+        for bone_name in bone_merges:
+            bone = armature.data.edit_bones.get(bone_name)
+            if bone is not None:
+                armature.data.edit_bones.remove(bone)
+        tools.common.set_default_stage()
+        wm.progress_update(2)
 
-        # Get all children names
-        children = []
-        for child in bone.children:
-            children.append(child.name)
+        wm.progress_end()
+        self.report({'INFO'}, 'Merged bones.')
+        return {'FINISHED'}
 
-        # Check if bone will be merged
-        if i >= 100:
-            i -= 100
 
-            if bone.parent is not None:
-                parent_name = bone.parent.name
+# Returns {bone name: target bone name} for every bone that gets merged, without changing the armature.
+# The ratio is added up along each chain starting at the children of the parent bones, and every time it reaches 100
+# the bone gets merged into its parent. The target is the first ancestor that is not merged itself
+def plan_bone_merges(armature, parent_bones, ratio):
+    bone_merges = OrderedDict()
 
-                print('Merging ' + bone_name + ' into ' + parent_name+ ' with ratio ' + str(i) )
+    # Start the bone check for every parent
+    for bone_name in parent_bones:
+        print('')
+        print('PARENT: ' + bone_name)
+        bone = armature.data.bones.get(bone_name)
+        if bone is None:
+            continue
 
-                # # Set new parent bone position
-                # armature = tools.common.set_default_stage()
-                # tools.common.switch('EDIT')
-                #
-                # child = armature.data.edit_bones.get(bone_name)
-                # parent = armature.data.edit_bones.get(parent_name)
-                # parent.tail = child.tail
+        # Go through this until the last child is reached, parents are always checked before their children
+        to_check = [(child, ratio) for child in reversed(bone.children)]
+        while to_check:
+            bone, i = to_check.pop()
 
-                # Mix the weights
-                tools.common.set_default_stage()
-                tools.common.select(mesh)
+            # Increase number by the ratio
+            i += ratio
 
-                vg = mesh.vertex_groups.get(bone_name)
-                vg2 = mesh.vertex_groups.get(parent_name)
-                if vg is not None and vg2 is not None:
-                    tools.common.mix_weights(mesh, bone_name, parent_name)
+            # Check if bone will be merged
+            if i >= 100:
+                i -= 100
 
-                tools.common.set_default_stage()
+                if bone.parent is not None:
+                    parent_name = bone.parent.name
+                    target_name = bone_merges.get(parent_name, parent_name)
+                    print('Merging ' + bone.name + ' into ' + target_name + ' with ratio ' + str(i))
+                    bone_merges[bone.name] = target_name
 
-                # We are done, remove the bone
-                tools.common.remove_bone(bone_name)
+            for child in reversed(bone.children):
+                to_check.append((child, i))
 
-        armature = tools.common.set_default_stage()
-        for child in children:
-            bone = armature.data.bones.get(child)
-            if bone is not None:
-                self.check_bone(mesh, bone, ratio, i)
+    return bone_merges
@@ -33,7 +33,9 @@ import tools.supporter
 import tools.decimation
 import tools.translate
 import tools.armature_bones as Bones
-from mathutils import Vector
+from mathutils import Vector, Matrix
+from mathutils.kdtree import KDTree
+from bpy.app.handlers import persistent
 from math import degrees
 from collections import OrderedDict
 
@@ -139,6 +141,50 @@ def remove_empty():
         tools.common.unselect_all()
 
 
+class NameIndex:
+    # Case insensitive name lookup for edit bones or vertex groups.
+    # Renames, additions and removals have to go through the index to keep it up to date.
+    # Like a linear search, it returns the first item in collection order if several names only differ in case
+    def __init__(self, collection):
+        self.collection = collection
+        self.names = {}
+        self.positions = {}
+        self.next_position = 0
+        for item in collection:
+            self.add(item.name)
+
+    def get(self, name):
+        names = self.names.get(name.lower())
+        if not names:
+            return None
+        return self.collection.get(names[0])
+
+    def add(self, name, position=None):
+        # New items are added at the end of the collection, renamed ones keep their position
+        if position is None:
+            position = self.next_position
+            self.next_position += 1
+        self.positions[name] = position
+        names = self.names.setdefault(name.lower(), [])
+        names.append(name)
+        names.sort(key=lambda n: self.positions[n])
+
+    def remove(self, name):
+        position = self.positions.pop(name, None)
+        names = self.names.get(name.lower())
+        if names and name in names:
+            names.remove(name)
+            if not names:
+                del self.names[name.lower()]
+        return position
+
+    def rename(self, item, new_name):
+        old_name = item.name
+        item.name = new_name
+        if item.name != old_name:
+            self.add(item.name, position=self.remove(old_name))
+
+
 def get_bone_angle(p1, p2):
     try:
         ret = degrees((p1.head - p1.tail).angle(p2.head - p2.tail))
@@ -148,21 +194,169 @@ def get_bone_angle(p1, p2):
     return ret
 
 
+# All object caches, their entries get removed by the scene update handler when the object data is edited
+object_caches = []
+
+
+class ObjectCache:
+    # Values per object name, reused until their signature changes or the object data gets edited
+    def __init__(self):
+        self.entries = {}
+        object_caches.append(self)
+
+    def get(self, obj, signature):
+        cached = self.entries.get(obj.name)
+        if cached and cached[0] == signature:
+            return cached[1]
+        return None
+
+    def set(self, obj, signature, value):
+        self.entries[obj.name] = (signature, value)
+
+        # Edits by the user are detected by the scene update handler
+        if clear_edited_object_caches not in bpy.app.handlers.scene_update_post:
+            bpy.app.handlers.scene_update_post.append(clear_edited_object_caches)
+
+    def invalidate(self, obj=None):
+        if obj is None:
+            self.entries.clear()
+            return
+        self.entries.pop(obj.name, None)
+
+
+def clear_edited_object_caches(scene):
+    for cache in object_caches:
+        for name in list(cache.entries.keys()):
+            obj = bpy.data.objects.get(name)
+            if not obj or obj.is_updated_data:
+                cache.entries.pop(name)
+
+    if not any(cache.entries for cache in object_caches):
+        bpy.app.handlers.scene_update_post.remove(clear_edited_object_caches)
+
+
+# Vertex group weights of the meshes, reused until the mesh or its vertex groups change
+vertex_weights_cache = ObjectCache()
+
+
+class VertexWeights:
+    # All vertex group weights of a mesh, read in one pass.
+    # The weights are stored row by row per vertex (CSR): the entries of vertex i are in [offsets[i]:offsets[i + 1]]
+    def __init__(self, mesh):
+        vertices = mesh.data.vertices
+        self.vertex_count = len(vertices)
+        self.group_count = len(mesh.vertex_groups)
+
+        row_lengths = []
+        entries = []
+        for vert in vertices:
+            groups = vert.groups
+            row_lengths.append(len(groups))
+            entries.extend([(g.group, g.weight) for g in groups])
+
+        self.offsets = np.zeros(self.vertex_count + 1, dtype=np.int64)
+        np.cumsum(row_lengths, out=self.offsets[1:])
+        self.vertex_indices = np.repeat(np.arange(self.vertex_count, dtype=np.int32), row_lengths)
+        entries = np.array(entries, dtype=np.float64).reshape(-1, 2)
+        self.group_indices = entries[:, 0].astype(np.int32)
+        self.weights = entries[:, 1].astype(np.float32)
+
+        self.coords = np.empty(self.vertex_count * 3, dtype=np.float32)
+        vertices.foreach_get('co', self.coords)
+        self.coords.shape = (self.vertex_count, 3)
+
+        # Statistics per vertex group
+        self.member_counts = self.count_per_group(self.group_indices)
+        self.used_counts = self.count_per_group(self.group_indices[self.weights > 0])
+        self.sums = self.count_per_group(self.group_indices, weights=self.weights)
+
+        member_coords = self.coords[self.vertex_indices]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.centroids = np.column_stack([self.count_per_group(self.group_indices, weights=member_coords[:, axis]) for axis in range(3)])
+            self.centroids /= self.member_counts[:, None]
+
+        self.tree = None
+
+    def count_per_group(self, group_indices, weights=None):
+        return np.bincount(group_indices, weights=weights, minlength=self.group_count)[:self.group_count]
+
+    def used_groups(self, threshold=0):
+        # Returns a bool array which is True for every group with at least one weight above the threshold
+        if threshold == 0:
+            return self.used_counts > 0
+        return self.count_per_group(self.group_indices[self.weights > threshold]) > 0
+
+    def group_vertices(self, mask=None):
+        # Returns {group index: vertex indices} of all entries selected by the mask
+        group_indices = self.group_indices
+        vertex_indices = self.vertex_indices
+        if mask is not None:
+            group_indices = group_indices[mask]
+            vertex_indices = vertex_indices[mask]
+
+        order = np.argsort(group_indices, kind='mergesort')
+        group_indices = group_indices[order]
+        vertex_indices = vertex_indices[order]
+
+        groups, starts = np.unique(group_indices, return_index=True)
+        return {int(group): indices for group, indices in zip(groups, np.split(vertex_indices, starts[1:]))}
+
+    def centroid(self, group_index):
+        if group_index >= self.group_count or self.member_counts[group_index] == 0:
+            return None
+        return Vector(self.centroids[group_index])
+
+    def last_vertex(self, group_index):
+        # Returns the highest vertex index in the group or None
+        vertex_indices = self.vertex_indices[self.group_indices == group_index]
+        if len(vertex_indices) == 0:
+            return None
+        return int(vertex_indices.max())
+
+    def kdtree(self):
+        # Spatial index of the vertex positions, built on first use and cached together with the weights
+        if self.tree is None:
+            self.tree = KDTree(self.vertex_count)
+            for index, co in enumerate(self.coords.tolist()):
+                self.tree.insert(co, index)
+            self.tree.balance()
+        return self.tree
+
+    def vertices_at(self, co, distance=1e-6):
+        # Returns the sorted indices of all vertices at exactly this position
+        found = np.array(sorted(index for _, index, _ in self.kdtree().find_range(co, distance)), dtype=np.int64)
+        if len(found) == 0:
+            return found
+        return found[np.all(self.coords[found] == np.asarray(co, dtype=np.float32), axis=1)]
+
+
+def get_vertex_weights(mesh):
+    if mesh.mode == 'EDIT':
+        mesh.update_from_editmode()
+
+    signature = (mesh.as_pointer(), mesh.data.as_pointer(), len(mesh.data.vertices), tuple(vg.name for vg in mesh.vertex_groups))
+    weights = vertex_weights_cache.get(mesh, signature)
+    if weights is None:
+        weights = VertexWeights(mesh)
+        vertex_weights_cache.set(mesh, signature, weights)
+    return weights
+
+
+def invalidate_vertex_weights(mesh=None):
+    # Has to be called after changing vertex weights without changing the vertex groups
+    vertex_weights_cache.invalidate(mesh)
+
+
 def remove_unused_vertex_groups(ignore_main_bones=False):
     unselect_all()
     for ob in bpy.data.objects:
         if ob.type == 'MESH':
             ob.update_from_editmode()
 
-            vgroup_used = {i: False for i, k in enumerate(ob.vertex_groups)}
-
-            for v in ob.data.vertices:
-                for g in v.groups:
-                    if g.weight > 0.0:
-                        vgroup_used[g.group] = True
+            used = get_vertex_weights(ob).used_groups()
 
-            for i, used in sorted(vgroup_used.items(), reverse=True):
-                if not used:
+            for i in reversed(range(len(ob.vertex_groups))):
+                if not used[i]:
                     if ignore_main_bones and ob.vertex_groups[i].name in Bones.dont_delete_these_main_bones:
                         continue
                     ob.vertex_groups.remove(ob.vertex_groups[i])
@@ -171,32 +365,61 @@ def remove_unused_vertex_groups(ignore_main_bones=False):
 def find_center_vector_of_vertex_group(mesh_name, vertex_group):
     mesh = bpy.data.objects[mesh_name]
 
-    data = mesh.data
-    verts = data.vertices
-    verts_in_group = []
-
-    for vert in verts:
-        i = vert.index
-        try:
-            mesh.vertex_groups[vertex_group].weight(i)
-            verts_in_group.append(vert)
-        except RuntimeError:
-            # vertex is not in the group
-            pass
-
     # Find the average vector point of the vertex cluster
-    divide_by = len(verts_in_group)
-    total = Vector()
-
-    if divide_by == 0:
+    average = get_vertex_weights(mesh).centroid(mesh.vertex_groups[vertex_group].index)
+    if average is None:
         return False
 
-    for vert in verts_in_group:
-        total += vert.co
+    return average
 
-    average = total / divide_by
 
-    return average
+# Cache of the dynamic EnumProperty items, so that redrawing the panels doesn't rebuild and sort them every time.
+# The generation is increased by invalidate_enums(), which has to be called by every operator that adds, removes or
+# renames objects, bones or shape keys before it sets one of the enum properties
+enum_cache = {}
+enum_generation = 0
+
+
+def invalidate_enums():
+    global enum_generation
+    enum_generation += 1
+
+
+def cached_enum(key, signature, build):
+    # The signature holds cheap checks like the bone count, to notice changes made between two invalidations
+    cached = enum_cache.get(key)
+    if cached and cached[0] == enum_generation and cached[1] == signature:
+        return cached[2]
+
+    items = build()
+    enum_cache[key] = (enum_generation, signature, items)
+
+    if clear_edited_enums not in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.append(clear_edited_enums)
+        bpy.app.handlers.load_post.append(reset_enums)
+        bpy.app.handlers.undo_post.append(reset_enums)
+        bpy.app.handlers.redo_post.append(reset_enums)
+    return items
+
+
+@persistent
+def clear_edited_enums(scene):
+    if bpy.data.objects.is_updated or bpy.data.armatures.is_updated or bpy.data.meshes.is_updated or bpy.data.shape_keys.is_updated:
+        invalidate_enums()
+
+
+@persistent
+def reset_enums(scene):
+    invalidate_enums()
+
+
+def remove_enum_handlers():
+    if clear_edited_enums in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.remove(clear_edited_enums)
+    for handlers in [bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post]:
+        if reset_enums in handlers:
+            handlers.remove(reset_enums)
+    enum_cache.clear()
 
 
 def get_meshes(self, context):
@@ -204,94 +427,99 @@ def get_meshes(self, context):
     # 0 = With Armature only
     # 1 = Without armature only
     # 2 = All meshes
-
-    choices = []
-
-    for mesh in get_meshes_objects(mode=0):
-        choices.append((mesh.name, mesh.name, mesh.name))
-
-    bpy.types.Object.Enum = sorted(choices, key=lambda x: tuple(x[0].lower()))
-    return bpy.types.Object.Enum
+    return get_mesh_list(0)
 
 
 def get_top_meshes(self, context):
-    choices = []
+    return get_mesh_list(1)
 
-    for mesh in get_meshes_objects(mode=1):
-        choices.append((mesh.name, mesh.name, mesh.name))
 
-    bpy.types.Object.Enum = sorted(choices, key=lambda x: tuple(x[0].lower()))
-    return bpy.types.Object.Enum
+def get_all_meshes(self, context):
+    return get_mesh_list(2)
 
 
-def get_all_meshes(self, context):
-    choices = []
+def get_mesh_list(mode):
+    def build():
+        choices = []
 
-    for mesh in get_meshes_objects(mode=2):
-        choices.append((mesh.name, mesh.name, mesh.name))
+        for mesh in get_meshes_objects(mode=mode):
+            choices.append((mesh.name, mesh.name, mesh.name))
 
-    bpy.types.Object.Enum = sorted(choices, key=lambda x: tuple(x[0].lower()))
+        return sorted(choices, key=lambda x: tuple(x[0].lower()))
+
+    bpy.types.Object.Enum = cached_enum(('meshes', mode, bpy.context.scene.armature), len(bpy.data.objects), build)
     return bpy.types.Object.Enum
 
 
 def get_armature_list(self, context):
-    choices = []
+    def build():
+        choices = []
+
+        for object in context.scene.objects:
+            if object.type == 'ARMATURE':
+                # 1. Will be returned by context.scene
+                # 2. Will be shown in lists
+                # 3. will be shown in the hover description (below description)
 
-    for object in context.scene.objects:
-        if object.type == 'ARMATURE':
-            # 1. Will be returned by context.scene
-            # 2. Will be shown in lists
-            # 3. will be shown in the hover description (below description)
+                # Set name displayed in list
+                name = object.data.name
+                if name.startswith('Armature ('):
+                    name = object.name + ' (' + name.replace('Armature (', '')[:-1] + ')'
 
-            # Set name displayed in list
-            name = object.data.name
-            if name.startswith('Armature ('):
-                name = object.name + ' (' + name.replace('Armature (', '')[:-1] + ')'
+                choices.append((object.name, name, object.name))
 
-            choices.append((object.name, name, object.name))
+        if len(choices) == 0:
+            choices.append(('None', 'None', 'None'))
 
-    if len(choices) == 0:
-        choices.append(('None', 'None', 'None'))
+        return sorted(choices, key=lambda x: tuple(x[0].lower()))
 
-    bpy.types.Object.Enum = sorted(choices, key=lambda x: tuple(x[0].lower()))
+    bpy.types.Object.Enum = cached_enum(('armatures', context.scene.name), len(context.scene.objects), build)
     return bpy.types.Object.Enum
 
 
 def get_armature_merge_list(self, context):
-    choices = []
     current_armature = context.scene.merge_armature_into
 
-    for obj in context.scene.objects:
-        if obj.type == 'ARMATURE' and obj.name != current_armature:
-            # 1. Will be returned by context.scene
-            # 2. Will be shown in lists
-            # 3. will be shown in the hover description (below description)
+    def build():
+        choices = []
+
+        for obj in context.scene.objects:
+            if obj.type == 'ARMATURE' and obj.name != current_armature:
+                # 1. Will be returned by context.scene
+                # 2. Will be shown in lists
+                # 3. will be shown in the hover description (below description)
+
+                # Set name displayed in list
+                name = obj.data.name
+                if name.startswith('Armature ('):
+                    name = obj.name + ' (' + name.replace('Armature (', '')[:-1] + ')'
 
-            # Set name displayed in list
-            name = obj.data.name
-            if name.startswith('Armature ('):
-                name = obj.name + ' (' + name.replace('Armature (', '')[:-1] + ')'
+                choices.append((obj.name, name, obj.name))
 
-            choices.append((obj.name, name, obj.name))
+        return sorted(choices, key=lambda x: tuple(x[0].lower()))
 
-    bpy.types.Object.Enum = sorted(choices, key=lambda x: tuple(x[0].lower()))
+    bpy.types.Object.Enum = cached_enum(('armatures_merge', context.scene.name, current_armature), len(context.scene.objects), build)
     return bpy.types.Object.Enum
 
 
 def get_meshes_decimation(self, context):
-    choices = []
+    def build():
+        choices = []
 
-    for object in bpy.context.scene.objects:
-        if object.type == 'MESH':
-            if object.parent is not None and object.parent.type == 'ARMATURE' and object.parent.name == bpy.context.scene.armature:
-                if object.name in tools.decimation.ignore_meshes:
-                    continue
-                # 1. Will be returned by context.scene
-                # 2. Will be shown in lists
-                # 3. will be shown in the hover description (below description)
-                choices.append((object.name, object.name, object.name))
+        for object in bpy.context.scene.objects:
+            if object.type == 'MESH':
+                if object.parent is not None and object.parent.type == 'ARMATURE' and object.parent.name == bpy.context.scene.armature:
+                    if object.name in tools.decimation.ignore_meshes:
+                        continue
+                    # 1. Will be returned by context.scene
+                    # 2. Will be shown in lists
+                    # 3. will be shown in the hover description (below description)
+                    choices.append((object.name, object.name, object.name))
+
+        return sorted(choices, key=lambda x: tuple(x[0].lower()))
 
-    bpy.types.Object.Enum = sorted(choices, key=lambda x: tuple(x[0].lower()))
+    signature = (len(bpy.context.scene.objects), tuple(tools.decimation.ignore_meshes))
+    bpy.types.Object.Enum = cached_enum(('meshes_decimation', bpy.context.scene.armature), signature, build)
     return bpy.types.Object.Enum
 
 
@@ -318,38 +546,42 @@ def get_bones(names=None, armature_name=None):
     if not armature_name:
         armature_name = bpy.context.scene.armature
 
-    choices = []
     armature = get_armature(armature_name=armature_name)
 
     if not armature:
-        bpy.types.Object.Enum = choices
+        bpy.types.Object.Enum = []
         return bpy.types.Object.Enum
 
-    # print("")
-    # print("START DEBUG UNICODE")
-    # print("")
-    for bone in armature.data.bones:
-        # print(bone.name)
-        try:
-            # 1. Will be returned by context.scene
-            # 2. Will be shown in lists
-            # 3. will be shown in the hover description (below description)
-            choices.append((bone.name, bone.name, bone.name))
-        except UnicodeDecodeError:
-            print("ERROR", bone.name)
+    def build():
+        choices = []
+
+        # print("")
+        # print("START DEBUG UNICODE")
+        # print("")
+        for bone in armature.data.bones:
+            # print(bone.name)
+            try:
+                # 1. Will be returned by context.scene
+                # 2. Will be shown in lists
+                # 3. will be shown in the hover description (below description)
+                choices.append((bone.name, bone.name, bone.name))
+            except UnicodeDecodeError:
+                print("ERROR", bone.name)
 
-    choices.sort(key=lambda x: tuple(x[0].lower()))
+        choices.sort(key=lambda x: tuple(x[0].lower()))
 
-    choices2 = []
-    for name in names:
-        if name in armature.data.bones and choices[0][0] != name:
-            choices2.append((name, name, name))
+        choices2 = []
+        for name in names:
+            if name in armature.data.bones and choices[0][0] != name:
+                choices2.append((name, name, name))
 
-    for choice in choices:
-        choices2.append(choice)
+        for choice in choices:
+            choices2.append(choice)
 
-    bpy.types.Object.Enum = choices2
+        return choices2
 
+    signature = (armature.as_pointer(), armature.data.as_pointer(), len(armature.data.bones))
+    bpy.types.Object.Enum = cached_enum(('bones', armature_name, tuple(names)), signature, build)
     return bpy.types.Object.Enum
 
 
@@ -394,9 +626,6 @@ def get_shapekeys_decimation_list(self, context):
 # names - The first object will be the first one in the list. So the first one has to be the one that exists in the most models
 # no_basis - If this is true the Basis will not be available in the list
 def get_shapekeys(context, names, is_mouth, no_basis, decimation, return_list):
-    choices = []
-    choices_simple = []
-
     if is_mouth:
         meshes = [bpy.data.objects.get(context.scene.mesh_name_viseme)]
     else:
@@ -405,42 +634,57 @@ def get_shapekeys(context, names, is_mouth, no_basis, decimation, return_list):
     if decimation:
         meshes = get_meshes_objects()
 
-    for mesh in meshes:
-        if not mesh or not tools.common.has_shapekeys(mesh):
-            bpy.types.Object.Enum = choices
-            return bpy.types.Object.Enum
+    def build():
+        choices = []
+        choices_simple = []
 
-        for shapekey in mesh.data.shape_keys.key_blocks:
-            name = shapekey.name
-            if name in choices_simple:
-                continue
-            if no_basis and name == 'Basis':
-                continue
-            if decimation and name in tools.decimation.ignore_shapes:
-                continue
-            # 1. Will be returned by context.scene
-            # 2. Will be shown in lists
-            # 3. will be shown in the hover description (below description)
-            choices.append((name, name, name))
-            choices_simple.append(name)
-
-    choices.sort(key=lambda x: tuple(x[0].lower()))
-
-    choices2 = []
-    for name in names:
-        if name in choices_simple and len(choices) > 1 and choices[0][0] != name:
-            if decimation and name in tools.decimation.ignore_shapes:
-                continue
-            choices2.append((name, name, name))
+        for mesh in meshes:
+            if not mesh or not tools.common.has_shapekeys(mesh):
+                return choices
 
-    for choice in choices:
-        choices2.append(choice)
+            for shapekey in mesh.data.shape_keys.key_blocks:
+                name = shapekey.name
+                if name in choices_simple:
+                    continue
+                if no_basis and name == 'Basis':
+                    continue
+                if decimation and name in tools.decimation.ignore_shapes:
+                    continue
+                # 1. Will be returned by context.scene
+                # 2. Will be shown in lists
+                # 3. will be shown in the hover description (below description)
+                choices.append((name, name, name))
+                choices_simple.append(name)
+
+        choices.sort(key=lambda x: tuple(x[0].lower()))
+
+        choices2 = []
+        for name in names:
+            if name in choices_simple and len(choices) > 1 and choices[0][0] != name:
+                if decimation and name in tools.decimation.ignore_shapes:
+                    continue
+                choices2.append((name, name, name))
 
-    bpy.types.Object.Enum = choices2
+        for choice in choices:
+            choices2.append(choice)
+
+        return choices2
+
+    signature = []
+    for mesh in meshes:
+        if not mesh or not tools.common.has_shapekeys(mesh):
+            signature.append(None)
+            continue
+        signature.append((mesh.as_pointer(), mesh.data.shape_keys.as_pointer(), len(mesh.data.shape_keys.key_blocks)))
+    if decimation:
+        signature.append(tuple(tools.decimation.ignore_shapes))
+
+    key = ('shapekeys', tuple(names), is_mouth, no_basis, decimation, tuple(mesh.name if mesh else None for mesh in meshes))
+    bpy.types.Object.Enum = cached_enum(key, tuple(signature), build)
 
     if return_list:
         shape_list = []
-        for choice in choices2:
+        for choice in bpy.types.Object.Enum:
             shape_list.append(choice[0])
         return shape_list
 
@@ -461,6 +705,7 @@ def fix_armature_names(armature_name=None):
         armature.data.name = 'Armature (' + tools.translate.translate(armature.data.name, add_space=True)[0] + ')'
 
     # Reset the armature lists
+    invalidate_enums()
     try:
         bpy.context.scene.armature = armature.name
     except TypeError:
@@ -542,19 +787,18 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
     set_default_stage()
     unselect_all()
 
+    # Only the armature and the meshes which are not joined need the operator, the joined meshes get their transforms baked in while joining.
+    # A single mesh has nothing to join with and keeps its data
     if apply_transformations:
-        apply_transforms(armature_name=armature_name)
+        apply_transforms(armature_name=armature_name,
+                         meshes=[mesh for mesh in meshes if len(meshes_to_join) == 1 or mesh.name not in meshes_to_join])
 
     unselect_all()
 
-    # Apply existing decimation modifiers and select the meshes for joining
+    # Apply existing decimation modifiers
     for mesh in meshes:
         if mesh.name in meshes_to_join:
-            mesh.select = True
-            bpy.context.scene.objects.active = mesh
-
-            # Apply decimation modifiers
-            for mod in mesh.modifiers:
+            for mod in list(mesh.modifiers):
                 if mod.type == 'DECIMATE':
                     if mod.decimate_type == 'COLLAPSE' and mod.ratio == 1:
                         mesh.modifiers.remove(mod)
@@ -564,8 +808,8 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
                         continue
 
                     if tools.common.has_shapekeys(mesh):
-                        bpy.ops.object.shape_key_remove(all=True)
-                    bpy.ops.object.modifier_apply(apply_as='DATA', modifier=mod.name)
+                        mesh.shape_key_clear()
+                    apply_modifier(mesh, mod)
 
             # Standardize UV maps name
             mesh.data.uv_textures[0].name = 'UVMap'
@@ -575,14 +819,16 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
                         if tex_slot and tex_slot.texture and tex_slot.texture_coords == 'UV':
                             tex_slot.uv_layer = 'UVMap'
 
-    # Join the meshes
-    if bpy.ops.object.join.poll():
-        bpy.ops.object.join()
-    else:
+    # Join the meshes into the last one, like the join operator does with the active object
+    objects = [mesh for mesh in meshes if mesh.name in meshes_to_join]
+    if not objects:
         return None
+    mesh = objects[-1]
+    if len(objects) > 1:
+        join_mesh_data(mesh, [mesh] + objects[:-1], apply_transformations=apply_transformations)
+    select(mesh)
 
     # Rename result to Body and correct modifiers
-    mesh = bpy.context.scene.objects.active
     if mesh:
         mesh.name = 'Body'
         mesh.parent_type = 'OBJECT'
@@ -611,19 +857,262 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
     return mesh
 
 
-def apply_transforms(armature_name=None):
+def apply_transforms(armature_name=None, meshes=None):
     if not armature_name:
         armature_name = bpy.context.scene.armature
+    if meshes is None:
+        meshes = get_meshes_objects(armature_name=armature_name)
 
     tools.common.unselect_all()
     tools.common.select(get_armature(armature_name=armature_name))
     bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-    for mesh in get_meshes_objects(armature_name=armature_name):
+    for mesh in meshes:
         tools.common.unselect_all()
         tools.common.select(mesh)
         bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
 
 
+def apply_modifier(mesh, modifier):
+    # Applies the modifier through the mesh data instead of selecting the mesh and using the operator.
+    # The mesh must not have shape keys
+    disabled = []
+    for mod in mesh.modifiers:
+        if mod != modifier and mod.show_viewport:
+            mod.show_viewport = False
+            disabled.append(mod)
+    modifier.show_viewport = True
+
+    data = mesh.to_mesh(bpy.context.scene, True, 'PREVIEW')
+
+    for mod in disabled:
+        mod.show_viewport = True
+    mesh.modifiers.remove(modifier)
+
+    old_data = mesh.data
+    name = old_data.name
+    mesh.data = data
+    if old_data.users == 0:
+        bpy.data.meshes.remove(old_data)
+    data.name = name
+
+
+def join_mesh_data(target, objects, apply_transformations=True):
+    # Joins the mesh data of all objects into one new mesh of the target object, the other objects get deleted.
+    # The target has to be the first object, its vertex groups, shape keys and materials come first like with the join operator.
+    # All vertex, edge, loop and polygon arrays are read once per mesh and concatenated, so the join doesn't depend on operators.
+    # If apply_transformations is set the target loses its transforms, otherwise everything gets moved into its local space
+    target.parent_type = 'OBJECT'
+    if apply_transformations:
+        target.matrix_basis = Matrix()
+    bpy.context.scene.update()
+    target_matrix = target.matrix_world.inverted()
+
+    materials = []
+    uv_names = []
+    color_names = []
+    group_names = [vg.name for vg in target.vertex_groups]
+    key_names = []
+    key_settings = {}
+    has_custom_normals = False
+    for obj in objects:
+        for slot in obj.material_slots:
+            if slot.material not in materials:
+                materials.append(slot.material)
+        uv_names.extend(layer.name for layer in obj.data.uv_layers if layer.name not in uv_names)
+        color_names.extend(layer.name for layer in obj.data.vertex_colors if layer.name not in color_names)
+        group_names.extend(vg.name for vg in obj.vertex_groups if vg.name not in group_names)
+        if has_shapekeys(obj):
+            for index, shapekey in enumerate(obj.data.shape_keys.key_blocks):
+                name = key_names[0] if index == 0 and key_names else shapekey.name
+                if name not in key_settings:
+                    key_names.append(name)
+                    key_settings[name] = (shapekey.relative_key.name, shapekey.slider_max, shapekey.slider_min, shapekey.value,
+                                          shapekey.vertex_group, shapekey.interpolation, shapekey.mute)
+        has_custom_normals = has_custom_normals or obj.data.has_custom_normals
+    if not materials and any(len(obj.data.polygons) for obj in objects):
+        materials.append(None)
+    group_lookup = {name: index for index, name in enumerate(group_names)}
+
+    def read(collection, attribute, size=1, dtype=np.float32):
+        values = np.empty(len(collection) * size, dtype=dtype)
+        collection.foreach_get(attribute, values)
+        return values.reshape(-1, size) if size > 1 else values
+
+    def transform(coords, matrix):
+        return coords.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+    parts = {name: [] for name in ['co', 'vertex_bevel_weight', 'edges', 'use_seam', 'use_edge_sharp', 'crease', 'bevel_weight',
+                                   'loop_vertices', 'loop_edges', 'loop_start', 'loop_total', 'material_index', 'use_smooth', 'normals']}
+    uvs = {name: [] for name in uv_names}
+    colors = {name: [] for name in color_names}
+    images = {name: [] for name in uv_names}
+    keys = {name: [] for name in key_names}
+    weights = ([], [], [])
+    vertex_offset = edge_offset = loop_offset = 0
+
+    for obj in objects:
+        data = obj.data
+        matrix = np.array(target_matrix * obj.matrix_world)
+        vertex_count, edge_count, loop_count = len(data.vertices), len(data.edges), len(data.loops)
+
+        co = transform(read(data.vertices, 'co', 3), matrix)
+        parts['co'].append(co)
+        parts['vertex_bevel_weight'].append(read(data.vertices, 'bevel_weight'))
+        parts['edges'].append(read(data.edges, 'vertices', 2, np.int32) + vertex_offset)
+        for attribute in ['use_seam', 'use_edge_sharp']:
+            parts[attribute].append(read(data.edges, attribute, dtype=bool))
+        for attribute in ['crease', 'bevel_weight']:
+            parts[attribute].append(read(data.edges, attribute))
+        parts['loop_vertices'].append(read(data.loops, 'vertex_index', dtype=np.int32) + vertex_offset)
+        parts['loop_edges'].append(read(data.loops, 'edge_index', dtype=np.int32) + edge_offset)
+        parts['loop_start'].append(read(data.polygons, 'loop_start', dtype=np.int32) + loop_offset)
+        parts['loop_total'].append(read(data.polygons, 'loop_total', dtype=np.int32))
+        parts['use_smooth'].append(read(data.polygons, 'use_smooth', dtype=bool))
+
+        # Material indices point to the joined material list
+        material_map = np.array([materials.index(slot.material) for slot in obj.material_slots] or [0], dtype=np.int32)
+        material_indices = np.minimum(read(data.polygons, 'material_index', dtype=np.int32), len(material_map) - 1)
+        parts['material_index'].append(material_map[material_indices])
+
+        for name in uv_names:
+            layer = data.uv_layers.get(name)
+            uvs[name].append(read(layer.data, 'uv', 2) if layer else np.zeros((loop_count, 2), dtype=np.float32))
+            texture = data.uv_textures.get(name)
+            images[name].extend([face.image for face in texture.data] if texture else [None] * len(data.polygons))
+        for name in color_names:
+            layer = data.vertex_colors.get(name)
+            colors[name].append(read(layer.data, 'color', 3) if layer else np.ones((loop_count, 3), dtype=np.float32))
+
+        if has_custom_normals:
+            data.calc_normals_split()
+            normals = read(data.loops, 'normal', 3).dot(np.linalg.inv(matrix[:3, :3]))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                normals /= np.linalg.norm(normals, axis=1)[:, None]
+            parts['normals'].append(np.nan_to_num(normals))
+            data.free_normals_split()
+
+        # Shape keys which don't exist in this mesh get the basis of it
+        if key_names:
+            own_keys = data.shape_keys.key_blocks if has_shapekeys(obj) else []
+            for index, name in enumerate(key_names):
+                shapekey = own_keys[0] if index == 0 and own_keys else (own_keys.get(name) if own_keys else None)
+                keys[name].append(transform(read(shapekey.data, 'co', 3), matrix) if shapekey else co)
+
+        if obj.vertex_groups:
+            vertex_weights = get_vertex_weights(obj)
+            group_map = np.array([group_lookup[vg.name] for vg in obj.vertex_groups], dtype=np.int32)
+            weights[0].append(group_map[vertex_weights.group_indices])
+            weights[1].append(vertex_weights.vertex_indices + vertex_offset)
+            weights[2].append(vertex_weights.weights)
+
+        vertex_offset += vertex_count
+        edge_offset += edge_count
+        loop_offset += loop_count
+
+    def concat(arrays, dtype=np.float32):
+        return np.concatenate(arrays).ravel() if arrays else np.zeros(0, dtype=dtype)
+
+    # Build the new mesh
+    data = bpy.data.meshes.new(target.data.name)
+    data.vertices.add(vertex_offset)
+    data.edges.add(edge_offset)
+    data.loops.add(loop_offset)
+    data.polygons.add(sum(len(obj.data.polygons) for obj in objects))
+    data.vertices.foreach_set('co', concat(parts['co']))
+    data.vertices.foreach_set('bevel_weight', concat(parts['vertex_bevel_weight']))
+    data.edges.foreach_set('vertices', concat(parts['edges'], dtype=np.int32))
+    for attribute in ['use_seam', 'use_edge_sharp', 'crease', 'bevel_weight']:
+        data.edges.foreach_set(attribute, concat(parts[attribute]))
+    data.loops.foreach_set('vertex_index', concat(parts['loop_vertices'], dtype=np.int32))
+    data.loops.foreach_set('edge_index', concat(parts['loop_edges'], dtype=np.int32))
+    for attribute in ['loop_start', 'loop_total', 'material_index', 'use_smooth']:
+        data.polygons.foreach_set(attribute, concat(parts[attribute]))
+
+    for material in materials:
+        data.materials.append(material)
+
+    for name in uv_names:
+        texture = data.uv_textures.new(name=name)
+        if texture is None:
+            print('Could not add the UV map ' + name)
+            continue
+        data.uv_layers[texture.name].data.foreach_set('uv', concat(uvs[name]))
+        for face, image in zip(texture.data, images[name]):
+            if image:
+                face.image = image
+    if uv_names:
+        data.uv_textures.active_index = 0
+
+    for name in color_names:
+        layer = data.vertex_colors.new(name=name)
+        layer.data.foreach_set('color', concat(colors[name]))
+
+    data.update()
+
+    # The new mesh keeps the settings and custom properties of the target mesh
+    data.use_auto_smooth = target.data.use_auto_smooth
+    data.auto_smooth_angle = target.data.auto_smooth_angle
+    for key, value in target.data.items():
+        data[key] = value.to_dict() if hasattr(value, 'to_dict') else value
+
+    if has_custom_normals:
+        data.create_normals_split()
+        data.use_auto_smooth = True
+        data.normals_split_custom_set(concat(parts['normals']).reshape(-1, 3).tolist())
+
+    # Replace the data of the target and delete the other objects.
+    # The old data of the target is removed after the shape keys got its animation
+    old_data = target.data
+    name = old_data.name
+    target.data = data
+    for obj in objects:
+        if obj != target:
+            old_mesh = obj.data
+            bpy.data.objects.remove(obj, do_unlink=True)
+            if old_mesh.users == 0:
+                bpy.data.meshes.remove(old_mesh)
+    old_data.name = name + '_old'
+    data.name = name
+
+    # Vertex groups and weights
+    for name in group_names[len(target.vertex_groups):]:
+        target.vertex_groups.new(name)
+    if weights[0]:
+        set_vertex_weights(target, np.concatenate(weights[0]), np.concatenate(weights[1]), np.concatenate(weights[2]))
+    invalidate_vertex_weights(target)
+
+    # Shape keys get their settings from the first mesh they were found in
+    for name in key_names:
+        shapekey = target.shape_key_add(name=name, from_mix=False)
+        shapekey.data.foreach_set('co', concat(keys[name]))
+    if key_names:
+        key_blocks = data.shape_keys.key_blocks
+        for name in key_names:
+            shapekey = key_blocks[name]
+            relative_key, shapekey.slider_max, shapekey.slider_min, shapekey.value, \
+                shapekey.vertex_group, shapekey.interpolation, shapekey.mute = key_settings[name]
+            shapekey.relative_key = key_blocks.get(relative_key, key_blocks[0])
+
+    # Shape key drivers and actions of the target, drivers which read the old mesh or key read the new one instead
+    old_key = old_data.shape_keys
+    if key_names and old_key and old_key.animation_data:
+        animation_data = data.shape_keys.animation_data_create()
+        animation_data.action = old_key.animation_data.action
+        for driver in old_key.animation_data.drivers:
+            driver = animation_data.drivers.from_existing(src_driver=driver)
+            for variable in driver.driver.variables:
+                for driver_target in variable.targets:
+                    if driver_target.id == old_key:
+                        driver_target.id = data.shape_keys
+                    elif driver_target.id == old_data:
+                        driver_target.id = data
+
+    if old_data.users == 0:
+        bpy.data.meshes.remove(old_data)
+
+    return target
+
+
 def separate_by_materials(context, mesh):
     set_default_stage()
 
@@ -659,7 +1148,7 @@ def separate_by_materials(context, mesh):
     utils.clearUnusedMeshes()
 
 
-def separate_by_loose_parts(context, mesh):
+def separate_by_loose_parts(context, mesh, min_vertices=4):
     set_default_stage()
 
     # Remove Rigidbodies and joints
@@ -682,73 +1171,294 @@ def separate_by_loose_parts(context, mesh):
     # This essentially does nothing but merges the extremely small parts together.
     remove_doubles(mesh, 0)
 
-    utils.separateByMaterials(mesh)
-
-    meshes = []
-    for ob in context.selected_objects:
-        if ob.type == 'MESH':
-            meshes.append(ob)
+    # Find the loose parts of every material and create the meshes directly from them
+    parts = get_loose_parts(mesh, min_vertices=min_vertices)
+    separate_mesh_parts(mesh, parts)
 
-    wm = bpy.context.window_manager
-    current_step = 0
-    wm.progress_begin(current_step, len(meshes))
+    utils.clearUnusedMeshes()
 
-    for mesh in meshes:
-        unselect_all()
-        select(mesh)
-        bpy.ops.mesh.separate(type='LOOSE')
-
-        meshes2 = []
-        for ob in context.selected_objects:
-            if ob.type == 'MESH':
-                meshes2.append(ob)
-
-        ## This crashes blender, but would be better
-        # unselect_all()
-        # for mesh2 in meshes2:
-        #     if len(mesh2.data.vertices) <= 3:
-        #         select(mesh2)
-        #     elif bpy.ops.object.join.poll():
-        #         bpy.ops.object.join()
-        #         unselect_all()
-
-        for mesh2 in meshes2:
-            clean_shapekeys(mesh2)
-
-        current_step += 1
-        wm.progress_update(current_step)
 
+def connected_components(count, nodes_a, nodes_b):
+    # Union-find over the node pairs. All roots of a pass get hooked onto the smaller root of their pairs,
+    # then the paths get compressed. Returns the component index of every node, ordered by their first node
+    parent = np.arange(count)
+    while True:
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+        roots_a = parent[nodes_a]
+        roots_b = parent[nodes_b]
+        differ = roots_a != roots_b
+        if not differ.any():
+            break
+        roots_a = roots_a[differ]
+        roots_b = roots_b[differ]
+        np.minimum.at(parent, np.maximum(roots_a, roots_b), np.minimum(roots_a, roots_b))
+
+    return np.unique(parent, return_inverse=True)[1]
+
+
+class LooseParts:
+    # The loose parts of a mesh per material. Every vertex is a node once per material it's used with,
+    # so the parts are the same as after separating by materials and then by loose parts.
+    # Loose edges and vertices stay with the first material
+    def __init__(self, mesh, min_vertices=0):
+        data = mesh.data
+        vertex_count = len(data.vertices)
+        loop_count = len(data.loops)
+        polygon_count = len(data.polygons)
+
+        loop_vertices = np.empty(loop_count, dtype=np.int64)
+        loop_edges = np.empty(loop_count, dtype=np.int64)
+        data.loops.foreach_get('vertex_index', loop_vertices)
+        data.loops.foreach_get('edge_index', loop_edges)
+        self.loop_start = np.empty(polygon_count, dtype=np.int64)
+        self.loop_total = np.empty(polygon_count, dtype=np.int64)
+        material_index = np.empty(polygon_count, dtype=np.int64)
+        data.polygons.foreach_get('loop_start', self.loop_start)
+        data.polygons.foreach_get('loop_total', self.loop_total)
+        data.polygons.foreach_get('material_index', material_index)
+        material_index = np.clip(material_index, 0, max(len(data.materials) - 1, 0))
+
+        edges = np.empty(len(data.edges) * 2, dtype=np.int64)
+        data.edges.foreach_get('vertices', edges)
+        edges.shape = (-1, 2)
+
+        # Polygon and first loop of every loop
+        polygon_loops = self.polygon_loops(np.arange(polygon_count))
+        loop_polygons = np.empty(loop_count, dtype=np.int64)
+        loop_polygons[polygon_loops] = np.repeat(np.arange(polygon_count), self.loop_total)
+        loop_first = self.loop_start[loop_polygons]
+
+        used_edges = np.zeros(len(edges), dtype=bool)
+        used_edges[loop_edges] = True
+        self.loose_edges = np.flatnonzero(~used_edges)
+        used_vertices = np.zeros(vertex_count, dtype=bool)
+        used_vertices[loop_vertices] = True
+        used_vertices[edges[self.loose_edges].ravel()] = True
+        loose_vertices = np.flatnonzero(~used_vertices)
+
+        # Nodes are (material, vertex) pairs
+        keys = np.concatenate((
+            material_index[loop_polygons] * vertex_count + loop_vertices,
+            edges[self.loose_edges].ravel(),
+            loose_vertices,
+        ))
+        node_keys, inverse = np.unique(keys, return_inverse=True)
+        self.loop_nodes = inverse[:loop_count]
+        self.loose_edge_nodes = inverse[loop_count:loop_count + len(self.loose_edges) * 2].reshape(-1, 2)
+        self.node_vertices = node_keys % max(vertex_count, 1)
+        node_materials = node_keys // max(vertex_count, 1)
+
+        components = connected_components(len(node_keys),
+                                          np.concatenate((self.loop_nodes, self.loose_edge_nodes[:, 0])),
+                                          np.concatenate((self.loop_nodes[loop_first], self.loose_edge_nodes[:, 1])))
+
+        # Parts with too few vertices are merged into one part per material
+        if min_vertices > 0 and len(components) > 0:
+            sizes = np.bincount(components)
+            small = sizes[components] < min_vertices
+            components = np.where(small, len(sizes) + node_materials, components)
+        self.node_parts = np.unique(components, return_inverse=True)[1]
+        self.part_count = int(self.node_parts.max()) + 1 if len(self.node_parts) > 0 else 0
+
+        self.polygon_parts = self.node_parts[self.loop_nodes[self.loop_start]] if polygon_count > 0 else np.zeros(0, dtype=np.int64)
+        self.loose_edge_parts = self.node_parts[self.loose_edge_nodes[:, 0]]
+        self.part_materials = np.zeros(self.part_count, dtype=np.int64)
+        self.part_materials[self.node_parts] = node_materials
+
+        # Local vertex index of every node inside of its part
+        self.node_order = np.argsort(self.node_parts, kind='mergesort')
+        self.node_starts = self.part_starts(self.node_parts)
+        self.node_local = np.empty(len(node_keys), dtype=np.int64)
+        self.node_local[self.node_order] = np.arange(len(node_keys)) - np.repeat(self.node_starts[:-1], np.diff(self.node_starts))
+
+        self.polygon_order = np.argsort(self.polygon_parts, kind='mergesort')
+        self.polygon_starts = self.part_starts(self.polygon_parts)
+        self.loop_order = self.polygon_loops(self.polygon_order)
+        self.loop_starts = np.concatenate(([0], np.cumsum(self.loop_total[self.polygon_order])))[self.polygon_starts]
+
+        self.loose_edge_order = np.argsort(self.loose_edge_parts, kind='mergesort')
+        self.loose_edge_starts = self.part_starts(self.loose_edge_parts)
+
+    def polygon_loops(self, polygons):
+        # Loop indices of the given polygons, in their order
+        totals = self.loop_total[polygons]
+        within = np.arange(totals.sum()) - np.repeat(np.cumsum(totals) - totals, totals)
+        return np.repeat(self.loop_start[polygons], totals) + within
+
+    def part_starts(self, parts):
+        return np.concatenate(([0], np.cumsum(np.bincount(parts, minlength=self.part_count))))
+
+    def part_slice(self, starts, part):
+        return slice(int(starts[part]), int(starts[part + 1]))
+
+
+def get_loose_parts(mesh, min_vertices=0):
+    return LooseParts(mesh, min_vertices=min_vertices)
+
+
+def separate_mesh_parts(mesh, parts):
+    # Creates one object per part with the sliced mesh data, the first part stays in the original object
+    data = mesh.data
+    vertex_count = len(data.vertices)
+    if parts.part_count == 0:
+        return [mesh]
+
+    def read(collection, attribute, size=1, dtype=np.float32):
+        values = np.empty(len(collection) * size, dtype=dtype)
+        collection.foreach_get(attribute, values)
+        return values.reshape(-1, size) if size > 1 else values
+
+    coords = read(data.vertices, 'co', 3)
+    use_smooth = read(data.polygons, 'use_smooth', dtype=bool)
+    uvs = [(layer.name, read(layer.data, 'uv', 2)) for layer in data.uv_layers]
+    images = {}
+    for texture in data.uv_textures:
+        face_images = [face.image for face in texture.data]
+        if any(face_images):
+            images[texture.name] = face_images
+    colors = [(layer.name, read(layer.data, 'color', 3)) for layer in data.vertex_colors]
+    normals = None
+    if data.has_custom_normals:
+        data.calc_normals_split()
+        normals = read(data.loops, 'normal', 3)
+        data.free_normals_split()
+
+    # Edge settings are found by their vertex pair
+    edges = np.sort(read(data.edges, 'vertices', 2, np.int64), axis=1)
+    edge_keys = edges[:, 0] * vertex_count + edges[:, 1]
+    edge_order = np.argsort(edge_keys)
+    edge_keys = edge_keys[edge_order]
+    edge_settings = [(attribute, read(data.edges, attribute, dtype=dtype)[edge_order])
+                     for attribute, dtype in [('use_seam', bool), ('use_edge_sharp', bool), ('crease', np.float32), ('bevel_weight', np.float32)]]
+
+    materials = list(data.materials)
+    old_data = data
+    weights = get_vertex_weights(mesh) if mesh.vertex_groups else None
+    node_vertices = parts.node_vertices[parts.node_order]
+
+    objects = []
+    wm = bpy.context.window_manager
+    wm.progress_begin(0, parts.part_count)
+    for part in range(parts.part_count):
+        nodes = parts.node_order[parts.part_slice(parts.node_starts, part)]
+        polygons = parts.polygon_order[parts.part_slice(parts.polygon_starts, part)]
+        loops = parts.loop_order[parts.part_slice(parts.loop_starts, part)]
+        loose_edges = parts.loose_edges[parts.loose_edge_order[parts.part_slice(parts.loose_edge_starts, part)]]
+        vertices = parts.node_vertices[nodes]
+
+        material = materials[parts.part_materials[part]] if materials else None
+        name = getattr(material, 'name', 'None') if materials else 'None'
+
+        part_data = bpy.data.meshes.new(name)
+        part_data.vertices.add(len(nodes))
+        part_data.vertices.foreach_set('co', coords[vertices].ravel())
+        loose_edge_nodes = parts.loose_edge_nodes[parts.loose_edge_order[parts.part_slice(parts.loose_edge_starts, part)]]
+        part_data.edges.add(len(loose_edges))
+        part_data.edges.foreach_set('vertices', parts.node_local[loose_edge_nodes].ravel())
+        part_data.loops.add(len(loops))
+        part_data.loops.foreach_set('vertex_index', parts.node_local[parts.loop_nodes[loops]])
+        part_data.polygons.add(len(polygons))
+        loop_total = parts.loop_total[polygons]
+        part_data.polygons.foreach_set('loop_start', np.cumsum(loop_total) - loop_total)
+        part_data.polygons.foreach_set('loop_total', loop_total)
+        part_data.polygons.foreach_set('use_smooth', use_smooth[polygons])
+        part_data.update(calc_edges=True)
+
+        if materials:
+            part_data.materials.append(material)
+
+        for layer_name, uv in uvs:
+            texture = part_data.uv_textures.new(name=layer_name)
+            part_data.uv_layers[texture.name].data.foreach_set('uv', uv[loops].ravel())
+            face_images = images.get(layer_name)
+            if face_images:
+                for face, index in zip(texture.data, polygons.tolist()):
+                    face.image = face_images[index]
+        for layer_name, color in colors:
+            part_data.vertex_colors.new(name=layer_name).data.foreach_set('color', color[loops].ravel())
+
+        # Edge settings of the original edges
+        part_edges = np.sort(vertices[read(part_data.edges, 'vertices', 2, np.int64)], axis=1)
+        if len(part_edges) > 0 and len(edge_keys) > 0:
+            found = np.minimum(np.searchsorted(edge_keys, part_edges[:, 0] * vertex_count + part_edges[:, 1]), len(edge_keys) - 1)
+            for attribute, values in edge_settings:
+                part_data.edges.foreach_set(attribute, values[found])
+
+        if normals is not None:
+            part_data.create_normals_split()
+            part_data.use_auto_smooth = True
+            part_data.auto_smooth_angle = old_data.auto_smooth_angle
+            part_data.normals_split_custom_set(normals[loops].tolist())
+
+        if part == 0:
+            obj = mesh
+        else:
+            obj = mesh.copy()
+            bpy.context.scene.objects.link(obj)
+        obj.data = part_data
+        obj.name = name
+        objects.append(obj)
+        wm.progress_update(part)
     wm.progress_end()
 
-    ## Old separate method
-    # print("DEBUG3")
-    # bpy.ops.mesh.separate(type='LOOSE')
-    # print("DEBUG4")
-    #
-    # for ob in context.selected_objects:
-    #     print(ob.name)
-    #     if ob.type == 'MESH':
-    #         if ob.data.shape_keys:
-    #             for kb in ob.data.shape_keys.key_blocks:
-    #                 if can_remove(kb):
-    #                     ob.shape_key_remove(kb)
-    #
-    #         mesh = ob.data
-    #         materials = mesh.materials
-    #         if len(mesh.polygons) > 0:
-    #             if len(materials) > 1:
-    #                 mat_index = mesh.polygons[0].material_index
-    #                 for x in reversed(range(len(materials))):
-    #                     if x != mat_index:
-    #                         materials.pop(index=x, update_data=True)
-    #         ob.name = getattr(materials[0], 'name', 'None') if len(materials) else 'None'
-    #
-    #         if '. 001' in ob.name:
-    #             ob.name = ob.name.replace('. 001', '')
-    #         if '.000' in ob.name:
-    #             ob.name = ob.name.replace('.000', '')
+    # Vertex weights of the nodes in every part
+    if weights is not None:
+        counts = weights.offsets[node_vertices + 1] - weights.offsets[node_vertices]
+        entries = np.repeat(weights.offsets[node_vertices], counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        entry_vertices = np.repeat(np.arange(len(node_vertices)) - np.repeat(parts.node_starts[:-1], np.diff(parts.node_starts)), counts)
+        entry_starts = np.concatenate(([0], np.cumsum(counts)))[parts.node_starts]
+        for part, obj in enumerate(objects):
+            part_entries = parts.part_slice(entry_starts, part)
+            set_vertex_weights(obj, weights.group_indices[entries[part_entries]], entry_vertices[part_entries], weights.weights[entries[part_entries]])
+            invalidate_vertex_weights(obj)
+
+    # Shape keys are only added to the parts they change
+    if old_data.shape_keys:
+        key_blocks = old_data.shape_keys.key_blocks
+        node_parts = parts.node_parts[parts.node_order]
+        basis = read(key_blocks[0].data, 'co', 3)
+        for index, shapekey in enumerate(key_blocks):
+            key_coords = read(shapekey.data, 'co', 3)
+            if index == 0:
+                changed_parts = range(parts.part_count)
+            elif 'mmd_' in shapekey.name:
+                continue
+            else:
+                relative = basis if shapekey.relative_key == key_blocks[0] else read(shapekey.relative_key.data, 'co', 3)
+                changed = np.any(key_coords != relative, axis=1)
+                changed_parts = np.unique(node_parts[changed[node_vertices]]).tolist()
+
+            for part in changed_parts:
+                obj = objects[part]
+                part_vertices = node_vertices[parts.part_slice(parts.node_starts, part)]
+                new_key = obj.shape_key_add(name=shapekey.name, from_mix=False)
+                new_key.data.foreach_set('co', key_coords[part_vertices].ravel())
+                new_key.slider_max = shapekey.slider_max
+                new_key.slider_min = shapekey.slider_min
+                new_key.vertex_group = shapekey.vertex_group
+                new_key.interpolation = shapekey.interpolation
+                new_key.mute = shapekey.mute
+
+        for obj in objects:
+            if has_shapekeys(obj):
+                new_blocks = obj.data.shape_keys.key_blocks
+                for new_key in new_blocks[1:]:
+                    relative_name = key_blocks[new_key.name].relative_key.name
+                    new_key.relative_key = new_blocks.get(relative_name, new_blocks[0])
+
+    if old_data.users == 0:
+        bpy.data.meshes.remove(old_data)
 
-    utils.clearUnusedMeshes()
+    unselect_all()
+    for obj in objects:
+        obj.select = True
+    bpy.context.scene.objects.active = objects[0]
+    return objects
 
 
 def clean_shapekeys(mesh):
@@ -784,6 +1494,7 @@ def separate_by_verts():
 
 
 def reset_context_scenes():
+    invalidate_enums()
     head_bones = get_bones_head(None, bpy.context)
     if len(head_bones) > 0:
         bpy.context.scene.head = head_bones[0][0]
@@ -921,56 +1632,68 @@ def sort_shape_keys(mesh_name, shape_key_order=None):
         if shape not in order:
             order.append(shape)
 
+    key_blocks = mesh.data.shape_keys.key_blocks
+    current_order = [shapekey.name for shapekey in key_blocks]
+
+    # The wanted order: the Basis, then the keys from the order list and then all other keys in their current order
+    final_order = [current_order[0]]
+    if 'Basis' in key_blocks:
+        final_order = ['Basis']
+    final_names = set(final_order)
+    for name in order + current_order:
+        if name not in final_names and name in key_blocks:
+            final_order.append(name)
+            final_names.add(name)
+
+    # Move the Basis to the top first. TOP moves a key to index 1 and only to index 0 from there
+    if key_blocks.find(final_order[0]) != 0:
+        mesh.active_shape_key_index = key_blocks.find(final_order[0])
+        bpy.ops.object.shape_key_move(type='TOP')
+        if mesh.active_shape_key_index != 0:
+            bpy.ops.object.shape_key_move(type='TOP')
+        current_order = [shapekey.name for shapekey in key_blocks]
+
+    top_moves, bottom_moves = plan_shape_key_moves(current_order, final_order)
+
     wm = bpy.context.window_manager
     current_step = 0
-    wm.progress_begin(current_step, len(order))
+    wm.progress_begin(current_step, len(top_moves) + len(bottom_moves))
+
+    for move_type, names in [('TOP', top_moves), ('BOTTOM', bottom_moves)]:
+        for name in names:
+            mesh.active_shape_key_index = key_blocks.find(name)
+            bpy.ops.object.shape_key_move(type=move_type)
 
-    i = 0
-    for name in order:
-        if name == 'Basis' and 'Basis' not in mesh.data.shape_keys.key_blocks:
-            i += 1
             current_step += 1
             wm.progress_update(current_step)
-            continue
 
-        for index, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-            if shapekey.name == name:
-
-                mesh.active_shape_key_index = index
-                new_index = i
-                index_diff = (index - new_index)
-
-                if new_index >= len(mesh.data.shape_keys.key_blocks):
-                    bpy.ops.object.shape_key_move(type='BOTTOM')
-                    break
-
-                position_correct = False
-                if 0 <= index_diff <= (new_index - 1):
-                    while position_correct is False:
-                        if mesh.active_shape_key_index != new_index:
-                            bpy.ops.object.shape_key_move(type='UP')
-                        else:
-                            position_correct = True
-                else:
-                    if mesh.active_shape_key_index > new_index:
-                        bpy.ops.object.shape_key_move(type='TOP')
+    mesh.active_shape_key_index = 0
 
-                    position_correct = False
-                    while position_correct is False:
-                        if mesh.active_shape_key_index != new_index:
-                            bpy.ops.object.shape_key_move(type='DOWN')
-                        else:
-                            position_correct = True
+    wm.progress_end()
 
-                i += 1
-                break
 
-        current_step += 1
-        wm.progress_update(current_step)
+def plan_shape_key_moves(current_order, final_order):
+    # Returns the keys which have to be moved to the top and to the bottom, in the order they have to be moved,
+    # to get from the current to the final order. Both orders have to start with the same Basis.
+    # The longest run of keys in the final order which already is in the correct order stays in place.
+    # The keys before it are moved to the top in reverse order, the keys after it to the bottom.
+    positions = {name: index for index, name in enumerate(current_order)}
 
-    mesh.active_shape_key_index = 0
+    best_start, best_end = 1, 1
+    start = 1
+    for i in range(1, len(final_order) + 1):
+        if i == len(final_order) or (i > start and positions[final_order[i]] < positions[final_order[i - 1]]):
+            if i - start > best_end - best_start:
+                best_start, best_end = start, i
+            start = i
 
-    wm.progress_end()
+    top_moves = list(reversed(final_order[1:best_start]))
+    bottom_moves = final_order[best_end:]
+
+    # A key at index 1 is already at the top. Moving it to the top again would make it the Basis
+    if top_moves and positions[top_moves[0]] == 1:
+        top_moves = top_moves[1:]
+    return top_moves, bottom_moves
 
 
 def isEmptyGroup(group_name):
@@ -981,35 +1704,21 @@ def isEmptyGroup(group_name):
     if vgroup is None:
         return True
 
-    for vert in mesh.data.vertices:
-        for group in vert.groups:
-            if group.group == vgroup.index:
-                if group.weight > 0:
-                    return False
-
-    return True
+    return not get_vertex_weights(mesh).used_groups()[vgroup.index]
 
 
 def removeEmptyGroups(obj, thres=0):
-    z = []
-    for v in obj.data.vertices:
-        for g in v.groups:
-            if g.weight > thres:
-                if g not in z:
-                    z.append(obj.vertex_groups[g.group])
-    for r in obj.vertex_groups:
-        if r not in z:
-            obj.vertex_groups.remove(r)
+    used = get_vertex_weights(obj).used_groups(thres)
+    for i in reversed(range(len(obj.vertex_groups))):
+        if not used[i]:
+            obj.vertex_groups.remove(obj.vertex_groups[i])
 
 
 def removeZeroVerts(obj, thres=0):
-    for v in obj.data.vertices:
-        z = []
-        for g in v.groups:
-            if not g.weight > thres:
-                z.append(g)
-        for r in z:
-            obj.vertex_groups[g.group].remove([v.index])
+    weights = get_vertex_weights(obj)
+    for group_index, vertex_indices in weights.group_vertices(weights.weights <= thres).items():
+        obj.vertex_groups[group_index].remove(vertex_indices.tolist())
+    invalidate_vertex_weights(obj)
 
 
 def delete_hierarchy(obj):
@@ -1101,16 +1810,15 @@ def delete_zero_weight(armature_name=None, ignore=''):
     vertex_group_names_used = set()
     vertex_group_name_to_objects_having_same_named_vertex_group = dict()
     for objects in armature.children:
-        vertex_group_id_to_vertex_group_name = dict()
+        if objects.type != 'MESH':
+            continue
+        used = get_vertex_weights(objects).used_groups()
         for vertex_group in objects.vertex_groups:
-            vertex_group_id_to_vertex_group_name[vertex_group.index] = vertex_group.name
             if vertex_group.name not in vertex_group_name_to_objects_having_same_named_vertex_group:
                 vertex_group_name_to_objects_having_same_named_vertex_group[vertex_group.name] = set()
             vertex_group_name_to_objects_having_same_named_vertex_group[vertex_group.name].add(objects)
-        for vertex in objects.data.vertices:
-            for group in vertex.groups:
-                if group.weight > 0:
-                    vertex_group_names_used.add(vertex_group_id_to_vertex_group_name.get(group.group))
+            if used[vertex_group.index]:
+                vertex_group_names_used.add(vertex_group.name)
 
     not_used_bone_names = bone_names_to_work_on - vertex_group_names_used
 
@@ -1318,13 +2026,94 @@ def clean_material_names(mesh):
 
 
 def mix_weights(mesh, vg_from, vg_to):
-    mod = mesh.modifiers.new("VertexWeightMix", 'VERTEX_WEIGHT_MIX')
-    mod.vertex_group_a = vg_to
-    mod.vertex_group_b = vg_from
-    mod.mix_mode = 'ADD'
-    mod.mix_set = 'B'
-    bpy.ops.object.modifier_apply(modifier=mod.name)
-    mesh.vertex_groups.remove(mesh.vertex_groups.get(vg_from))
+    merge_weights(mesh, {vg_from: vg_to})
+
+
+def resolve_weight_mapping(mapping):
+    # Follows chains like A -> B -> C so that every source points to its final target. Sources in a loop are dropped
+    resolved = OrderedDict()
+    for source, target in mapping.items():
+        visited = {source}
+        while target in mapping and target not in visited:
+            visited.add(target)
+            target = mapping[target]
+        if target in visited:
+            print('Weight merge loop found at ' + source + ', skipping it')
+            continue
+        resolved[source] = target
+    return resolved
+
+
+def merge_weights(mesh, mapping, create_targets=False):
+    # Adds the weights of every source group to its target group and removes the source groups afterwards.
+    # Same result as mixing the pairs one after another with a VertexWeightMix modifier (mix mode 'ADD', vertex set 'B'),
+    # but the weights are only read once and there is no modifier applied per pair
+    mapping = resolve_weight_mapping(mapping)
+
+    group_lookup = {vg.name: vg.index for vg in mesh.vertex_groups}
+    if create_targets:
+        for source, target in mapping.items():
+            if source in group_lookup and target not in group_lookup:
+                group_lookup[target] = mesh.vertex_groups.new(target).index
+
+    weights = get_vertex_weights(mesh)
+
+    # Target group index of every group, -1 if the group is not merged
+    target_of = np.full(len(mesh.vertex_groups), -1, dtype=np.int32)
+    for source, target in mapping.items():
+        source_index = group_lookup.get(source)
+        target_index = group_lookup.get(target)
+        if source_index is None or target_index is None or source_index == target_index:
+            continue
+        target_of[source_index] = target_index
+
+    sources = np.flatnonzero(target_of >= 0)
+    if len(sources) == 0:
+        return
+
+    # Entries of the source groups get moved into their targets, entries of the targets are kept
+    is_target = np.zeros(len(target_of), dtype=bool)
+    is_target[target_of[sources]] = True
+    entry_targets = target_of[weights.group_indices]
+    moved = entry_targets >= 0
+    kept = is_target[weights.group_indices]
+
+    vertex_count = max(weights.vertex_count, 1)
+    keys = np.concatenate((
+        entry_targets[moved].astype(np.int64) * vertex_count + weights.vertex_indices[moved],
+        weights.group_indices[kept].astype(np.int64) * vertex_count + weights.vertex_indices[kept],
+    ))
+    keys, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=np.concatenate((weights.weights[moved], weights.weights[kept])))
+    sums = np.clip(sums, 0, 1).astype(np.float32)
+
+    # Only vertices of the source groups change
+    changed = np.zeros(len(keys), dtype=bool)
+    changed[inverse[:np.count_nonzero(moved)]] = True
+    keys = keys[changed]
+    sums = sums[changed]
+    set_vertex_weights(mesh, keys // vertex_count, keys % vertex_count, sums)
+
+    # Remove the sources from the back so the remaining indices stay valid
+    for index in reversed(sources.tolist()):
+        mesh.vertex_groups.remove(mesh.vertex_groups[index])
+
+    invalidate_vertex_weights(mesh)
+
+
+def set_vertex_weights(mesh, group_indices, vertex_indices, weights):
+    # Writes the weights with one call per vertex group and weight value
+    if len(weights) == 0:
+        return
+    weights = np.asarray(weights, dtype=np.float32)
+    order = np.lexsort((weights, group_indices))
+    group_indices = np.asarray(group_indices)[order]
+    vertex_indices = np.asarray(vertex_indices)[order]
+    weights = weights[order]
+    starts = np.flatnonzero(np.concatenate(([True], (group_indices[1:] != group_indices[:-1]) | (weights[1:] != weights[:-1]))))
+    for start, end in zip(starts, np.append(starts[1:], len(weights))):
+        vg = mesh.vertex_groups[int(group_indices[start])]
+        vg.add(vertex_indices[start:end].tolist(), float(weights[start]), 'REPLACE')
 
 
 def version_2_79_or_older():
@@ -27,8 +27,9 @@
 import webbrowser
 
 import bpy
-import random
+import numpy as np
 import tools.common
+import tools.decimation
 
 
 class CopyProtectionEnable(bpy.types.Operator):
@@ -44,62 +45,38 @@ class CopyProtectionEnable(bpy.types.Operator):
         return True
 
     def execute(self, context):
+        armature = tools.common.set_default_stage()
+
+        # Check if bone matrix == world matrix, important for xps models
+        xps = False
+        for index, bone in enumerate(armature.pose.bones):
+            if index == 5:
+                bone_pos = bone.matrix
+                world_pos = armature.matrix_world * bone.matrix
+                if abs(bone_pos[0][0]) != abs(world_pos[0][0]):
+                    xps = True
+                    break
+
         for mesh in tools.common.get_meshes_objects():
-            armature = tools.common.set_default_stage()
             tools.common.unselect_all()
             tools.common.select(mesh)
-            tools.common.switch('EDIT')
 
             # Convert quad faces to tris first
-            bpy.ops.mesh.quads_convert_to_tris(quad_method='BEAUTY', ngon_method='BEAUTY')
-
-            tools.common.switch('OBJECT')
+            tools.decimation.triangulate(mesh)
 
             mesh.show_only_shape_key = False
-            bpy.ops.object.shape_key_clear()
-
-            if not tools.common.has_shapekeys(mesh):
+            if tools.common.has_shapekeys(mesh):
+                for shapekey in mesh.data.shape_keys.key_blocks:
+                    shapekey.value = 0
+            else:
                 mesh.shape_key_add(name='Basis', from_mix=False)
 
             # 1. Rename original shapekey
-            basis_original = None
-            for i, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-                if i == 0:
-                    basis_original = shapekey
+            basis_original = mesh.data.shape_keys.key_blocks[0]
             basis_original.name = 'Basis Original'
 
             # 2. Mangle verts into THE SINGULARITY!!!
-
-            # Check if bone matrix == world matrix, important for xps models
-            xps = False
-            for index, bone in enumerate(armature.pose.bones):
-                if index == 5:
-                    bone_pos = bone.matrix
-                    world_pos = armature.matrix_world * bone.matrix
-                    if abs(bone_pos[0][0]) != abs(world_pos[0][0]):
-                        xps = True
-                        break
-
-            max_height = 0
-            for index, vert in enumerate(mesh.data.vertices):
-                if not xps:
-                    if max_height < mesh.data.vertices[index].co.z:
-                        max_height = mesh.data.vertices[index].co.z
-                else:
-                    if max_height < mesh.data.vertices[index].co.y:
-                        max_height = mesh.data.vertices[index].co.y
-
-            max_height /= 3
-
-            for index, vert in enumerate(mesh.data.vertices):
-                vector = (random.uniform(-max_height, max_height),
-                          random.uniform(-max_height, max_height),
-                          random.uniform(0, max_height))
-
-                if not xps:
-                    mesh.data.vertices[index].co = (vector[0], vector[1], vector[2])
-                else:
-                    mesh.data.vertices[index].co = (vector[0], vector[2], vector[1])
+            scramble_vertices(mesh, xps)
 
             # 3. Create a new shapekey that distorts all the vertices
             basis_obfuscated = mesh.shape_key_add(name='Basis', from_mix=False)
@@ -108,14 +85,13 @@ class CopyProtectionEnable(bpy.types.Operator):
             mesh.active_shape_key_index = len(mesh.data.shape_keys.key_blocks) - 1
             bpy.ops.object.shape_key_move(type='TOP')
 
-            # Make all shape keys relative to the original basis
+            # Make all shape keys relative to the original basis and the original basis relative to the obfuscated one
             for shapekey in mesh.data.shape_keys.key_blocks:
-                if shapekey and shapekey.name != 'Basis' and shapekey.name != 'Basis Original':
+                if shapekey == basis_original:
+                    shapekey.relative_key = basis_obfuscated
+                elif shapekey != basis_obfuscated:
                     shapekey.relative_key = basis_original
 
-            # Make the original basis relative to the obfuscated one
-            basis_original.relative_key = basis_obfuscated
-
             # Make obfuscated basis the new basis and repair shape key order
             tools.common.sort_shape_keys(mesh.name)
 
@@ -123,6 +99,29 @@ class CopyProtectionEnable(bpy.types.Operator):
         return {'FINISHED'}
 
 
+def scramble_vertices(mesh, xps, seed=None):
+    # Moves every vertex to a random position inside a box above the origin, which is a third as high as the mesh.
+    # The same seed always gives the same positions
+    vertices = mesh.data.vertices
+    coords = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get('co', coords)
+    coords.shape = (-1, 3)
+
+    up_axis = 1 if xps else 2
+    max_height = max(0, coords[:, up_axis].max()) if len(coords) else 0
+    max_height /= 3
+
+    random_state = np.random.RandomState(seed)
+    scrambled = random_state.uniform(-max_height, max_height, size=coords.shape)
+    scrambled[:, 2] = random_state.uniform(0, max_height, size=len(coords))
+
+    if xps:
+        scrambled = scrambled[:, [0, 2, 1]]
+
+    vertices.foreach_set('co', scrambled.astype(np.float32).ravel())
+    mesh.data.update()
+
+
 class CopyProtectionDisable(bpy.types.Operator):
     bl_idname = 'copyprotection.disable'
     bl_label = 'Disable Protection'
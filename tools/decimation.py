@@ -25,6 +25,8 @@
 # Edits by:
 
 import bpy
+import bmesh
+import numpy as np
 import tools.common
 import tools.armature_bones as Bones
 
@@ -55,6 +57,7 @@ class ScanButton(bpy.types.Operator):
             context.scene.add_shape_key = shapes[count - 2]
 
         ignore_shapes.append(shape)
+        tools.common.invalidate_enums()
 
         return {'FINISHED'}
 
@@ -82,6 +85,7 @@ class AddShapeButton(bpy.types.Operator):
             context.scene.add_shape_key = shapes[count - 2]
 
         ignore_shapes.append(shape)
+        tools.common.invalidate_enums()
 
         return {'FINISHED'}
 
@@ -101,6 +105,7 @@ class AddMeshButton(bpy.types.Operator):
 
     def execute(self, context):
         ignore_meshes.append(context.scene.add_mesh)
+        tools.common.invalidate_enums()
 
         return {'FINISHED'}
 
@@ -115,6 +120,7 @@ class RemoveShapeButton(bpy.types.Operator):
 
     def execute(self, context):
         ignore_shapes.remove(self.shape_name)
+        tools.common.invalidate_enums()
 
         return {'FINISHED'}
 
@@ -129,6 +135,7 @@ class RemoveMeshButton(bpy.types.Operator):
 
     def execute(self, context):
         ignore_meshes.remove(self.mesh_name)
+        tools.common.invalidate_enums()
 
         return {'FINISHED'}
 
@@ -153,6 +160,7 @@ class AutoDecimateButton(bpy.types.Operator):
         self.decimate(context)
 
         tools.common.join_meshes()
+        tools.common.invalidate_enums()
 
         return {'FINISHED'}
 
@@ -165,6 +173,7 @@ class AutoDecimateButton(bpy.types.Operator):
         half_decimation = context.scene.decimation_mode == 'HALF'
         safe_decimation = context.scene.decimation_mode == 'SAFE'
         save_fingers = context.scene.decimate_fingers
+        decimate_shape_keys = context.scene.decimate_shape_keys
         max_tris = context.scene.max_tris
         meshes = []
         current_tris_count = 0
@@ -173,11 +182,7 @@ class AutoDecimateButton(bpy.types.Operator):
         meshes_obj = tools.common.get_meshes_objects()
 
         for mesh in meshes_obj:
-            tools.common.select(mesh)
-            tools.common.switch('EDIT')
-            bpy.ops.mesh.quads_convert_to_tris(quad_method='BEAUTY', ngon_method='BEAUTY')
-            tools.common.switch('OBJECT')
-            tools.common.remove_doubles(mesh, 0.00001)
+            triangulate(mesh, 0.00001)
             current_tris_count += len(mesh.data.polygons)
 
         if save_fingers:
@@ -224,6 +229,9 @@ class AutoDecimateButton(bpy.types.Operator):
                             found = True
                             break
                     if found:
+                        if decimate_shape_keys:
+                            meshes.append((mesh, tris))
+                            tris_count += tris
                         tools.common.unselect_all()
                         continue
                     bpy.ops.object.shape_key_remove(all=True)
@@ -237,6 +245,10 @@ class AutoDecimateButton(bpy.types.Operator):
                     bpy.ops.object.shape_key_remove(all=True)
                     meshes.append((mesh, tris))
                     tris_count += tris
+                elif decimate_shape_keys:
+                    # Gets decimated while keeping the shape keys
+                    meshes.append((mesh, tris))
+                    tris_count += tris
             else:
                 meshes.append((mesh, tris))
                 tris_count += tris
@@ -278,34 +290,39 @@ class AutoDecimateButton(bpy.types.Operator):
 
         meshes.sort(key=lambda x: x[1])
 
+        # Meshes with shape keys can't lose their locked vertices, so they might not get below a certain tris count
+        min_tris = {}
+        for mesh_obj, tris in meshes:
+            if tools.common.has_shapekeys(mesh_obj):
+                min_tris[mesh_obj.name] = estimate_min_tris(mesh_obj)
+
+        # Plan the ratio of every mesh first. The collapse result of a mesh is only known after applying it,
+        # so the next mesh makes up for the difference between its planned and actual tris
+        planned = plan_decimation(meshes, current_tris_count - tris_count, max_tris, min_tris)
+        planned_tris_count = current_tris_count - tris_count + sum(tris_planned for ratio, tris_planned in planned.values())
+
+        difference = 0
         for mesh in reversed(meshes):
             mesh_obj = mesh[0]
             tris = mesh[1]
+            ratio, tris_planned = planned[mesh_obj.name]
 
-            tools.common.select(mesh_obj)
-            print(mesh_obj.name)
-
-            # Calculate new decimation ratio
             try:
-                decimation = (max_tris - current_tris_count + tris_count) / tris_count
+                decimation = (tris_planned + difference) / tris
             except ZeroDivisionError:
-                decimation = 1
-            print(decimation)
+                decimation = ratio
 
-            # Apply decimation mod
-            mod = mesh_obj.modifiers.new("Decimate", 'DECIMATE')
-            mod.ratio = decimation
-            mod.use_collapse_triangulate = True
-            bpy.ops.object.modifier_apply(apply_as='DATA', modifier=mod.name)
-
-            tris_after = len(mesh_obj.data.polygons)
-            print(tris)
-            print(tris_after)
+            if tools.common.has_shapekeys(mesh_obj):
+                tris_after = decimate_with_shape_keys(mesh_obj, decimation)
+            else:
+                tris_after = apply_decimation(mesh_obj, decimation)
+            print(mesh_obj.name, 'ratio', decimation, 'planned', tris_planned, 'tris', tris, '->', tris_after)
 
+            difference += tris_planned - tris_after
             current_tris_count = current_tris_count - tris + tris_after
-            tris_count = tris_count - tris
 
-            tools.common.unselect_all()
+        print('Planned tris:', planned_tris_count, 'Actual tris:', current_tris_count)
+        self.report({'INFO'}, 'Decimated to ' + str(current_tris_count) + ' tris, planned were ' + str(planned_tris_count) + '.')
 
         # # Check if decimated correctly
         # if decimation < 0:
@@ -339,7 +356,253 @@ class AutoDecimateButton(bpy.types.Operator):
         #         break
 
 
+def triangulate(mesh, threshold=None):
+    # Same as converting quads to tris and removing doubles in edit mode, but directly on the mesh data
+    bm = bmesh.new()
+    bm.from_mesh(mesh.data)
+    bmesh.ops.triangulate(bm, faces=bm.faces[:], quad_method=0, ngon_method=0)
+    if threshold is not None:
+        bmesh.ops.remove_doubles(bm, verts=bm.verts[:], dist=threshold)
+    bm.to_mesh(mesh.data)
+    bm.free()
+    mesh.data.update()
+
+
+def estimate_min_tris(mesh):
+    # Tris left after decimate_with_shape_keys collapsed every vertex it is allowed to remove.
+    # Each collapse removes the two faces around the collapsed edge and locked vertices are never removed
+    bm = bmesh.new()
+    bm.from_mesh(mesh.data)
+    collapsible = sum(1 for vert in bm.verts if not is_locked_vertex(bm, vert))
+    tris = len(bm.faces)
+    bm.free()
+    return max(tris - 2 * collapsible, 0)
+
+
+def plan_decimation(meshes, fixed_tris, max_tris, min_tris=None):
+    # Returns {mesh name: (ratio, planned tris)} for the given (mesh, tris) list.
+    # The tris left over by the meshes that don't get decimated are shared with the same ratio. Meshes which can't
+    # get below min_tris[mesh name] with that ratio are planned at their minimum and the others share the rest
+    if min_tris is None:
+        min_tris = {}
+
+    budget = max_tris - fixed_tris
+    floors = {mesh.name: min(min_tris.get(mesh.name, 0), tris) for mesh, tris in meshes}
+    free = sorted(meshes, key=lambda x: floors[x[0].name] / x[1] if x[1] else 0)
+    floored = []
+    while True:
+        free_tris = sum(tris for mesh, tris in free)
+        floored_tris = sum(floors[mesh.name] for mesh, tris in floored)
+        try:
+            ratio = (budget - floored_tris) / free_tris
+        except ZeroDivisionError:
+            ratio = 1
+        ratio = min(max(ratio, 0), 1)
+
+        # The mesh with the highest minimum ratio is the first one that can't reach the shared ratio
+        if free and free[-1][1] and floors[free[-1][0].name] / free[-1][1] > ratio:
+            floored.append(free.pop())
+            continue
+        break
+
+    planned = {}
+    for mesh, tris in free:
+        planned[mesh.name] = (ratio, int(round(ratio * tris)))
+    for mesh, tris in floored:
+        planned[mesh.name] = (floors[mesh.name] / tris, floors[mesh.name])
+    return planned
+
+
+def apply_decimation(mesh, ratio):
+    # Applies a collapse decimation through the mesh data instead of selecting the mesh and applying the modifier.
+    # The mesh must not have shape keys. Returns the new tris count
+    mod = mesh.modifiers.new("Decimate", 'DECIMATE')
+    mod.ratio = min(max(ratio, 0), 1)
+    mod.use_collapse_triangulate = True
+    tools.common.apply_modifier(mesh, mod)
+    return len(mesh.data.polygons)
+
+
+def decimate_with_shape_keys(mesh, ratio):
+    # Decimates the mesh while keeping all of its shape keys. Returns the new tris count.
+    # Edges get collapsed by merging one vertex into a neighbor (half edge collapse), so every remaining vertex keeps
+    # its position, shape key positions and weights. The order of the collapses comes from a quadric error metric,
+    # plus the difference of the shape key offsets of both vertices for every shape key.
+    # Vertices on open edges, UV seams, sharp edges and material borders are never removed
+    bm = bmesh.new()
+    bm.from_mesh(mesh.data)
+    bmesh.ops.triangulate(bm, faces=[face for face in bm.faces if len(face.verts) > 3], quad_method=0, ngon_method=0)
+    bm.verts.ensure_lookup_table()
+
+    verts = list(bm.verts)
+    vertex_count = len(verts)
+    coords = np.array([vert.co for vert in verts], dtype=np.float64).reshape(-1, 3)
+
+    # Shape key offsets from the first key
+    offsets = []
+    key_blocks = mesh.data.shape_keys.key_blocks
+    basis_coords = np.empty(vertex_count * 3, dtype=np.float32)
+    key_blocks[0].data.foreach_get('co', basis_coords)
+    for key_block in key_blocks[1:]:
+        key_coords = np.empty(vertex_count * 3, dtype=np.float32)
+        key_block.data.foreach_get('co', key_coords)
+        offset = (key_coords - basis_coords).reshape(-1, 3)
+        if offset.any():
+            offsets.append(offset)
+
+    locked = np.array([is_locked_vertex(bm, vert) for vert in verts], dtype=bool)
+    vert_index = {vert: index for index, vert in enumerate(verts)}
+
+    faces = np.array([[vert_index[vert] for vert in face.verts] for face in bm.faces], dtype=np.int64).reshape(-1, 3)
+    quadrics = get_vertex_quadrics(coords, faces, vertex_count)
+
+    target = int(ratio * len(faces))
+    while len(bm.faces) > target:
+        # Every half edge a -> b of a face is a collapse candidate
+        half_edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+        half_edges = half_edges[~locked[half_edges[:, 0]]]
+        if len(half_edges) == 0:
+            break
+        half_edges = np.unique(half_edges[:, 0] * vertex_count + half_edges[:, 1])
+        a = half_edges // vertex_count
+        b = half_edges % vertex_count
+
+        # Error of moving vertex a to b: the quadrics of both at position b and the change of all shape key offsets
+        position = np.column_stack((coords[b], np.ones(len(b))))
+        costs = np.einsum('ei,eij,ej->e', position, quadrics[a] + quadrics[b], position)
+        for offset in offsets:
+            costs += ((offset[a] - offset[b]) ** 2).sum(axis=1)
+
+        # Collapse the cheapest candidates that don't share any faces with each other
+        needed = (len(bm.faces) - target + 1) // 2
+        touched = np.zeros(vertex_count, dtype=bool)
+        targetmap = {}
+        remap = np.arange(vertex_count)
+        for index in np.argsort(costs, kind='mergesort'):
+            vert_a = int(a[index])
+            vert_b = int(b[index])
+            if touched[vert_a] or touched[vert_b]:
+                continue
+            if not can_collapse(verts[vert_a], verts[vert_b]):
+                continue
+
+            touched[vert_a] = True
+            touched[vert_b] = True
+            for edge in verts[vert_a].link_edges:
+                touched[vert_index[edge.other_vert(verts[vert_a])]] = True
+
+            targetmap[verts[vert_a]] = verts[vert_b]
+            remap[vert_a] = vert_b
+            quadrics[vert_b] += quadrics[vert_a]
+            if len(targetmap) >= needed:
+                break
+
+        if not targetmap:
+            break
 
+        # The corners of the remaining faces around a get the UVs and colors of b
+        for vert_a, vert_b in targetmap.items():
+            copy_loop_data(bm, vert_a, vert_b)
+            del vert_index[vert_a]
 
+        bmesh.ops.weld_verts(bm, targetmap=targetmap)
 
+        # Apply the same collapses to the face array: a becomes b and the faces which contained both are gone
+        faces = remap[faces]
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
 
+    bm.to_mesh(mesh.data)
+    bm.free()
+    mesh.data.update()
+
+    return len(mesh.data.polygons)
+
+
+def get_vertex_quadrics(coords, faces, vertex_count):
+    # Sum of the area weighted plane quadrics of all faces around each vertex
+    normals = np.cross(coords[faces[:, 1]] - coords[faces[:, 0]], coords[faces[:, 2]] - coords[faces[:, 0]])
+    areas = np.linalg.norm(normals, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normals /= areas[:, None]
+    normals[areas == 0] = 0
+
+    planes = np.column_stack((normals, -(normals * coords[faces[:, 0]]).sum(axis=1)))
+    face_quadrics = (planes[:, :, None] * planes[:, None, :] * (areas / 2)[:, None, None]).reshape(-1, 16)
+
+    quadrics = np.empty((vertex_count, 16))
+    corners = faces.ravel()
+    for i in range(16):
+        quadrics[:, i] = np.bincount(corners, weights=np.repeat(face_quadrics[:, i], 3), minlength=vertex_count)
+    return quadrics.reshape(-1, 4, 4)
+
+
+def is_locked_vertex(bm, vert):
+    if not vert.link_faces or vert.is_boundary or not vert.is_manifold:
+        return True
+
+    for edge in vert.link_edges:
+        if edge.seam or not edge.smooth:
+            return True
+
+    if len({face.material_index for face in vert.link_faces}) > 1:
+        return True
+
+    # Vertices with different UVs or colors per face lie on a seam
+    for layer in list(bm.loops.layers.uv.values()) + list(bm.loops.layers.color.values()):
+        first = None
+        for loop in vert.link_loops:
+            value = tuple(loop[layer].uv) if hasattr(loop[layer], 'uv') else tuple(loop[layer])
+            if first is None:
+                first = value
+            elif value != first:
+                return True
+    return False
+
+
+def can_collapse(vert_a, vert_b):
+    # Collapsing a into b must keep the mesh manifold: both may only share the two vertices across their edge
+    neighbors_a = {edge.other_vert(vert_a) for edge in vert_a.link_edges}
+    neighbors_b = {edge.other_vert(vert_b) for edge in vert_b.link_edges}
+    if len(neighbors_a & neighbors_b) != 2:
+        return False
+
+    # The remaining faces around a must not flip or collapse when a moves to b
+    for face in vert_a.link_faces:
+        if vert_b in face.verts:
+            continue
+        old = [vert.co for vert in face.verts]
+        new = [vert_b.co if vert == vert_a else vert.co for vert in face.verts]
+        old_normal = (old[1] - old[0]).cross(old[2] - old[0])
+        new_normal = (new[1] - new[0]).cross(new[2] - new[0])
+        if new_normal.length == 0 or old_normal.length == 0:
+            return False
+        if old_normal.normalized().dot(new_normal.normalized()) < 0.2:
+            return False
+    return True
+
+
+def copy_loop_data(bm, vert_a, vert_b):
+    layers = list(bm.loops.layers.uv.values()) + list(bm.loops.layers.color.values())
+    if not layers:
+        return
+
+    # Find the corner of b in one of the faces which get removed by the collapse
+    loop_b = None
+    for loop in vert_a.link_loops:
+        for face_loop in loop.face.loops:
+            if face_loop.vert == vert_b:
+                loop_b = face_loop
+                break
+        if loop_b:
+            break
+    if not loop_b:
+        return
+
+    for loop in vert_a.link_loops:
+        if vert_b in loop.face.verts:
+            continue
+        for layer in layers:
+            if hasattr(loop[layer], 'uv'):
+                loop[layer].uv = loop_b[layer].uv
+            else:
+                loop[layer] = loop_b[layer]
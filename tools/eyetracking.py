@@ -25,10 +25,10 @@
 # Edits by: GiveMeAllYourCats, Hotox
 
 import bpy
-import bmesh
 import math
 from collections import OrderedDict
 from random import random
+from mathutils import Vector
 
 import tools.common
 import tools.armature
@@ -200,6 +200,7 @@ class CreateEyesButton(bpy.types.Operator):
         tools.common.sort_shape_keys(mesh_name)
 
         # Reset the scenes in case they were changed
+        tools.common.invalidate_enums()
         context.scene.head = head.name
         context.scene.eye_left = old_eye_left.name
         context.scene.eye_right = old_eye_right.name
@@ -293,18 +294,11 @@ class CreateEyesButton(bpy.types.Operator):
 
 def vertex_group_exists(mesh_name, bone_name):
     mesh = bpy.data.objects[mesh_name]
-    data = mesh.data
-    verts = data.vertices
-
-    for vert in verts:
-        i = vert.index
-        try:
-            mesh.vertex_groups[bone_name].weight(i)
-            return True
-        except:
-            pass
+    group = mesh.vertex_groups.get(bone_name)
+    if group is None:
+        return False
 
-    return False
+    return tools.common.get_vertex_weights(mesh).member_counts[group.index] > 0
 
 
 # Repair vrc shape keys
@@ -317,10 +311,6 @@ def repair_shapekeys(mesh_name, vertex_group):
     tools.common.switch('EDIT')
     tools.common.switch('OBJECT')
 
-    bm = bmesh.new()
-    bm.from_mesh(mesh.data)
-    bm.verts.ensure_lookup_table()
-
     # Get a vertex from the eye vertex group # TODO https://i.imgur.com/tWi8lk6.png after many times resetting the eyes
     print('DEBUG: Group: ' + vertex_group)
     group = mesh.vertex_groups.get(vertex_group)
@@ -330,47 +320,42 @@ def repair_shapekeys(mesh_name, vertex_group):
         return
     print('DEBUG: Group: ' + vertex_group + ' found!')
 
-    vcoords = None
-    gi = group.index
-    for v in mesh.data.vertices:
-        for g in v.groups:
-            if g.group == gi:
-                vcoords = v.co.xyz
-
-    if not vcoords:
+    vertex_weights = tools.common.get_vertex_weights(mesh)
+    vertex_index = vertex_weights.last_vertex(group.index)
+    if vertex_index is None:
         return
 
+    # All vertices at the position of that vertex, found with the spatial index of the mesh
+    vertex_indices = vertex_weights.vertices_at(vertex_weights.coords[vertex_index].tolist())
+
     print('DEBUG: Repairing shapes!')
     # Move that vertex by a tiny amount
     moved = False
     i = 0
-    for key in bm.verts.layers.shape.keys():
-        if not key.startswith('vrc.'):
+    for shapekey in mesh.data.shape_keys.key_blocks:
+        if not shapekey.name.startswith('vrc.'):
             continue
-        print('DEBUG: Repairing shape: ' + key)
-        value = bm.verts.layers.shape.get(key)
-        for index, vert in enumerate(bm.verts):
-            if vert.co.xyz == vcoords:
-                if index < i:
-                    continue
-                shapekey = vert
-                shapekey_coords = mesh.matrix_world * shapekey[value]
-                shapekey_coords[0] -= 0.00007 * randBoolNumber()
-                shapekey_coords[1] -= 0.00007 * randBoolNumber()
-                shapekey_coords[2] -= 0.00007 * randBoolNumber()
-                shapekey[value] = mesh.matrix_world.inverted() * shapekey_coords
-                print('DEBUG: Repaired shape: ' + key)
-                i += 1
-                moved = True
-                break
-
-    bm.to_mesh(mesh.data)
+        print('DEBUG: Repairing shape: ' + shapekey.name)
+        candidates = vertex_indices[vertex_indices >= i]
+        if len(candidates) == 0:
+            continue
+        offset = Vector((randBoolNumber(), randBoolNumber(), randBoolNumber())) * -0.00007
+        move_shapekey_vertex(mesh, shapekey, int(candidates[0]), offset)
+        print('DEBUG: Repaired shape: ' + shapekey.name)
+        i += 1
+        moved = True
 
     if not moved:
         print('Error: Shapekey repairing failed for some reason! Using random shapekey method now.')
         repair_shapekeys_mouth(mesh_name)
 
 
+def move_shapekey_vertex(mesh, shapekey, index, offset):
+    # Moves the vertex of the shape key by the offset in world space
+    vertex = shapekey.data[index]
+    vertex.co = mesh.matrix_world.inverted() * (mesh.matrix_world * vertex.co + offset)
+
+
 def randBoolNumber():
     if random() < 0.5:
         return -1
@@ -387,28 +372,15 @@ def repair_shapekeys_mouth(mesh_name):  # TODO Add vertex repairing!
     tools.common.switch('EDIT')
     tools.common.switch('OBJECT')
 
-    bm = bmesh.new()
-    bm.from_mesh(mesh.data)
-    bm.verts.ensure_lookup_table()
-
     # Move that vertex by a tiny amount
     moved = False
-    for key in bm.verts.layers.shape.keys():
-        if not key.startswith('vrc'):
-            continue
-        value = bm.verts.layers.shape.get(key)
-        for vert in bm.verts:
-            shapekey = vert
-            shapekey_coords = mesh.matrix_world * shapekey[value]
-            shapekey_coords[0] -= 0.00007
-            shapekey_coords[1] -= 0.00007
-            shapekey_coords[2] -= 0.00007
-            shapekey[value] = mesh.matrix_world.inverted() * shapekey_coords
+    if len(mesh.data.vertices) > 0 and tools.common.has_shapekeys(mesh):
+        for shapekey in mesh.data.shape_keys.key_blocks:
+            if not shapekey.name.startswith('vrc'):
+                continue
+            move_shapekey_vertex(mesh, shapekey, 0, Vector((-0.00007, -0.00007, -0.00007)))
             print('TEST')
             moved = True
-            break
-
-    bm.to_mesh(mesh.data)
 
     if not moved:
         print('Error: Random shapekey repairing failed for some reason! Canceling!')
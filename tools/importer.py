@@ -25,6 +25,7 @@
 
 import os
 import bpy
+import numpy as np
 import webbrowser
 import tools.common
 import tools.eyetracking
@@ -421,6 +422,72 @@ class SourceToolsButton(bpy.types.Operator):
         return {'FINISHED'}
 
 
+# Export checks of the meshes, reused until the mesh or its materials change
+export_check_cache = tools.common.ObjectCache()
+
+
+class ExportCheck:
+    # Everything the export checks need to know about a mesh, read in one pass
+    def __init__(self, mesh):
+        data = mesh.data
+
+        # Polygons get triangulated on export
+        loop_totals = np.empty(len(data.polygons), dtype=np.int64)
+        data.polygons.foreach_get('loop_total', loop_totals)
+        self.tris = int(np.sum(np.maximum(loop_totals - 2, 1)))
+
+        # The image files can change without changing the mesh, so they are only checked on export
+        self.materials = []
+        self.image_paths = []
+        for mat_slot in mesh.material_slots:
+            if mat_slot and mat_slot.material and mat_slot.material.name not in self.materials:
+                self.materials.append(mat_slot.material.name)
+                self.image_paths.extend(path for path in get_image_paths(mat_slot.material) if path not in self.image_paths)
+
+        # Shape keys with coordinates far away from the model are broken
+        self.broken_shapes = []
+        self.protected = False
+        if tools.common.has_shapekeys(mesh):
+            coords = np.empty(len(data.vertices) * 3, dtype=np.float32)
+            for index, shapekey in enumerate(data.shape_keys.key_blocks):
+                if shapekey.name == 'Basis Original':
+                    self.protected = True
+                if index == 0:
+                    continue
+                shapekey.data.foreach_get('co', coords)
+                if np.any(np.abs(coords) > 10000):
+                    print(shapekey.name, np.abs(coords).max())
+                    self.broken_shapes.append(shapekey.name)
+
+
+def get_image_paths(material):
+    paths = []
+    for tex_slot in material.texture_slots:
+        if tex_slot and tex_slot.texture and getattr(tex_slot.texture, 'image', None):
+            paths.append(bpy.path.abspath(tex_slot.texture.image.filepath))
+    return paths
+
+
+def get_export_check(mesh):
+    materials = [mat_slot.material for mat_slot in mesh.material_slots if mat_slot and mat_slot.material]
+    signature = (mesh.as_pointer(), mesh.data.as_pointer(), len(mesh.data.vertices), len(mesh.data.polygons),
+                 tuple(shapekey.name for shapekey in mesh.data.shape_keys.key_blocks) if tools.common.has_shapekeys(mesh) else (),
+                 tuple(material.name for material in materials),
+                 tuple(path for material in materials for path in get_image_paths(material)))
+    check = export_check_cache.get(mesh, signature)
+    if check is None:
+        check = ExportCheck(mesh)
+        export_check_cache.set(mesh, signature, check)
+    return check
+
+
+def get_export_materials(checks):
+    materials = []
+    for check in checks:
+        materials.extend(name for name in check.materials if name not in materials)
+    return materials
+
+
 class ExportModel(bpy.types.Operator):
     bl_idname = 'importer.export_model'
     bl_label = 'Export Model'
@@ -436,63 +503,18 @@ class ExportModel(bpy.types.Operator):
     def execute(self, context):
         # Check for warnings
         print(self.action)
+        meshes = tools.common.get_meshes_objects()
+        checks = [get_export_check(mesh) for mesh in meshes]
         if not self.action == 'NO_CHECK':
-            mat_list = []
-            meshes = tools.common.get_meshes_objects()
-
-            if len(meshes) > 10:
-                bpy.ops.display.error('INVOKE_DEFAULT')
-                return {'FINISHED'}
-
-            for mesh in meshes:
-                if len(mesh.data.polygons) >= 65535:
-                    bpy.ops.display.error('INVOKE_DEFAULT')
-                    return {'FINISHED'}
-                for mat_slot in mesh.material_slots:
-                    if mat_slot and mat_slot.material and mat_slot.material.name not in mat_list:
-                        mat_list.append(mat_slot.material.name)
-
-                if tools.common.has_shapekeys(mesh):
-                    for i, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-                        if i == 0:
-                            continue
-                        for i2, vert in enumerate(shapekey.data):
-                            for coord in vert.co:
-                                if coord > 10000:
-                                    bpy.ops.display.error('INVOKE_DEFAULT')
-                                    return {'FINISHED'}
-                            if i2 >= 4:
-                                break
-
-            if len(mat_list) > 10:
+            if len(meshes) > 10 \
+                    or any(check.tris >= 65535 or check.broken_shapes for check in checks) \
+                    or len(get_export_materials(checks)) > 10:
                 bpy.ops.display.error('INVOKE_DEFAULT')
                 return {'FINISHED'}
 
         # Open export window
-        protected_export = False
-        for mesh in tools.common.get_meshes_objects():
-            if protected_export:
-                break
-            if tools.common.has_shapekeys(mesh):
-                for shapekey in mesh.data.shape_keys.key_blocks:
-                    if shapekey.name == 'Basis Original':
-                        protected_export = True
-                        break
-
-        textures_found = False
-        for mesh in tools.common.get_meshes_objects():
-            if textures_found:
-                break
-            for mat_slot in mesh.material_slots:
-                if textures_found:
-                    break
-                if mat_slot and mat_slot.material:
-                    for tex_slot in mat_slot.material.texture_slots:
-                        if tex_slot and tex_slot.texture:
-                            tex_path = bpy.path.abspath(tex_slot.texture.image.filepath)
-                            if os.path.isfile(tex_path):
-                                textures_found = True
-                                break
+        protected_export = any(check.protected for check in checks)
+        textures_found = any(os.path.isfile(path) for check in checks for path in check.image_paths)
 
         try:
             if protected_export:
@@ -534,31 +556,15 @@ class ErrorDisplay(bpy.types.Operator):
 
     def invoke(self, context, event):
         self.meshes_too_big = {}
-        self.mat_list = []
-        self.meshes_count = 0
         self.broken_shapes = []
-        for mesh in tools.common.get_meshes_objects():
-            tris = len(mesh.data.polygons)
-            if tris >= 65535:
-                self.meshes_too_big[mesh.name] = tris
-            for mat_slot in mesh.material_slots:
-                if mat_slot and mat_slot.material and mat_slot.material.name not in self.mat_list:
-                    self.mat_list.append(mat_slot.material.name)
-            self.meshes_count += 1
-
-            if tools.common.has_shapekeys(mesh):
-                for i, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-                    if i == 0:
-                        continue
-                    for i2, vert in enumerate(shapekey.data):
-                        for coord in vert.co:
-                            if coord > 10000:
-                                print(shapekey.name, coord)
-                                self.broken_shapes.append(shapekey.name)
-                                i2 = 10
-                                break
-                        if i2 >= 4:
-                            break
+        meshes = tools.common.get_meshes_objects()
+        checks = [get_export_check(mesh) for mesh in meshes]
+        for mesh, check in zip(meshes, checks):
+            if check.tris >= 65535:
+                self.meshes_too_big[mesh.name] = check.tris
+            self.broken_shapes.extend(check.broken_shapes)
+        self.mat_list = get_export_materials(checks)
+        self.meshes_count = len(meshes)
 
         dpi_value = bpy.context.user_preferences.system.dpi
         return context.window_manager.invoke_props_dialog(self, width=dpi_value * 6.1, height=-550)
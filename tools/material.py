@@ -29,6 +29,7 @@
 
 import bpy
 import tools.common
+from mmd_tools_local.core.material import texture_registry
 
 
 class OneTexPerMatButton(bpy.types.Operator):
@@ -203,7 +204,8 @@ class CombineMaterialsButton(bpy.types.Operator):
                         if mtex_slot:
                             if mat_slot.material.use_textures[tex_index]:
                                 if hasattr(mtex_slot.texture, 'image') and bpy.data.materials[mat_slot.name].use_textures[tex_index] and mtex_slot.texture.image:
-                                    hash_this += mtex_slot.texture.image.filepath   # Filepaths makes the hash unique
+                                    image_path = bpy.path.abspath(mtex_slot.texture.image.filepath)
+                                    hash_this += str(texture_registry.fileKey(image_path))  # Image files make the hash unique
                     hash_this += str(mat_slot.material.alpha)           # Alpha setting on material makes the hash unique
                     hash_this += str(mat_slot.material.specular_color)  # Specular color makes the hash unique
                     hash_this += str(mat_slot.material.diffuse_color)   # Diffuse color makes the hash unique
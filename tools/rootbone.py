@@ -29,6 +29,7 @@ import tools.common
 import globs
 
 from difflib import SequenceMatcher
+from collections import Counter, OrderedDict
 
 
 class RootButton(bpy.types.Operator):
@@ -68,81 +69,58 @@ class RootButton(bpy.types.Operator):
 
         # reset the root bone cache
         globs.root_bones_choices = {}
+        globs.root_bones_signature = None
 
         self.report({'INFO'}, 'Bones parented!')
 
         return{'FINISHED'}
 
 
+# Bones containing one of these are never used as the root of a group
+ignore_bone_names_with = [
+    'finger',
+    'chest',
+    'leg',
+    'arm',
+    'spine',
+    'shoulder',
+    'neck',
+    'knee',
+    'eye',
+    'toe',
+    'head',
+    'teeth',
+    'thumb',
+    'wrist',
+    'ankle',
+    'elbow',
+    'hips',
+    'twist',
+    'shadow',
+    'dummy',
+    'hand',
+    'waistcancel',
+    'root_'
+]
+
+# Minimum SequenceMatcher ratio for two bone names to be grouped together
+name_similarity = 0.70
+
+
 def get_parent_root_bones(self, context):
     armature = tools.common.get_armature()
-    check_these_bones = []
-    bone_groups = {}
     choices = []
 
     if armature is None:
         bpy.types.Object.Enum = choices
         return bpy.types.Object.Enum
-    armature = armature.data
 
-    # Get cache if exists
-    if len(globs.root_bones_choices) >= 1:
+    # Get cache if it is still valid
+    signature = (armature.as_pointer(), armature.data.as_pointer(), len(armature.data.bones), tools.common.enum_generation)
+    if globs.root_bones_signature == signature:
         return globs.root_bones_choices
 
-    for bone in armature.bones:
-        check_these_bones.append(bone.name)
-
-    ignore_bone_names_with = [
-        'finger',
-        'chest',
-        'leg',
-        'arm',
-        'spine',
-        'shoulder',
-        'neck',
-        'knee',
-        'eye',
-        'toe',
-        'head',
-        'teeth',
-        'thumb',
-        'wrist',
-        'ankle',
-        'elbow',
-        'hips',
-        'twist',
-        'shadow',
-        'dummy',
-        'hand',
-        'waistcancel',
-        'root_'
-    ]
-
-    # Find and group bones together that look alike
-    # Please do not ask how this works
-    for rootbone in armature.bones:
-        ignore = False
-        for ignore_bone_name in ignore_bone_names_with:
-            if ignore_bone_name in rootbone.name.lower():
-                ignore = True
-                break
-        if ignore:
-            continue
-        for bone in armature.bones:
-            if bone.name in check_these_bones:
-                m = SequenceMatcher(None, rootbone.name, bone.name)
-                if m.ratio() >= 0.70:
-                    accepted = False
-                    if bone.parent is not None:
-                        for child_bone in bone.parent.children:
-                            if child_bone.name == rootbone.name:
-                                accepted = True
-
-                    check_these_bones.remove(bone.name)
-                    if accepted:
-                        if rootbone.name not in bone_groups:
-                            bone_groups[rootbone.name] = []
-                        bone_groups[rootbone.name].append(bone.name)
+    bone_groups = group_similar_bones(armature.data)
 
     bone_groups_tmp = {}
     for rootbone in bone_groups:
@@ -156,10 +134,70 @@ def get_parent_root_bones(self, context):
     # set cache
     globs.root_bones = bone_groups_tmp
     globs.root_bones_choices = choices
+    globs.root_bones_signature = signature
 
     return bpy.types.Object.Enum
 
 
+def group_similar_bones(armature):
+    # Find and group bones together that look alike.
+    # Only siblings can end up in the same group, so the names are only compared within each set of siblings.
+    # Every root bone takes all similar siblings that are not taken yet, starting with the first bone
+    siblings = OrderedDict()
+    for bone in armature.bones:
+        if bone.parent is not None:
+            siblings.setdefault(bone.parent.name, []).append(bone.name)
+
+    bone_groups = OrderedDict()
+    for names in siblings.values():
+        if len(names) < 2:
+            continue
+
+        char_counts = {name: Counter(name) for name in names}
+        remaining = names
+        for rootname in names:
+            if is_ignored_root(rootname):
+                continue
+
+            group = []
+            rest = []
+            for name in remaining:
+                if is_similar(rootname, name, char_counts):
+                    group.append(name)
+                else:
+                    rest.append(name)
+            remaining = rest
+
+            if group:
+                bone_groups[rootname] = group
+            if not remaining:
+                break
+
+    # Keep the groups in bone order
+    bone_order = {bone.name: index for index, bone in enumerate(armature.bones)}
+    return OrderedDict(sorted(bone_groups.items(), key=lambda item: bone_order[item[0]]))
+
+
+def is_ignored_root(name):
+    name = name.lower()
+    for ignore_bone_name in ignore_bone_names_with:
+        if ignore_bone_name in name:
+            return True
+    return False
+
+
+def is_similar(name_a, name_b, char_counts):
+    # Check the cheap upper bounds of the ratio first, like SequenceMatcher.real_quick_ratio() and quick_ratio() do
+    length = len(name_a) + len(name_b)
+    if length == 0:
+        return True
+    if 2.0 * min(len(name_a), len(name_b)) / length < name_similarity:
+        return False
+    if 2.0 * sum((char_counts[name_a] & char_counts[name_b]).values()) / length < name_similarity:
+        return False
+    return SequenceMatcher(None, name_a, name_b).ratio() >= name_similarity
+
+
 class RefreshRootButton(bpy.types.Operator):
     bl_idname = 'refresh.root'
     bl_label = 'Refresh List'
@@ -171,6 +209,7 @@ class RefreshRootButton(bpy.types.Operator):
         print('')
         print(globs.root_bones)
         globs.root_bones_choices = {}
+        globs.root_bones_signature = None
 
         self.report({'INFO'}, 'Root bones refreshed, check the root bones list again.')
 
@@ -89,6 +89,7 @@ def reset_settings():
 
     settings_data['last_supporter_update'] = None
     settings_data['use_custom_mmd_tools'] = False
+    settings_data['supporter_etags'] = OrderedDict()
 
     save_settings()
 
@@ -96,6 +97,13 @@ def reset_settings():
     print('SETTINGS RESET')
 
 
+def get_settings():
+    # Loads the settings on first use
+    if settings_data is None:
+        load_settings()
+    return settings_data
+
+
 def start_apply_settings_timer():
     thread = Thread(target=apply_settings, args=[])
     thread.start()
@@ -103,28 +111,43 @@ def start_apply_settings_timer():
 
 def apply_settings():
     time.sleep(2)
-    bpy.context.scene.use_custom_mmd_tools = settings_data.get('use_custom_mmd_tools')
+    bpy.context.scene.use_custom_mmd_tools = get_settings().get('use_custom_mmd_tools')
 
 
 def settings_changed():
-    if settings_data.get('use_custom_mmd_tools') != settings_data_unchanged.get('use_custom_mmd_tools'):
+    if get_settings().get('use_custom_mmd_tools') != settings_data_unchanged.get('use_custom_mmd_tools'):
         return True
     return False
 
 
 def set_last_supporter_update(last_supporter_update):
-    settings_data['last_supporter_update'] = last_supporter_update
+    get_settings()['last_supporter_update'] = last_supporter_update
     save_settings()
 
 
 def get_last_supporter_update():
-    return settings_data.get('last_supporter_update')
+    return get_settings().get('last_supporter_update')
+
+
+def set_supporter_etag(url, etag):
+    etags = get_settings().get('supporter_etags')
+    if not etags:
+        etags = settings_data['supporter_etags'] = OrderedDict()
+    etags[url] = etag
+    save_settings()
+
+
+def get_supporter_etag(url):
+    etags = get_settings().get('supporter_etags')
+    if not etags:
+        return None
+    return etags.get(url)
 
 
 def set_use_custom_mmd_tools(self, context):
-    settings_data['use_custom_mmd_tools'] = bpy.context.scene.use_custom_mmd_tools
+    get_settings()['use_custom_mmd_tools'] = bpy.context.scene.use_custom_mmd_tools
     save_settings()
 
 
 def use_custom_mmd_tools(self, context):
-    return settings_data.get('use_custom_mmd_tools')
+    return get_settings().get('use_custom_mmd_tools')
@@ -25,6 +25,7 @@
 # Edits by:
 
 import bpy
+import numpy as np
 import tools.common
 
 
@@ -62,54 +63,18 @@ class ShapeKeyApplier(bpy.types.Operator):
                                           "If you didn't change the shape key order, you can revert the shape keys from top to bottom."])
             return {'FINISHED'}
 
-        # Set up shape keys
+        # Move every shape key onto the new basis directly in the shape key data
         mesh.show_only_shape_key = False
-        bpy.ops.object.shape_key_clear()
-        new_basis_shapekey.value = 1
-
-        # Find old basis and rename it
-        old_basis_shapekey = None
-        for index, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-            if index == 0:
-                shapekey.name = new_basis_shapekey_name + ' - Reverted'
-                shapekey.relative_key = new_basis_shapekey
-                old_basis_shapekey = shapekey
-                break
-
-        # Rename new basis after old basis was renamed
-        new_basis_shapekey.name = 'Basis'
+        old_basis_shapekey = mesh.data.shape_keys.key_blocks[0]
+        apply_shapekey_to_basis(mesh, new_basis_shapekey)
 
-        # Mix every shape keys with the new basis
-        for index in range(0, len(mesh.data.shape_keys.key_blocks)):
-            mesh.active_shape_key_index = index
-            shapekey = mesh.active_shape_key
-            if shapekey and shapekey.name != 'Basis' and ' - Reverted' not in shapekey.name:
-                shapekey.value = 1
-                mesh.shape_key_add(name=shapekey.name + '-New', from_mix=True)
-                shapekey.value = 0
-
-        # Remove all the unmixed shape keys except basis and the reverted ones
-        for index in reversed(range(0, len(mesh.data.shape_keys.key_blocks))):
-            mesh.active_shape_key_index = index
-            shapekey = mesh.active_shape_key
-            if shapekey and not shapekey.name.endswith('-New') and shapekey.name != 'Basis' and ' - Reverted' not in shapekey.name:
-                bpy.ops.object.shape_key_remove(all=False)
-
-        # Fix the names and the relative shape key
-        for index, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-            if shapekey and shapekey.name.endswith('-New'):
-                shapekey.name = shapekey.name[:-4]
-                shapekey.relative_key = new_basis_shapekey
+        # Rename the old basis and the new basis
+        old_basis_shapekey.name = new_basis_shapekey_name + ' - Reverted'
+        new_basis_shapekey.name = 'Basis'
 
         # Repair important shape key order
         tools.common.sort_shape_keys(mesh.name)
 
-        # Correctly apply the new basis as basis (important step, doesn't work otherwise)
-        tools.common.switch('EDIT')
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bpy.ops.mesh.remove_doubles(threshold=0)
-        tools.common.switch('OBJECT')
-
         # If a reversed shapekey was applied as basis, fix the name
         if ' - Reverted - Reverted' in old_basis_shapekey.name:
             old_basis_shapekey.name = old_basis_shapekey.name.replace(' - Reverted - Reverted', '')
@@ -119,6 +84,77 @@ class ShapeKeyApplier(bpy.types.Operator):
         return {'FINISHED'}
 
 
+def apply_shapekey_to_basis(mesh, new_basis_shapekey):
+    # Moves every shape key along with its relative key, so all keys keep their shape relative to each other.
+    # The old basis ends up as the reverted shape key and the keys are written one at a time to keep the memory low
+    key_blocks = mesh.data.shape_keys.key_blocks
+    old_basis_shapekey = key_blocks[0]
+    vertex_count = len(mesh.data.vertices)
+
+    coords = np.empty(vertex_count * 3, dtype=np.float32)
+    relative_coords = np.empty(vertex_count * 3, dtype=np.float32)
+    new_basis_shapekey.data.foreach_get('co', coords)
+    new_basis_shapekey.relative_key.data.foreach_get('co', relative_coords)
+    offset = (coords - relative_coords).reshape(-1, 3)
+
+    # Only the part of the shape key inside of its vertex group gets applied
+    if new_basis_shapekey.vertex_group and new_basis_shapekey.vertex_group in mesh.vertex_groups:
+        vertex_weights = tools.common.get_vertex_weights(mesh)
+        in_group = vertex_weights.group_indices == mesh.vertex_groups[new_basis_shapekey.vertex_group].index
+        weights = np.zeros(vertex_count, dtype=np.float32)
+        weights[vertex_weights.vertex_indices[in_group]] = vertex_weights.weights[in_group]
+        offset *= weights[:, None]
+    offset = offset.ravel()
+
+    # The new basis moves from its old position onto the old basis plus its offset
+    old_basis_coords = np.empty(vertex_count * 3, dtype=np.float32)
+    old_basis_shapekey.data.foreach_get('co', old_basis_coords)
+    new_basis_delta = old_basis_coords + offset - coords
+    no_delta = np.zeros(vertex_count * 3, dtype=np.float32)
+
+    # Every other key moves as much as its relative key, so it keeps its shape relative to that key.
+    # The reverted shape keys stay untouched, they describe the way back to their old basis
+    for index, shapekey in enumerate(key_blocks):
+        shapekey.value = 0
+        if shapekey == new_basis_shapekey:
+            coords = old_basis_coords + offset
+        elif index == 0 or ' - Reverted' in shapekey.name:
+            continue
+        else:
+            # Follow the relative keys until one of them is the old basis, the new basis or a reverted key
+            delta = offset
+            relative_key = shapekey
+            visited = set()
+            while relative_key.name not in visited:
+                visited.add(relative_key.name)
+                relative_key = relative_key.relative_key
+                if relative_key == old_basis_shapekey:
+                    delta = offset
+                    break
+                if relative_key == new_basis_shapekey:
+                    delta = new_basis_delta
+                    break
+                if ' - Reverted' in relative_key.name:
+                    delta = no_delta
+                    break
+
+            shapekey.data.foreach_get('co', coords)
+            coords += delta
+        shapekey.data.foreach_set('co', coords)
+
+    for shapekey in key_blocks:
+        if shapekey.relative_key == old_basis_shapekey and ' - Reverted' not in shapekey.name:
+            shapekey.relative_key = new_basis_shapekey
+
+    new_basis_shapekey.relative_key = new_basis_shapekey
+    old_basis_shapekey.relative_key = new_basis_shapekey
+
+    # The mesh itself has to match the new basis, otherwise the old basis shows up again in edit mode
+    new_basis_shapekey.data.foreach_get('co', coords)
+    mesh.data.vertices.foreach_set('co', coords)
+    mesh.data.update()
+
+
 def addToShapekeyMenu(self, context):
     self.layout.separator()
     self.layout.operator(ShapeKeyApplier.bl_idname, text="Apply Selected Shapekey as Basis", icon="KEY_HLT")
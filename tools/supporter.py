@@ -27,6 +27,7 @@
 import os
 import bpy
 import json
+import queue
 import shutil
 import pathlib
 import zipfile
@@ -37,6 +38,7 @@ import urllib.request
 import tools.settings
 from threading import Thread
 from datetime import datetime, timezone
+from bpy.app.handlers import persistent
 
 # global variables
 preview_collections = {}
@@ -44,10 +46,17 @@ supporter_data = None
 reloading = False
 button_list = []
 last_update = None
+last_commit_etag = None
+
+# Functions the download thread wants to have executed in the main thread, because they use bpy
+main_thread_queue = queue.Queue()
 
 time_format = "%Y-%m-%d %H:%M:%S"
 time_format_github = "%Y-%m-%dT%H:%M:%SZ"
 
+supporter_commit_url = "https://api.github.com/repos/Darkblader24/cats_supporter_list/commits/master"
+supporter_zip_url = "https://github.com/Darkblader24/cats_supporter_list/archive/master.zip"
+
 main_dir = pathlib.Path(os.path.dirname(__file__)).parent.resolve()
 resources_dir = os.path.join(str(main_dir), "resources")
 
@@ -73,12 +82,7 @@ class ReloadButton(bpy.types.Operator):
         return not reloading
 
     def execute(self, context):
-        global reloading
-        reloading = True
-
-        thread = Thread(target=download_file, args=[])
-        thread.start()
-
+        start_reloading(download_file)
         return {'FINISHED'}
 
 
@@ -142,6 +146,49 @@ def unregister_dynamic_buttons():
     button_list.clear()
 
 
+def start_reloading(target):
+    # Runs the target in a new thread. Everything it puts into the main thread queue
+    # is executed by the scene update handler until the reloading is finished
+    global reloading
+    if reloading:
+        return
+    reloading = True
+
+    if process_main_thread_queue not in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.append(process_main_thread_queue)
+
+    thread = Thread(target=target, args=[], daemon=True)
+    thread.start()
+
+
+@persistent
+def process_main_thread_queue(scene):
+    # The worker queues its last task before it clears the reloading flag,
+    # so the queue has to be drained again after the flag was read
+    finished = not reloading
+    while not main_thread_queue.empty():
+        main_thread_queue.get()()
+
+    if finished and main_thread_queue.empty() and process_main_thread_queue in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.remove(process_main_thread_queue)
+
+
+def open_url(url, use_etag=True):
+    # Returns None if the file didn't change since it got downloaded the last time
+    headers = {}
+    etag = tools.settings.get_supporter_etag(url)
+    if use_etag and etag:
+        headers['If-None-Match'] = etag
+
+    try:
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            print('NOT MODIFIED')
+            return None
+        raise
+
+
 def download_file():
     # Load all the directories and files
     downloads_dir = os.path.join(resources_dir, "downloads")
@@ -158,11 +205,18 @@ def download_file():
     # Create download folder
     pathlib.Path(downloads_dir).mkdir(exist_ok=True)
 
-    # Download zip
+    # Download zip, but only if it changed and the old files are still there
     print('DOWNLOAD FILE')
     try:
-        urllib.request.urlretrieve("https://github.com/Darkblader24/cats_supporter_list/archive/master.zip", supporter_zip_file)
-    except urllib.error.URLError:
+        response = open_url(supporter_zip_url, use_etag=os.path.isfile(supporter_list_file) and os.path.isdir(icons_supporter_dir))
+        if not response:
+            shutil.rmtree(downloads_dir)
+            finish_reloading()
+            return
+        with response, open(supporter_zip_file, 'wb') as out_file:
+            shutil.copyfileobj(response, out_file)
+            etag = response.headers.get('ETag')
+    except (urllib.error.URLError, OSError):
         print("FILE COULD NOT BE DOWNLOADED")
         shutil.rmtree(downloads_dir)
         finish_reloading()
@@ -178,12 +232,15 @@ def download_file():
 
     # Extract the downloaded zip
     print('EXTRACTING ZIP')
-    with zipfile.ZipFile(supporter_zip_file, "r") as zip_ref:
-        zip_ref.extractall(downloads_dir)
+    try:
+        with zipfile.ZipFile(supporter_zip_file, "r") as zip_ref:
+            zip_ref.extractall(downloads_dir)
+    except zipfile.BadZipFile:
+        print("ZIP BROKEN!")
     print('EXTRACTED')
 
     # If zip is not extracted, abort
-    if not os.path.isdir(extracted_zip_dir):
+    if not os.path.isfile(extracted_supporter_list_file) or not os.path.isdir(extracted_icons_dir):
         print("EXTRACTED ZIP FOLDER NOT FOUND!")
         shutil.rmtree(downloads_dir)
         finish_reloading()
@@ -198,17 +255,22 @@ def download_file():
         shutil.rmtree(icons_supporter_dir)
 
     # Move the extracted files to their correct places
+    pathlib.Path(icons_dir).mkdir(exist_ok=True)
     shutil.move(extracted_supporter_list_file, supporter_list_file)
-    shutil.move(extracted_icons_dir, icons_dir)
+    shutil.move(extracted_icons_dir, icons_supporter_dir)
 
     # Delete download folder
     shutil.rmtree(downloads_dir)
 
-    # Save update time in settings
-    tools.settings.set_last_supporter_update(last_update)
+    # Save update time and etag in settings
+    if last_update:
+        tools.settings.set_last_supporter_update(last_update)
+    tools.settings.set_supporter_etag(supporter_zip_url, etag)
+    if last_commit_etag:
+        tools.settings.set_supporter_etag(supporter_commit_url, last_commit_etag)
 
-    # Reload supporters
-    reload_supporters()
+    # Reload supporters in the main thread
+    main_thread_queue.put(reload_supporters)
 
 
 def readJson():
@@ -232,42 +294,29 @@ def readJson():
 
 
 def load_supporters():
-    # Check for update
-    global reloading
-    reloading = True
-    thread = Thread(target=check_for_update, args=[])
-    thread.start()
-
     # Read existing supporter list
     readJson()
 
     # Note that preview collections returned by bpy.utils.previews
     # are regular py objects - you can use them to store custom data.
-    pcoll = bpy.utils.previews.new()
-
-    # load the supporters and news icons
-    load_icons(pcoll)
-
+    # The icons get loaded into it when they are drawn for the first time
     if preview_collections.get('supporter_icons'):
         bpy.utils.previews.remove(preview_collections['supporter_icons'])
-    preview_collections['supporter_icons'] = pcoll
+    preview_collections['supporter_icons'] = bpy.utils.previews.new()
+
+    # Check for update
+    start_reloading(check_for_update)
 
 
 def reload_supporters():
     # Read the support file
     readJson()
 
-    # Get existing preview collection or create new one
+    # Remove the old icons, they get loaded again when they are drawn
     if preview_collections.get('supporter_icons'):
-        pcoll = preview_collections['supporter_icons']
+        preview_collections['supporter_icons'].clear()
     else:
-        pcoll = bpy.utils.previews.new()
-
-    # load the supporters and news icons
-    load_icons(pcoll)
-
-    if not preview_collections.get('supporter_icons'):
-        preview_collections['supporter_icons'] = pcoll
+        preview_collections['supporter_icons'] = bpy.utils.previews.new()
 
     unregister_dynamic_buttons()
     register_dynamic_buttons()
@@ -276,51 +325,29 @@ def reload_supporters():
     finish_reloading()
 
 
-def load_icons(pcoll):
-    # path to the folder where the icon is
-    # the path is calculated relative to this py file inside the addon folder
-    icons_dir = os.path.join(resources_dir, "icons")
-    icons_supporter_dir = os.path.join(icons_dir, "supporters")
-
-    if supporter_data:
-        for supporter in supporter_data['supporters']:
-            if supporter.get('disabled'):
-                continue
-
-            name = supporter['displayname']
-            iconname = supporter.get('iconname')
-
-            if not iconname:
-                iconname = name
-
-            if name in pcoll:
-                continue
-
-            try:
-                pcoll.load(name, os.path.join(icons_supporter_dir, iconname + '.png'), 'IMAGE')
-            except KeyError:
-                pass
+def get_supporter_icon(name, iconname=None):
+    # Loads the supporter or news icon the first time it gets drawn
+    pcoll = preview_collections.get('supporter_icons')
+    if pcoll is None:
+        return preview_collections['custom_icons']['empty'].icon_id
 
-        for news in supporter_data['news']:
-            custom_icon = news.get('custom_icon')
+    if name not in pcoll:
+        if not iconname:
+            iconname = name
+        icons_supporter_dir = os.path.join(resources_dir, "icons", "supporters")
+        pcoll.load(name, os.path.join(icons_supporter_dir, iconname + '.png'), 'IMAGE')
 
-            if news.get('disabled') or not news.get('info') or not custom_icon or custom_icon in pcoll:
-                continue
-
-            try:
-                pcoll.load(custom_icon, os.path.join(icons_supporter_dir, custom_icon + '.png'), 'IMAGE')
-            except KeyError:
-                pass
+    return pcoll[name].icon_id
 
 
 def finish_reloading():
+    # Refresh ui because of async running
+    main_thread_queue.put(ui_refresh)
+
     # Set running false
     global reloading
     reloading = False
 
-    # Refresh ui because of async running
-    ui_refresh()
-
 
 def load_other_icons():
     # Note that preview collections returned by bpy.utils.previews
@@ -370,9 +397,14 @@ def check_for_update():
 def update_needed():
     print('CHECK UPDATE')
     try:
-        with urllib.request.urlopen("https://api.github.com/repos/Darkblader24/cats_supporter_list/commits/master") as url:
-            data = json.loads(url.read().decode())
-    except urllib.error.URLError:
+        response = open_url(supporter_commit_url)
+        if not response:
+            return False
+        with response:
+            data = json.loads(response.read().decode())
+            global last_commit_etag
+            last_commit_etag = response.headers.get('ETag')
+    except (urllib.error.URLError, OSError, ValueError):
         print('URL ERROR')
         return False
 
@@ -395,6 +427,7 @@ def update_needed():
 
     if commit_date_str == last_update_str:
         print('COMMIT IDENTICAL')
+        tools.settings.set_supporter_etag(supporter_commit_url, last_commit_etag)
         return False
 
     utc_now = datetime.strptime(datetime.now(timezone.utc).strftime(time_format), time_format)
@@ -24,8 +24,8 @@
 # Repo: https://github.com/michaeldegroot/cats-blender-plugin
 # Edits by: GiveMeAllYourCats, Hotox
 import collections
-import copy
 import json
+import time
 import re
 import os
 import bpy
@@ -41,6 +41,7 @@ from collections import OrderedDict
 
 dictionary = None
 dictionary_google = None
+dict_found = False
 
 translation_splitter = "---"
 time_format = "%Y-%m-%d %H:%M:%S"
@@ -48,7 +49,10 @@ time_format = "%Y-%m-%d %H:%M:%S"
 main_dir = pathlib.Path(os.path.dirname(__file__)).parent.resolve()
 resources_dir = os.path.join(str(main_dir), "resources")
 dictionary_file = os.path.join(resources_dir, "dictionary.json")
-dictionary_google_file = os.path.join(resources_dir, "dictionary_google.json")
+dictionary_google_file = os.path.join(resources_dir, "dictionary_google.log")
+dictionary_google_file_legacy = os.path.join(resources_dir, "dictionary_google.json")
+
+google_dict_max_age = 30  # Days until a google translation gets translated again
 
 
 class TranslateShapekeyButton(bpy.types.Operator):
@@ -86,6 +90,7 @@ class TranslateShapekeyButton(bpy.types.Operator):
                         if translated:
                             i += 1
 
+        tools.common.invalidate_enums()
         self.report({'INFO'}, 'Translated ' + str(i) + ' shape keys.')
         return {'FINISHED'}
 
@@ -121,6 +126,7 @@ class TranslateBonesButton(bpy.types.Operator):
                 if translated:
                     count += 1
 
+        tools.common.invalidate_enums()
         self.report({'INFO'}, 'Translated ' + str(count) + ' bones.')
         return {'FINISHED'}
 
@@ -168,6 +174,7 @@ class TranslateObjectsButton(bpy.types.Operator):
                     if translated:
                         i += 1
 
+        tools.common.invalidate_enums()
         self.report({'INFO'}, 'Translated ' + str(i) + ' meshes and objects.')
         return {'FINISHED'}
 
@@ -279,9 +286,17 @@ class TranslateAllButton(bpy.types.Operator):
         return {'FINISHED'}
 
 
-# Loads the dictionaries at the start of blender
+# Only checks if the dictionary exists, so the panel can warn about it before it gets loaded on first use
+def check_dictionary_file():
+    global dict_found
+    if dictionary is None:
+        dict_found = os.path.isfile(dictionary_file)
+    return dict_found
+
+
+# Loads the dictionaries on first use
 def load_translations():
-    global dictionary
+    global dictionary, dict_found
     dictionary = OrderedDict()
     temp_dict = OrderedDict()
     dict_found = False
@@ -300,36 +315,16 @@ def load_translations():
         pass
 
     # Load local google dictionary and add it to the temp dict
-    try:
-        with open(dictionary_google_file, encoding="utf8") as file:
-            global dictionary_google
-            dictionary_google = json.load(file, object_pairs_hook=collections.OrderedDict)
-
-            if 'created' not in dictionary_google \
-                    or 'translations' not in dictionary_google \
-                    or 'translations_full' not in dictionary_google \
-                    or google_dict_too_old():
-                reset_google_dict()
-            else:
-                for name, trans in dictionary_google.get('translations').items():
-                    if not name:
-                        continue
-
-                    if name in temp_dict.keys():
-                        print(name, 'ALREADY IN INTERNAL DICT!')
-                        continue
+    load_google_dict()
+    for name, trans in dictionary_google.get('translations').items():
+        if not name:
+            continue
 
-                    temp_dict[name] = trans
+        if name in temp_dict:
+            print(name, 'ALREADY IN INTERNAL DICT!')
+            continue
 
-            print('GOOGLE DICTIONARY LOADED!')
-    except FileNotFoundError:
-        print('GOOGLE DICTIONARY NOT FOUND!')
-        reset_google_dict()
-        pass
-    except json.decoder.JSONDecodeError:
-        print("ERROR FOUND IN GOOOGLE DICTIONARY")
-        reset_google_dict()
-        pass
+        temp_dict[name] = trans
 
     # Sort temp dictionary by lenght and put it into the global dict
     for key in sorted(temp_dict, key=lambda k: len(k), reverse=True):
@@ -343,6 +338,9 @@ def load_translations():
 
 def update_dictionary(to_translate_list, translating_shapes=False):
     global dictionary, dictionary_google
+    if dictionary is None:
+        load_translations()
+
     regex = u'[\u3000-\u303f\u3040-\u309f\u30a0-\u30ff\uff00-\uff9f\u4e00-\u9faf\u3400-\u4dbf]+'  # Regex to look for japanese chars
 
     use_google_only = False
@@ -368,12 +366,7 @@ def update_dictionary(to_translate_list, translating_shapes=False):
             if not re.findall(regex, to_translate):
                 continue
 
-            translated = False
-            for key, value in dictionary_google.get('translations_full').items():
-                if to_translate == key and value:
-                    translated = True
-
-            if not translated:
+            if not dictionary_google.get('translations_full').get(to_translate) and to_translate not in google_input:
                 google_input.append(to_translate)
 
         # Translate with internal dictionary
@@ -412,26 +405,27 @@ def update_dictionary(to_translate_list, translating_shapes=False):
         return False
 
     # Update the dictionaries
+    new_entries = []
     for i, translation in enumerate(translations):
         name = google_input[i]
 
         if use_google_only:
             dictionary_google['translations_full'][name] = translation.text
+            new_entries.append(('translations_full', name, translation.text))
         else:
             translated_name = translation.text.capitalize()
             dictionary[name] = translated_name
             dictionary_google['translations'][name] = translated_name
+            new_entries.append(('translations', name, translated_name))
 
         print(google_input[i], translation.text.capitalize())
 
-    # Sort dictionary
-    temp_dict = copy.deepcopy(dictionary)
-    dictionary = OrderedDict()
-    for key in sorted(temp_dict, key=lambda k: len(k), reverse=True):
-        dictionary[key] = temp_dict[key]
+    # Sort dictionary. The old keys are already sorted, so this is close to linear
+    if not use_google_only:
+        dictionary = OrderedDict((key, dictionary[key]) for key in sorted(dictionary, key=lambda k: len(k), reverse=True))
 
-    # Save the google dict locally
-    save_google_dict()
+    # Only append the new translations to the local google dict
+    save_google_dict(new_entries)
 
     print('DICTIONARY UPDATE SUCCEEDED!')
     return True
@@ -439,6 +433,8 @@ def update_dictionary(to_translate_list, translating_shapes=False):
 
 def translate(to_translate, add_space=False, translating_shapes=False):
     global dictionary
+    if dictionary is None:
+        load_translations()
 
     pre_translation = to_translate
     length = len(to_translate)
@@ -459,9 +455,9 @@ def translate(to_translate, add_space=False, translating_shapes=False):
 
     # Translate shape keys with Google Translator only, if the user chose this
     if use_google_only:
-        for key, value in dictionary_google.get('translations_full').items():
-            if to_translate == key and value:
-                to_translate = value
+        value = dictionary_google.get('translations_full').get(to_translate)
+        if value:
+            to_translate = value
 
     # Translate with internal dictionary
     else:
@@ -492,38 +488,103 @@ def fix_jp_chars(name):
     return name
 
 
-def google_dict_too_old():
-    created = datetime.strptime(dictionary_google.get('created'), time_format)
-    utc_now = datetime.strptime(datetime.now(timezone.utc).strftime(time_format), time_format)
+# The google dictionary is stored as an append-only log. Every line is one json list:
+# [unix time of the translation, 'translations' or 'translations_full', name, translation]
+# Later lines overwrite earlier ones and entries expire individually after google_dict_max_age days.
+def load_google_dict():
+    global dictionary_google
+    dictionary_google = OrderedDict()
+    dictionary_google['translations'] = {}
+    dictionary_google['translations_full'] = {}
 
-    time_delta = abs((utc_now - created).days)
+    import_legacy_google_dict()
 
-    print('DAYS SINCE GOOGLE DICT CREATION:', time_delta)
+    now = time.time()
+    line_count = 0
+    entry_times = {}
 
-    if time_delta <= 30:
-        return False
+    try:
+        with open(dictionary_google_file, encoding="utf8") as file:
+            for line in file:
+                line_count += 1
+                try:
+                    created, dict_type, name, translation = json.loads(line)
+                    if dict_type not in dictionary_google or google_entry_too_old(created, now):
+                        continue
+                except (ValueError, TypeError):
+                    continue
 
-    print('DICT TOO OLD')
-    return True
+                dictionary_google[dict_type][name] = translation
+                entry_times[(dict_type, name)] = created
+        print('GOOGLE DICTIONARY LOADED!')
+    except FileNotFoundError:
+        print('GOOGLE DICTIONARY NOT FOUND!')
+        return
+
+    # Rewrite the log without expired, broken and overwritten entries once they take up most of it
+    if line_count - len(entry_times) > len(entry_times):
+        compact_google_dict(entry_times)
+
+
+def import_legacy_google_dict():
+    # Converts the old dictionary_google.json into the new log format
+    if not os.path.isfile(dictionary_google_file_legacy):
+        return
+
+    try:
+        with open(dictionary_google_file_legacy, encoding="utf8") as file:
+            legacy_dict = json.load(file)
+        created = int(datetime.strptime(legacy_dict.get('created'), time_format).replace(tzinfo=timezone.utc).timestamp())
+
+        entries = []
+        for dict_type in ['translations', 'translations_full']:
+            for name, translation in legacy_dict.get(dict_type, {}).items():
+                entries.append((dict_type, name, translation))
+        save_google_dict(entries, created=created)
+        print('GOOGLE DICT CONVERTED')
+    except (json.decoder.JSONDecodeError, ValueError, TypeError, AttributeError):
+        print("ERROR FOUND IN OLD GOOOGLE DICTIONARY")
+
+    os.remove(dictionary_google_file_legacy)
+
+
+def google_entry_too_old(created, now=None):
+    if now is None:
+        now = time.time()
+    return now - created > google_dict_max_age * 86400
+
+
+def compact_google_dict(entry_times):
+    temp_file = dictionary_google_file + '.tmp'
+    with open(temp_file, 'w', encoding="utf8") as outfile:
+        for (dict_type, name), created in entry_times.items():
+            outfile.write(json.dumps([created, dict_type, name, dictionary_google[dict_type][name]], ensure_ascii=False) + '\n')
+    os.replace(temp_file, dictionary_google_file)
+    print('GOOGLE DICT COMPACTED')
 
 
 def reset_google_dict():
     global dictionary_google
     dictionary_google = OrderedDict()
-
-    now_utc = datetime.now(timezone.utc).strftime(time_format)
-
-    dictionary_google['created'] = now_utc
     dictionary_google['translations'] = {}
     dictionary_google['translations_full'] = {}
 
-    save_google_dict()
+    if os.path.isfile(dictionary_google_file):
+        os.remove(dictionary_google_file)
     print('GOOGLE DICT RESET')
 
 
-def save_google_dict():
-    with open(dictionary_google_file, 'w', encoding="utf8") as outfile:
-        json.dump(dictionary_google, outfile, ensure_ascii=False, indent=4)
+def save_google_dict(entries, created=None):
+    # entries - List of (dict type, name, translation) tuples which get appended to the log
+    if not entries:
+        return
+
+    if created is None:
+        created = int(time.time())
+
+    with open(dictionary_google_file, 'a', encoding="utf8") as outfile:
+        for dict_type, name, translation in entries:
+            outfile.write(json.dumps([created, dict_type, name, translation], ensure_ascii=False) + '\n')
 
 
 # def cvs_to_json():
@@ -25,6 +25,7 @@
 # Edits by: GiveMeAllYourCats, Hotox
 
 import bpy
+import numpy as np
 import tools.common
 
 from collections import OrderedDict
@@ -64,18 +65,21 @@ class AutoVisemeButton(bpy.types.Operator):
             if shapekey.name == context.scene.mouth_a:
                 print(shapekey.name + " " + context.scene.mouth_a)
                 shapekey.name = shapekey.name + "_old"
+                tools.common.invalidate_enums()
                 context.scene.mouth_a = shapekey.name
                 renamed_shapes[0] = shapekey.name
             if shapekey.name == context.scene.mouth_o:
                 print(shapekey.name + " " + context.scene.mouth_a)
                 if context.scene.mouth_a != context.scene.mouth_o:
                     shapekey.name = shapekey.name + "_old"
+                    tools.common.invalidate_enums()
                 context.scene.mouth_o = shapekey.name
                 renamed_shapes[1] = shapekey.name
             if shapekey.name == context.scene.mouth_ch:
                 print(shapekey.name + " " + context.scene.mouth_a)
                 if context.scene.mouth_a != context.scene.mouth_ch and context.scene.mouth_o != context.scene.mouth_ch:
                     shapekey.name = shapekey.name + "_old"
+                    tools.common.invalidate_enums()
                 context.scene.mouth_ch = shapekey.name
                 renamed_shapes[2] = shapekey.name
             wm.progress_update(index)
@@ -177,10 +181,7 @@ class AutoVisemeButton(bpy.types.Operator):
         wm.progress_begin(0, total_fors)
 
         # Add the shape keys
-        for index, key in enumerate(shapekey_data):
-            obj = shapekey_data[key]
-            wm.progress_update(index)
-            self.mix_shapekey(context, renamed_shapes, obj['mix'], key, context.scene.shape_intensity)
+        self.mix_shapekeys(context, renamed_shapes, shapekey_data, context.scene.shape_intensity)
 
         # Rename shapes back
         if shapes[0] not in mesh.data.shape_keys.key_blocks:
@@ -205,6 +206,7 @@ class AutoVisemeButton(bpy.types.Operator):
             renamed_shapes[2] = shapes[2]
 
         # Reset context scenes
+        tools.common.invalidate_enums()
         try:
             context.scene.mouth_a = renamed_shapes[0]
         except TypeError:
@@ -239,42 +241,66 @@ class AutoVisemeButton(bpy.types.Operator):
 
         return {'FINISHED'}
 
-    def mix_shapekey(self, context, shapes, shapekey_data, rename_to, intensity):
+    def mix_shapekeys(self, context, shapes, shapekey_data, intensity):
+        # Every viseme is the basis plus the offsets of the source shape keys multiplied by their mix values.
+        # This gives the same result as setting the values and adding a shape key from the mix
+        wm = bpy.context.window_manager
         mesh = bpy.data.objects[context.scene.mesh_name_viseme]
+        key_blocks = mesh.data.shape_keys.key_blocks
+        vertex_count = len(mesh.data.vertices)
+
+        def get_coords(key_block):
+            coords = np.empty(vertex_count * 3, dtype=np.float32)
+            key_block.data.foreach_get('co', coords)
+            return coords.reshape(-1, 3).astype(np.float64)
+
+        basis = get_coords(key_blocks[0])
+
+        # Offsets of the source shape keys from their relative keys, read only once
+        offsets = {}
+        for name in set(shapes):
+            shapekey = key_blocks.get(name)
+            if not shapekey or shapekey.mute:
+                continue
+            offset = get_coords(shapekey) - get_coords(shapekey.relative_key)
+            if shapekey.vertex_group and shapekey.vertex_group in mesh.vertex_groups:
+                vertex_weights = tools.common.get_vertex_weights(mesh)
+                in_group = vertex_weights.group_indices == mesh.vertex_groups[shapekey.vertex_group].index
+                weights = np.zeros(vertex_count)
+                weights[vertex_weights.vertex_indices[in_group]] = vertex_weights.weights[in_group]
+                offset *= weights[:, None]
+            offsets[name] = (offset, shapekey.slider_min)
+
+        for index, (rename_to, data) in enumerate(shapekey_data.items()):
+            wm.progress_update(index)
 
-        # Remove existing shapekey
-        for index, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-            if shapekey.name == rename_to:
-                bpy.context.active_object.active_shape_key_index = index
-                bpy.ops.object.shape_key_remove()
-                break
-
-        # rename shapekey if it already exists and set value to 0
-        for shapekey in mesh.data.shape_keys.key_blocks:
-            shapekey.value = 0
+            # Remove existing shapekey
+            shapekey = key_blocks.get(rename_to)
+            if shapekey:
+                mesh.shape_key_remove(shapekey)
 
-        # Set the shape key values
-        for shapekey_data_context in shapekey_data:
-            selector = shapekey_data_context[0]
-            shapekey_value = shapekey_data_context[1]
+            # Like a slider, the last value set for a shape key counts. The slider maximum was raised to 10 for the mix
+            values = OrderedDict()
+            for selector, shapekey_value in data['mix']:
+                if selector in offsets:
+                    values[selector] = min(max(shapekey_value * intensity, offsets[selector][1]), 10)
 
-            for index, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-                if selector == shapekey.name:
-                    # mesh.active_shape_key_index = index
-                    shapekey.slider_max = 10
-                    shapekey.value = shapekey_value * intensity
+            coords = basis.copy()
+            for selector, value in values.items():
+                coords += offsets[selector][0] * value
 
-        # Create the new shape key
-        mesh.shape_key_add(name=rename_to, from_mix=True)
+            # Create the new shape key
+            shapekey = mesh.shape_key_add(name=rename_to, from_mix=False)
+            shapekey.data.foreach_set('co', coords.astype(np.float32).ravel())
 
-        # Reset all shape keys and sliders
-        bpy.ops.object.shape_key_clear()
-        for index, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-            if shapekey.name in shapes:
-                shapekey.slider_max = 1
+        # Reset all shape keys
+        for shapekey in key_blocks:
+            shapekey.value = 0
         mesh.active_shape_key_index = 0
+        mesh.data.update()
 
         # Reset context scenes
+        tools.common.invalidate_enums()
         context.scene.mouth_a = shapes[0]
         context.scene.mouth_o = shapes[1]
         context.scene.mouth_ch = shapes[2]